@@ -30,6 +30,9 @@ class OpenFrameEventBus(OpenFrame.OpenFrame):
         self.dataTable = OpenTable.OpenTable(self.container)
         self.dataTable.grid(row=1,column=0)
         
+        self.subscriberTable = OpenTable.OpenTable(self.container)
+        self.subscriberTable.grid(row=2,column=0)
+    
     #======================== public ==========================================
     
     def startAutoUpdate(self,updatePeriod):
@@ -46,6 +49,34 @@ class OpenFrameEventBus(OpenFrame.OpenFrame):
                                   'uri',
                                   'numIn',
                                   'numOut',
+                                  'queueDepth',
+                                  'numDropped',
+                                  'queueDelayP99',
+                                  'callbackTimeP99',
+                                  'callbackTimeMax',
+                              ])
+    
+    def updateSubscribers(self,newData):
+        '''
+        \brief Show the subscribers, the slowest first.
+        
+        \param newData The 'subscribers' of EventBus.getStatsSnapshot().
+        '''
+        rows = []
+        for (id,v) in newData.items():
+            row = dict(v)
+            row['id'] = id
+            rows.append(row)
+        rows.sort(key=lambda r: r['callTime'],reverse=True)
+        self.subscriberTable.update(rows,
+                              columnOrder = [
+                                  'id',
+                                  'uri',
+                                  'function',
+                                  'numCalls',
+                                  'numSlowCalls',
+                                  'callTime',
+                                  'maxCallTime',
                               ])
     
     #======================== private =========================================
@@ -53,15 +84,16 @@ class OpenFrameEventBus(OpenFrame.OpenFrame):
     def _cb_autoUpdate(self):
         
         self.update(json.loads(EventBus.EventBus().getStats()))
+        self.updateSubscribers(EventBus.EventBus().getStatsSnapshot()['subscribers'])
         
         if self.updatePeriod:
             self.after(self.updatePeriod,self._cb_autoUpdate)
-    
+
 ###############################################################################
 
 if __name__=='__main__':
     import OpenWindow
-
+    
     examplewindow      = OpenWindow.OpenWindow("OpenFrameEventBus")
     
     exampleframestate  = OpenFrameEventBus(examplewindow,
@@ -1,5 +1,3 @@
-import json
-
 import OpenFrame
 import OpenTable
 import OpenGuiLib
@@ -68,7 +66,7 @@ class OpenFrameState(OpenFrame.OpenFrame):
     
     def _cb_autoUpdate(self):
         
-        self.update(json.loads(self.updateFunc(*self.updateParams).toJson()))
+        self.update(self.updateFunc(*self.updateParams).toDict())
         
         if self.updatePeriod:
             self.after(self.updatePeriod,self._cb_autoUpdate)
@@ -1,16 +1,31 @@
+import json
+
 import web
 
+from EventBus import EventBus
+
 openWebApp_moteState_handlers = None
 
 class moteState(object):
     def GET(self,stateName):
         try:
-            jsonToReturn = openWebApp_moteState_handlers[0].getStateElem(stateName)
+            jsonToReturn = openWebApp_moteState_handlers[0].getStateElem(stateName).toJson(compact=True)
             web.header('Content-Type', 'text/json')
             return jsonToReturn
         except ValueError:
             raise web.notfound()
 
+class moteStateDeltas(object):
+    def GET(self,sinceVersion):
+        (version,deltas) = openWebApp_moteState_handlers[0].getDeltas(int(sinceVersion or 0))
+        web.header('Content-Type', 'text/json')
+        return json.dumps({'version': version, 'deltas': deltas},sort_keys=True,separators=(',',':'))
+
+class eventBusStats(object):
+    def GET(self):
+        web.header('Content-Type', 'text/json')
+        return json.dumps(EventBus.EventBus().getStatsSnapshot(),sort_keys=True,indent=4)
+
 class index(object):
     def GET(self):
         return "Hello, World!"
@@ -18,8 +33,10 @@ class index(object):
 class OpenWebApp(web.application):
     
     urls = (
-        '/',               'index',
-        '/moteState/(.*)', 'moteState',
+        '/',                       'index',
+        '/moteState/deltas/(\d*)', 'moteStateDeltas',
+        '/moteState/(.*)',         'moteState',
+        '/eventBus/stats',         'eventBusStats',
     )
     
     def __init__(self, moteState_handlers):
@@ -3,6 +3,8 @@ Created on 24/08/2012
 
 @author: xvilajosana
 '''
+import time
+
 class Event:
     '''
     \brief Representation of an event, in the event bus.
@@ -21,10 +23,11 @@ class Event:
         self._args                = args
         self._minNumReceivers     = minNumReceivers
         self._maxNumReceivers     = maxNumReceivers
-
+        self._publishTime         = time.time()
+    
     def get_uri(self):
         return self._uri
-
+    
     def get_args(self):
         return self._args
     
@@ -34,6 +37,12 @@ class Event:
     def get_maxNumReceivers(self):
         return self._maxNumReceivers
     
+    def get_publishTime(self):
+        return self._publishTime
+    
+    def set_publishTime(self,publishTime):
+        self._publishTime = publishTime
+    
     def __str__(self):
         returnVal  = []
         returnVal += ['uri={0}'.format(self._uri)]
@@ -14,11 +14,13 @@ log.addHandler(NullHandler())
 import sys
 import threading
 import time
-import copy
 import json
 
 import Subscription
+import SubscriptionIndex
 import Event
+import EventQueue
+import Histogram
 
 class EventBus(threading.Thread):
     '''
@@ -28,10 +30,40 @@ class EventBus(threading.Thread):
     lives in the system. This means that separate modules can instantiate this
     class independently and publish/subscribe to the result of that
     instantiation.
+    
+    The subscriptions are copied on write: subscribe() and unsubscribe()
+    replace the dictionary of subscriptions rather than modifying it, so
+    publishing iterates over a snapshot and calls the subscribers without
+    holding the lock. A slow subscriber hence only delays the publication it
+    is called from. The subscriptions are indexed by URI (see
+    SubscriptionIndex), the index being rebuilt with each copy.
+    
+    Events published asynchronously are dispatched by the eventBus thread,
+    or, after setNumWorkers(), by a pool of worker threads. Each URI is
+    always dispatched by the same worker, so the events of a URI are
+    delivered in the order they were published; events of different URIs
+    are delivered in parallel.
+    
+    The events published asynchronously wait in an EventQueue, unbounded by
+    default. setQueueLimit() bounds it, in total or per URI, and selects
+    what happens to the events published while it is full.
+    
+    For each URI, the time events wait in the queue and the time each
+    subscriber takes to handle them are recorded in histograms. Each
+    subscription counts its calls, and those slower than the slow call
+    threshold, which are also logged. getStatsSnapshot() reports it all.
     '''
     _instance      = None
     _init          = False
     
+    DFLT_NUM_WORKERS   = 0    ##< 0: asynchronous events are dispatched by the eventBus thread
+    DFLT_SLOW_CALL_THRESHOLD = 0.1 ##< duration of a call to a subscriber considered slow, in s
+    
+    POLICY_BLOCK       = EventQueue.EventQueue.POLICY_BLOCK
+    POLICY_DROP_OLDEST = EventQueue.EventQueue.POLICY_DROP_OLDEST
+    POLICY_DROP_NEWEST = EventQueue.EventQueue.POLICY_DROP_NEWEST
+    POLICY_COALESCE    = EventQueue.EventQueue.POLICY_COALESCE
+    
     def __new__(cls, *args, **kwargs):
         '''
         \brief Override creation of the object so it is create only once
@@ -62,16 +94,24 @@ class EventBus(threading.Thread):
         
         # local variables
         self._dataLock            = threading.Lock()
-        self._eventSem            = threading.Semaphore(0)
-        self._pending_events      = []      ##< list of pending events
-        self._subscriptions       = {}      ##< list of subscriptions
+        self._pending_events      = EventQueue.EventQueue() ##< pending events
+        self._busLane             = self._pending_events.newLanes(1)[0] ##< lane of the eventBus thread
+        self._subscriptions       = {}      ##< subscriptions, replaced (never modified) when changed
+        self._index               = SubscriptionIndex.SubscriptionIndex({}) ##< index of _subscriptions
+        self._workersLock         = threading.Lock()
+        self._workers             = []      ##< (thread,lane) of the workers
         self._next_id             = 1       ##< index of a new element in _subscriptions
         self._init                = True    ##< this object was initialized
-        self._stats               = {}
+        self._stats               = {}      ##< uri -> counters and histograms
+        self._slowCallThreshold   = self.DFLT_SLOW_CALL_THRESHOLD
+        
+        # the eventBus thread dispatches the events, until workers do
+        self._pending_events.setLanes([self._busLane])
+        self._pending_events.resume(self._busLane)
         
         # start asynchronous handling
         self.start()
-
+    
     def run(self): 
         # log
         log.debug("thread running")
@@ -79,30 +119,19 @@ class EventBus(threading.Thread):
         try:
             while True:
                 
-                # block until at least one event is in the pending events
-                self._eventSem.acquire()
-                
-                # pop the head event
-                try:
-                    self._dataLock.acquire()
-                    event = self._pending_events.pop(0)
-                finally:
-                    self._dataLock.release()
+                # block until an event is pending, and pop it
+                event = self._pending_events.get(self._busLane)
                 
                 if   isinstance(event,Event.Event):
                     # normal case
-                
+                    
                     # log
                     log.debug("popped event {0} ".format(event))
                     
                     # publish
-                    
-                    self.publish_sync(event.get_uri(),
-                                      *event.get_args(),
-                                      minNumReceivers=event.get_minNumReceivers(),
-                                      maxNumReceivers=event.get_maxNumReceivers())
-                    
-                elif (instance(event,str)) and (event=='close'):
+                    self._dispatch(event)
+                
+                elif (isinstance(event,str)) and (event=='close'):
                     # teardown case
                     
                     # log
@@ -155,15 +184,18 @@ class EventBus(threading.Thread):
         # get a unique ID for that subscriber
         id = self._getNextId()
         
-        # store subs
+        # store subs, in a new copy of the subscriptions
         try:
             self._dataLock.acquire()
-            self._subscriptions[id] = subs
+            subscriptions          = self._subscriptions.copy()
+            subscriptions[id]      = subs
+            self._subscriptions    = subscriptions
+            self._index            = SubscriptionIndex.SubscriptionIndex(subscriptions)
         finally:
             self._dataLock.release()
         
         return id
-
+    
     def unsubscribe(self, id):
         '''
         \brief Removes a subscriber from the event bus.
@@ -185,11 +217,14 @@ class EventBus(threading.Thread):
                 # log 
                 log.info("removed subscriber id {0}".format(id))
                 
-                # delete
-                del self._subscriptions[id]
-            
-                return True
+                # delete, in a new copy of the subscriptions
+                subscriptions       = self._subscriptions.copy()
+                del subscriptions[id]
+                self._subscriptions = subscriptions
+                self._index         = SubscriptionIndex.SubscriptionIndex(subscriptions)
                 
+                return True
+            
             else:
                 
                 # log 
@@ -205,11 +240,15 @@ class EventBus(threading.Thread):
         '''
         \brief Publish an event.
         
-        Publication is done asynchronously by the eventBus thread, i.e.
-        sometimes after this function is called.
+        Publication is done asynchronously by the eventBus thread, or by a
+        worker thread (see setNumWorkers()), i.e. sometimes after this
+        function is called.
         
         \param uri  The URI of the published event.
         \param args The arguments to pass to the callback function
+        
+        \returns False if the event was dropped because the queue is full
+                 (see setQueueLimit()), True otherwise.
         '''
         # log
         log.debug("publish uri={0} args={1} kwargs={2}".format(uri,args,kwargs))
@@ -222,12 +261,16 @@ class EventBus(threading.Thread):
         if 'maxNumReceivers' in kwargs:
             assert isinstance(kwargs['maxNumReceivers'],int)
         
-        try:
-            self._dataLock.acquire()
-            self._pending_events.append(Event.Event(uri, args))
-            self._eventSem.release()
-        finally:
-            self._dataLock.release()
+        event = Event.Event(
+            uri,
+            args,
+            minNumReceivers = kwargs.get('minNumReceivers'),
+            maxNumReceivers = kwargs.get('maxNumReceivers'),
+        )
+        
+        # the queue sends all the events of a URI to the same lane, to keep
+        # them in order
+        return self._pending_events.put(event)
     
     def publish_sync(self, uri, *args, **kwargs):
         '''
@@ -249,49 +292,107 @@ class EventBus(threading.Thread):
         if ('maxNumReceivers' in kwargs) and kwargs['maxNumReceivers']:
             assert isinstance(kwargs['maxNumReceivers'],int)
         
-        # update stats
-        try:
-            self._dataLock.acquire()
-            if uri not in self._stats:
-                self._stats[uri] = {
-                    'numIn':     0,
-                    'numOut':    0,
-                }
-            self._stats[uri]['numIn'] += 1
-        finally:
-            self._dataLock.release()
+        self._deliver(
+            uri,
+            args,
+            kwargs.get('minNumReceivers'),
+            kwargs.get('maxNumReceivers'),
+        )
+    
+    def setNumWorkers(self, numWorkers):
+        '''
+        \brief Set the number of worker threads dispatching the events
+               published asynchronously.
         
-        # local variables
-        self.numReceivers = 0
+        The events published from then on are queued for the new workers,
+        which only start once the workers in place have dispatched the events
+        they were given, so the events of a URI stay in order. Publishers are
+        not blocked meanwhile.
+        
+        \note Not to be called from a subscriber, as it waits for the
+              dispatching threads.
+        
+        \param numWorkers The number of workers, an int. 0 to have the
+                          eventBus thread dispatch the events.
+        '''
+        
+        # param validation
+        assert isinstance(numWorkers,int)
+        assert numWorkers>=0
+        
+        # log
+        log.info("setting number of workers to {0}".format(numWorkers))
         
-        # publish to subscribers
         try:
-            self._dataLock.acquire()
-            for (id,subs) in self._subscriptions.items():
-                if subs.matches_uri(uri):
-                    subs.get_function()(*args)
-                    self.numReceivers += 1
-            self._stats[uri]['numOut'] += self.numReceivers
+            self._workersLock.acquire()
+            
+            if not numWorkers and not self._workers:
+                return
+            
+            # queue the new events for the new dispatchers
+            if numWorkers:
+                newLanes = self._pending_events.newLanes(numWorkers)
+            else:
+                newLanes = [self._busLane]
+                self._pending_events.pause(self._busLane)
+            self._pending_events.setLanes(newLanes)
+            
+            # let the current dispatchers finish
+            if self._workers:
+                self._stopWorkers()
+            else:
+                self._pending_events.drain(self._busLane)
+            
+            # start the new dispatchers
+            if numWorkers:
+                for (i,lane) in enumerate(newLanes):
+                    thread = threading.Thread(
+                        target = self._runWorker,
+                        args   = (lane,),
+                        name   = 'eventBusWorker{0}'.format(i),
+                    )
+                    thread.daemon = True
+                    thread.start()
+                    self._workers += [(thread,lane)]
+                    self._pending_events.resume(lane)
+            else:
+                self._pending_events.resume(self._busLane)
         finally:
-            self._dataLock.release()
+            self._workersLock.release()
+    
+    def getNumWorkers(self):
+        try:
+            self._workersLock.acquire()
+            return len(self._workers)
+        finally:
+            self._workersLock.release()
+    
+    def setQueueLimit(self, maxNumEvents, policy=POLICY_DROP_OLDEST, uri=None):
+        '''
+        \brief Bound the number of events published asynchronously which are
+               waiting to be dispatched.
+        
+        \param maxNumEvents The maximum number of events waiting, None to
+                            remove the limit.
+        \param policy       What happens to an event published while the
+                            limit is reached:
+                            - POLICY_BLOCK: publish() waits until there is
+                              room. Not to be used for events published by
+                              subscribers, which would wait for themselves.
+                            - POLICY_DROP_OLDEST: the oldest event waiting
+                              is dropped.
+                            - POLICY_DROP_NEWEST: the new event is dropped.
+                            - POLICY_COALESCE: the new event replaces the
+                              latest one waiting with the same URI, or is
+                              dropped if there is none.
+        \param uri          The (exact) URI the limit applies to, None to
+                            limit the total number of events waiting.
+        '''
         
-        # ensure that number receivers is expected
-        if ('minNumReceivers' in kwargs) and kwargs['minNumReceivers']:
-            if self.numReceivers<kwargs['minNumReceivers']:
-                output =    'expected a least {0} receivers for event {1}, got {2}'.format(
-                                kwargs['minNumReceivers'],
-                                uri,
-                                self.numReceivers,
-                            )
-                raise SystemError(output)
-        if ('maxNumReceivers' in kwargs) and kwargs['maxNumReceivers']:
-            if self.numReceivers>kwargs['maxNumReceivers']:
-                raise SystemError('expected a most {0} receivers for event {1}, got {2}'.format(
-                                kwargs['maxNumReceivers'],
-                                uri,
-                                self.numReceivers,
-                            )
-                        )
+        # log
+        log.info("setting queue limit {0} ({1}) for uri={2}".format(maxNumEvents,policy,uri))
+        
+        self._pending_events.setLimit(maxNumEvents,policy,uri)
     
     def getSubscriptions(self):
         '''
@@ -321,19 +422,124 @@ class EventBus(threading.Thread):
             self._dataLock.release()
         return returnVal
     
-    def getStats(self):
+    def setSlowCallThreshold(self, threshold):
+        '''
+        \param threshold The duration from which a call to a subscriber is
+                         considered slow, in s.
+        '''
+        assert threshold>0
         try:
             self._dataLock.acquire()
-            tempStats = copy.deepcopy(self._stats)
+            self._slowCallThreshold = threshold
         finally:
             self._dataLock.release()
+    
+    def getStatsSnapshot(self):
+        '''
+        \brief Retrieve the statistics of the event bus.
+        
+        Only numbers are copied, the lock being held for the time it takes to
+        summarize the histograms.
         
+        \returns A dictionary:
+                 
+                 returnVal = {
+                    'uris': {
+                        'someURI': {
+                            'numIn':         events published,
+                            'numOut':        calls to subscribers,
+                            'queueDepth':    events waiting,
+                            'maxQueueDepth', 'numDropped', 'numCoalesced',
+                            'numBlocked':    see setQueueLimit(),
+                            'queueDelay':    summary of the time the events
+                                             waited in the queue,
+                            'callbackTime':  summary of the time the calls to
+                                             subscribers took,
+                        },
+                        etc.
+                    },
+                    'subscribers': {
+                        1: {
+                            'uri':           'someURI',
+                            'function':      name of the function,
+                            'numCalls', 'numSlowCalls',
+                            'callTime':      total time in the function,
+                            'maxCallTime':   longest call,
+                        },
+                        etc.
+                    },
+                    'queueDepth':        events waiting, in total,
+                    'numWorkers':        see setNumWorkers(),
+                    'slowCallThreshold': see setSlowCallThreshold(),
+                 }
+                 
+                 The summaries are as returned by Histogram.getSummary(),
+                 all durations are in s.
+        '''
+        
+        queueStats = self._pending_events.getStats()
+        
+        try:
+            self._dataLock.acquire()
+            uris = {}
+            for (uri,stats) in self._stats.items():
+                uris[uri] = {
+                    'numIn':         stats['numIn'],
+                    'numOut':        stats['numOut'],
+                    'queueDelay':    stats['queueDelay'].getSummary(),
+                    'callbackTime':  stats['callbackTime'].getSummary(),
+                }
+            subscribers = {}
+            for (id,subs) in self._subscriptions.items():
+                subscribers[id] = subs.get_call_stats()
+                subscribers[id]['uri']      = subs.get_event_uri()
+                subscribers[id]['function'] = self._functionName(subs.get_function())
+            slowCallThreshold = self._slowCallThreshold
+        finally:
+            self._dataLock.release()
+        
+        # events queued but not dispatched yet
+        emptySummary = Histogram.Histogram().getSummary()
+        for (uri,q) in queueStats.items():
+            if uri not in uris:
+                uris[uri] = {
+                    'numIn':         0,
+                    'numOut':        0,
+                    'queueDelay':    emptySummary,
+                    'callbackTime':  emptySummary,
+                }
+            uris[uri].update(q)
+        for v in uris.values():
+            for k in ['queueDepth','maxQueueDepth','numDropped','numCoalesced','numBlocked']:
+                v.setdefault(k,0)
+        
+        return {
+            'uris':              uris,
+            'subscribers':       subscribers,
+            'queueDepth':        self._pending_events.getDepth(),
+            'numWorkers':        self.getNumWorkers(),
+            'slowCallThreshold': slowCallThreshold,
+        }
+    
+    def getStats(self):
+        '''
+        \returns The statistics of each URI, as a JSON list, see
+                 getStatsSnapshot().
+        '''
         returnVal = []
-        for (k,v) in tempStats.items():
+        for (uri,v) in self.getStatsSnapshot()['uris'].items():
             returnVal.append({
-                'uri':       k,
-                'numIn':     v['numIn'],
-                'numOut':    v['numOut'],
+                'uri':              uri,
+                'numIn':            v['numIn'],
+                'numOut':           v['numOut'],
+                'queueDepth':       v['queueDepth'],
+                'maxQueueDepth':    v['maxQueueDepth'],
+                'numDropped':       v['numDropped'],
+                'numCoalesced':     v['numCoalesced'],
+                'numBlocked':       v['numBlocked'],
+                'queueDelayP99':    v['queueDelay']['p99'],
+                'callbackTimeP99':  v['callbackTime']['p99'],
+                'callbackTimeMax':  v['callbackTime']['max'],
             })
         return json.dumps(returnVal,sort_keys=True,indent=4)
     
@@ -347,11 +553,144 @@ class EventBus(threading.Thread):
         # log
         log.debug("closing...")
         
-        self._pending_events.append('close')
-        self._eventSem.release()
+        try:
+            self._workersLock.acquire()
+            self._stopWorkers()
+        finally:
+            self._workersLock.release()
+        
+        self._pending_events.close(self._busLane)
     
     #======================== private =========================================
     
+    def _dispatch(self, event):
+        self._deliver(event.get_uri(),
+                      event.get_args(),
+                      event.get_minNumReceivers(),
+                      event.get_maxNumReceivers(),
+                      queueDelay=time.time()-event.get_publishTime())
+    
+    def _deliver(self, uri, args, minNumReceivers, maxNumReceivers, queueDelay=None):
+        '''
+        \brief Call the subscribers of a URI, and account for it.
+        
+        \param queueDelay The time the event waited in the queue, in s, None
+                          if it was published synchronously.
+        '''
+        
+        # update stats
+        try:
+            self._dataLock.acquire()
+            stats = self._getUriStats(uri)
+            stats['numIn'] += 1
+            if queueDelay!=None:
+                stats['queueDelay'].record(queueDelay)
+        finally:
+            self._dataLock.release()
+        
+        # local variables
+        numReceivers = 0
+        callTimes    = []
+        
+        # publish to subscribers, on a snapshot of the subscriptions and
+        # without holding the lock
+        for subs in self._index.lookup(uri):
+            start = time.time()
+            subs.get_function()(*args)
+            callTimes.append((subs,time.time()-start))
+            numReceivers += 1
+        
+        # update stats
+        slowCalls = []
+        try:
+            self._dataLock.acquire()
+            stats['numOut'] += numReceivers
+            for (subs,duration) in callTimes:
+                slow = duration>=self._slowCallThreshold
+                stats['callbackTime'].record(duration)
+                subs.record_call(duration,slow)
+                if slow:
+                    slowCalls.append((subs,duration))
+        finally:
+            self._dataLock.release()
+        
+        for (subs,duration) in slowCalls:
+            log.warning("slow subscriber {0} for uri={1}: {2:.3f}s".format(
+                    self._functionName(subs.get_function()),
+                    uri,
+                    duration,
+                )
+            )
+        
+        # ensure that number receivers is expected
+        if minNumReceivers:
+            if numReceivers<minNumReceivers:
+                output =    'expected a least {0} receivers for event {1}, got {2}'.format(
+                                minNumReceivers,
+                                uri,
+                                numReceivers,
+                            )
+                raise SystemError(output)
+        if maxNumReceivers:
+            if numReceivers>maxNumReceivers:
+                raise SystemError('expected a most {0} receivers for event {1}, got {2}'.format(
+                                maxNumReceivers,
+                                uri,
+                                numReceivers,
+                            )
+                        )
+    
+    def _getUriStats(self, uri):
+        '''
+        \note Called with _dataLock held.
+        '''
+        stats = self._stats.get(uri)
+        if stats==None:
+            stats = {
+                'numIn':         0,
+                'numOut':        0,
+                'queueDelay':    Histogram.Histogram(),
+                'callbackTime':  Histogram.Histogram(),
+            }
+            self._stats[uri] = stats
+        return stats
+    
+    def _functionName(self, func):
+        if hasattr(func,'im_class'):
+            return '{0}.{1}'.format(func.im_class.__name__,func.__name__)
+        return getattr(func,'__name__',repr(func))
+    
+    def _runWorker(self, lane):
+        # log
+        log.debug("worker running")
+        
+        while True:
+            event = self._pending_events.get(lane)
+            
+            if event is EventQueue.EventQueue.CLOSE:
+                # log
+                log.debug("worker closed.")
+                return
+            
+            # a worker does not die because of a misbehaving subscriber, as
+            # the URIs it dispatches would stall
+            try:
+                self._dispatch(event)
+            except Exception as err:
+                log.critical("error dispatching event {0}: {1}".format(event,err))
+    
+    def _stopWorkers(self):
+        '''
+        \brief Stop the workers once they have dispatched their events.
+        
+        \note Called with _workersLock held.
+        '''
+        for (thread,lane) in self._workers:
+            self._pending_events.close(lane)
+        for (thread,lane) in self._workers:
+            thread.join()
+        self._workers = []
+    
     def _getNextId(self):
         assert self._next_id < sys.maxint
         
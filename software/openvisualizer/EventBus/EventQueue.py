@@ -0,0 +1,285 @@
+'''
+\brief Bounded queue of the events published asynchronously on the event bus.
+'''
+import threading
+import collections
+
+class EventQueueLane(object):
+    '''
+    \brief A FIFO of an EventQueue, consumed by a single thread.
+    '''
+    
+    def __init__(self, lock):
+        self.events               = collections.deque() ##< [seqNum,event] items
+        self.notEmpty             = threading.Condition(lock)
+        self.paused               = True    ##< the consumer does not get events
+        self.busy                 = False   ##< the consumer is handling an event
+
+class EventQueue(object):
+    '''
+    \brief Bounded queue of the events published asynchronously.
+    
+    The queue is made of lanes, each consumed by one thread. All the events
+    of a URI go to the same lane, so they are consumed in order. setLanes()
+    replaces the lanes events go to, e.g. when the number of consumers
+    changes.
+    
+    The number of events pending can be limited, in total and per URI (see
+    setLimit()). When a new event would exceed a limit, it is handled
+    according to the policy of that limit:
+    - POLICY_BLOCK: the publisher waits until there is room.
+    - POLICY_DROP_OLDEST: the oldest pending event (of the URI, for a URI
+      limit) is dropped, the new one queued.
+    - POLICY_DROP_NEWEST: the new event is dropped.
+    - POLICY_COALESCE: the arguments of the latest pending event of the same
+      URI are replaced by the new ones, for state-style events where only the
+      latest value matters. If there is none, the new event is dropped. The
+      event keeps its place in the queue, and the time it was published, so
+      its queue delay includes the time it already waited.
+    '''
+    
+    POLICY_BLOCK              = 'block'
+    POLICY_DROP_OLDEST        = 'dropOldest'
+    POLICY_DROP_NEWEST        = 'dropNewest'
+    POLICY_COALESCE           = 'coalesce'
+    POLICY_ALL                = [POLICY_BLOCK,
+                                 POLICY_DROP_OLDEST,
+                                 POLICY_DROP_NEWEST,
+                                 POLICY_COALESCE,]
+    
+    CLOSE                     = 'close' ##< returned by get() once the lane is closed
+    
+    def __init__(self):
+        
+        # local variables
+        self._lock                = threading.Lock()
+        self._notFull             = threading.Condition(self._lock)
+        self._idle                = threading.Condition(self._lock)
+        self._lanes               = []      ##< lanes new events go to
+        self._nextSeqNum          = 0
+        self._depth               = 0       ##< events pending, in all lanes
+        self._globalLimit         = None    ##< (maxDepth,policy), None if unbounded
+        self._uriLimits           = {}      ##< uri -> (maxDepth,policy)
+        self._uriDepth            = {}      ##< uri -> events pending
+        self._stats               = {}      ##< uri -> counters
+    
+    #======================== public ==========================================
+    
+    #===== configuration
+    
+    def newLanes(self, numLanes):
+        '''
+        \returns A list of numLanes new lanes, paused.
+        '''
+        return [EventQueueLane(self._lock) for _ in range(numLanes)]
+    
+    def setLanes(self, lanes):
+        '''
+        \brief Send the new events to these lanes.
+        '''
+        assert lanes
+        with self._lock:
+            self._lanes = list(lanes)
+            self._notFull.notify_all()
+    
+    def setLimit(self, maxDepth, policy=POLICY_DROP_OLDEST, uri=None):
+        '''
+        \param maxDepth The maximum number of events pending, None for no
+                        limit.
+        \param policy   One of POLICY_ALL, applied when the limit is reached.
+        \param uri      The URI the limit applies to, None to limit the
+                        events pending in total.
+        '''
+        assert maxDepth==None or (isinstance(maxDepth,int) and maxDepth>0)
+        assert policy in self.POLICY_ALL
+        with self._lock:
+            if   uri==None:
+                self._globalLimit = None if maxDepth==None else (maxDepth,policy)
+            elif maxDepth==None:
+                self._uriLimits.pop(uri,None)
+            else:
+                self._uriLimits[uri] = (maxDepth,policy)
+            self._notFull.notify_all()
+    
+    def getLimits(self):
+        '''
+        \returns A dictionary uri -> (maxDepth,policy); the global limit, if
+                 any, is indexed by None.
+        '''
+        with self._lock:
+            returnVal = dict(self._uriLimits)
+            if self._globalLimit:
+                returnVal[None] = self._globalLimit
+            return returnVal
+    
+    #===== producer
+    
+    def put(self, event):
+        '''
+        \brief Queue an event, applying the limits.
+        
+        \returns True if the event was queued (or coalesced), False if it was
+                 dropped.
+        '''
+        uri = event.get_uri()
+        with self._lock:
+            blocked = False
+            while True:
+                lane  = self._laneOf(uri)
+                
+                # find the limit reached, if any
+                limit = self._uriLimits.get(uri)
+                if limit and self._uriDepth.get(uri,0)>=limit[0]:
+                    limitUri = uri
+                elif self._globalLimit and self._depth>=self._globalLimit[0]:
+                    (limit,limitUri) = (self._globalLimit,None)
+                else:
+                    break
+                policy = limit[1]
+                
+                if   policy==self.POLICY_BLOCK:
+                    if not blocked:
+                        self._counters(uri)['numBlocked']   += 1
+                        blocked = True
+                    self._notFull.wait()
+                elif policy==self.POLICY_DROP_OLDEST:
+                    if not self._dropOldest(limitUri):
+                        self._counters(uri)['numDropped']   += 1
+                        return False
+                elif policy==self.POLICY_COALESCE:
+                    for item in reversed(lane.events):
+                        if item[1] is not self.CLOSE and item[1].get_uri()==uri:
+                            event.set_publishTime(item[1].get_publishTime())
+                            item[1] = event
+                            self._counters(uri)['numCoalesced'] += 1
+                            return True
+                    self._counters(uri)['numDropped']       += 1
+                    return False
+                else:
+                    self._counters(uri)['numDropped']       += 1
+                    return False
+            
+            # queue
+            lane.events.append([self._nextSeqNum,event])
+            self._nextSeqNum                   += 1
+            self._depth                        += 1
+            self._uriDepth[uri]                 = self._uriDepth.get(uri,0)+1
+            counters                            = self._counters(uri)
+            counters['maxQueueDepth']           = max(counters['maxQueueDepth'],self._uriDepth[uri])
+            lane.notEmpty.notify()
+            return True
+    
+    def close(self, lane):
+        '''
+        \brief Have the consumer of a lane get CLOSE once it has consumed the
+               events pending in it.
+        '''
+        with self._lock:
+            lane.events.append([None,self.CLOSE])
+            lane.notEmpty.notify()
+    
+    #===== consumer
+    
+    def get(self, lane):
+        '''
+        \brief Wait for the next event of a lane.
+        
+        \returns The event, or CLOSE.
+        '''
+        with self._lock:
+            if lane.busy:
+                lane.busy = False
+                self._idle.notify_all()
+            while lane.paused or not lane.events:
+                lane.notEmpty.wait()
+            (seqNum,event) = lane.events.popleft()
+            if event is self.CLOSE:
+                return event
+            self._dequeued(event.get_uri())
+            lane.busy = True
+            return event
+    
+    def pause(self, lane):
+        with self._lock:
+            lane.paused = True
+    
+    def resume(self, lane):
+        with self._lock:
+            lane.paused = False
+            lane.notEmpty.notify()
+    
+    def drain(self, lane):
+        '''
+        \brief Wait until the events of a lane are consumed, and the last one
+               handled.
+        '''
+        with self._lock:
+            while lane.events or lane.busy:
+                self._idle.wait()
+    
+    #===== stats
+    
+    def getDepth(self):
+        with self._lock:
+            return self._depth
+    
+    def getStats(self):
+        '''
+        \returns A dictionary uri -> {'queueDepth','maxQueueDepth',
+                 'numDropped','numCoalesced','numBlocked'}.
+        '''
+        with self._lock:
+            returnVal = {}
+            for (uri,counters) in self._stats.items():
+                returnVal[uri]               = dict(counters)
+                returnVal[uri]['queueDepth'] = self._uriDepth.get(uri,0)
+            return returnVal
+    
+    #======================== private =========================================
+    
+    def _laneOf(self, uri):
+        return self._lanes[hash(uri)%len(self._lanes)]
+    
+    def _counters(self, uri):
+        counters = self._stats.get(uri)
+        if counters==None:
+            counters = {
+                'maxQueueDepth':  0,
+                'numDropped':     0,
+                'numCoalesced':   0,
+                'numBlocked':     0,
+            }
+            self._stats[uri] = counters
+        return counters
+    
+    def _dropOldest(self, uri):
+        '''
+        \brief Drop the oldest event pending, of a URI or of any URI if uri
+               is None.
+        
+        \returns False if there was no such event.
+        '''
+        oldest = None
+        for lane in ([self._laneOf(uri)] if uri!=None else self._lanes):
+            for item in lane.events:
+                if item[1] is self.CLOSE:
+                    continue
+                if uri==None or item[1].get_uri()==uri:
+                    if oldest==None or item[0]<oldest[1][0]:
+                        oldest = (lane,item)
+                    break
+        if oldest==None:
+            return False
+        (lane,item) = oldest
+        lane.events.remove(item)
+        droppedUri  = item[1].get_uri()
+        self._dequeued(droppedUri)
+        self._counters(droppedUri)['numDropped'] += 1
+        return True
+    
+    def _dequeued(self, uri):
+        self._depth             -= 1
+        self._uriDepth[uri]     -= 1
+        if not self._uriDepth[uri]:
+            del self._uriDepth[uri]
+        self._notFull.notify_all()
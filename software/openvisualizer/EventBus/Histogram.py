@@ -0,0 +1,92 @@
+'''
+\brief Histogram of durations, with logarithmic buckets.
+'''
+
+class Histogram(object):
+    '''
+    \brief Histogram of durations, with logarithmic buckets (HDR-style).
+    
+    Durations are recorded in us. Below 2**SUB_BITS us, each us has its own
+    bucket; above, each power of 2 is split in 2**(SUB_BITS-1) linear
+    buckets. The relative error on a recorded value is hence at most
+    1/2**(SUB_BITS-1), whatever its magnitude, for a few hundred counters at
+    most. Minimum, maximum and mean are exact.
+    '''
+    
+    SUB_BITS            = 4
+    SUB_BUCKETS         = 1<<SUB_BITS
+    HALF_SUB_BUCKETS    = SUB_BUCKETS>>1
+    PERCENTILES         = [50,90,99,99.9]
+    
+    def __init__(self):
+        
+        # local variables
+        self.counts               = {}      ##< bucket index -> count
+        self.count                = 0
+        self.total                = 0.0     ##< sum of the durations, in s
+        self.min                  = None
+        self.max                  = None
+    
+    #======================== public ==========================================
+    
+    def record(self,duration):
+        '''
+        \param duration The duration, in s.
+        '''
+        index                     = self._index(max(0,int(duration*1000000)))
+        self.counts[index]        = self.counts.get(index,0)+1
+        self.count               += 1
+        self.total               += duration
+        if self.min==None or duration<self.min:
+            self.min              = duration
+        if self.max==None or duration>self.max:
+            self.max              = duration
+    
+    def getPercentile(self,percentile):
+        '''
+        \returns The duration, in s, below which percentile % of the recorded
+                 durations are, rounded up to the bucket, None if empty.
+        '''
+        if not self.count:
+            return None
+        threshold = self.count*percentile/100.0
+        seen      = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen>=threshold:
+                return min(self._highestValue(index)/1000000.0,self.max)
+        return self.max
+    
+    def getSummary(self):
+        '''
+        \returns A dictionary with the count, min, max and mean, and the
+                 PERCENTILES as 'p50', 'p90', 'p99', 'p99.9', in s.
+        '''
+        returnVal = {
+            'count':  self.count,
+            'min':    self.min,
+            'max':    self.max,
+            'mean':   self.total/self.count if self.count else None,
+        }
+        for p in self.PERCENTILES:
+            returnVal['p{0}'.format(p)] = self.getPercentile(p)
+        return returnVal
+    
+    #======================== private =========================================
+    
+    def _index(self,us):
+        if us<self.SUB_BUCKETS:
+            return us
+        shift    = us.bit_length()-self.SUB_BITS
+        mantissa = us>>shift                # in [HALF_SUB_BUCKETS,SUB_BUCKETS)
+        return self.SUB_BUCKETS+(shift-1)*self.HALF_SUB_BUCKETS+mantissa-self.HALF_SUB_BUCKETS
+    
+    def _highestValue(self,index):
+        '''
+        \returns The highest value, in us, falling in a bucket.
+        '''
+        if index<self.SUB_BUCKETS:
+            return index
+        shift    = (index-self.SUB_BUCKETS)/self.HALF_SUB_BUCKETS+1
+        mantissa = (index-self.SUB_BUCKETS)%self.HALF_SUB_BUCKETS+self.HALF_SUB_BUCKETS
+        return ((mantissa+1)<<shift)-1
@@ -10,8 +10,24 @@ class Subscription:
     \brief Representation of an Subscription, in the event bus.
     
     This object contains both the URI and the function to call.
+    
+    The URI is matched as a regular expression, at the start of the
+    published URI (re.match). So that the event bus does not need to run
+    every regular expression for every event, the URI is classified as:
+    - KIND_EXACT: a literal string followed by '$', which matches only that
+      string;
+    - KIND_PREFIX: a literal string, optionally followed by '.*', which
+      matches any URI starting with it. No URI is the empty prefix;
+    - KIND_REGEX: anything else.
+    The literal string is returned by get_literal().
     '''
     
+    KIND_EXACT     = 'exact'
+    KIND_PREFIX    = 'prefix'
+    KIND_REGEX     = 'regex'
+    
+    REGEX_SPECIAL  = '.^$*+?{}[]|()\\'
+    
     def  __init__(self, func, event_uri):
         '''
         \param func       The function to be called when the event is sent.
@@ -32,19 +48,97 @@ class Subscription:
         self._event_re       = None
         if event_uri:
             self._event_re   = re.compile(event_uri)
+        (self._kind,self._literal) = self._classify(event_uri)
+        self._numCalls       = 0
+        self._numSlowCalls   = 0
+        self._callTime       = 0.0  ##< time spent in func, in s
+        self._maxCallTime    = 0.0
     
     #======================== public ==========================================
     
     def get_function(self):
         return self._func
-
+    
     def get_event_uri(self):
         return self._event_uri
     
+    def record_call(self, duration, slow):
+        '''
+        \brief Account for a call to the function.
+        
+        \param duration How long the call took, in s.
+        \param slow     Whether the call is considered slow.
+        '''
+        self._numCalls      += 1
+        self._callTime      += duration
+        if duration>self._maxCallTime:
+            self._maxCallTime = duration
+        if slow:
+            self._numSlowCalls += 1
+    
+    def get_call_stats(self):
+        return {
+            'numCalls':      self._numCalls,
+            'numSlowCalls':  self._numSlowCalls,
+            'callTime':      self._callTime,
+            'maxCallTime':   self._maxCallTime,
+        }
+    
+    def get_kind(self):
+        return self._kind
+    
+    def get_literal(self):
+        return self._literal
+    
     def matches_uri(self, uri):
         assert uri
         assert isinstance(uri,str)
         
         if self._event_re is None:
             return True
-        return self._event_re.match(uri)
\ No newline at end of file
+        return self._event_re.match(uri)
+    
+    #======================== private =========================================
+    
+    def _classify(self, event_uri):
+        '''
+        \returns A (kind,literal) tuple, literal is None for KIND_REGEX.
+        '''
+        if not event_uri:
+            return (self.KIND_PREFIX,'')
+        
+        if   event_uri.endswith('$') and not event_uri.endswith('\\$'):
+            (kind,pattern) = (self.KIND_EXACT, event_uri[:-1])
+        elif event_uri.endswith('.*') and not event_uri.endswith('\\.*'):
+            (kind,pattern) = (self.KIND_PREFIX,event_uri[:-2])
+        else:
+            (kind,pattern) = (self.KIND_PREFIX,event_uri)
+        
+        literal = self._unescape(pattern)
+        if literal==None:
+            return (self.KIND_REGEX,None)
+        return (kind,literal)
+    
+    def _unescape(self, pattern):
+        '''
+        \returns The string pattern matches literally, None if it contains
+                 special characters.
+        '''
+        literal = []
+        escaped = False
+        for c in pattern:
+            if escaped:
+                # only escaped punctuation is literal, e.g. '\d' is not
+                if c.isalnum():
+                    return None
+                literal += [c]
+                escaped  = False
+            elif c=='\\':
+                escaped  = True
+            elif c in self.REGEX_SPECIAL:
+                return None
+            else:
+                literal += [c]
+        if escaped:
+            return None
+        return ''.join(literal)
\ No newline at end of file
@@ -0,0 +1,88 @@
+'''
+\brief Index of the subscriptions of the event bus, by URI.
+'''
+import Subscription
+
+class SubscriptionIndex:
+    '''
+    \brief Resolves the subscriptions matching a URI without matching every
+           subscription against it.
+    
+    Exact subscriptions are found in a dictionary, prefix subscriptions by
+    walking a trie along the URI, and only regular expression subscriptions
+    are matched one by one. The subscriptions resolved for a URI are cached.
+    
+    An index is never modified once built: the event bus builds a new one
+    when a subscription is added or removed, which also drops the cache.
+    '''
+    
+    MAX_CACHE_SIZE = 1024   ##< number of URIs cached, the cache is cleared when exceeded
+    
+    _SUBS          = None   ##< key of the subscriptions of a trie node
+    
+    def __init__(self, subscriptions):
+        '''
+        \param subscriptions A dictionary of subscriptions, indexed by their
+                             (increasing) ID.
+        '''
+        
+        # local variables
+        self._exact          = {}   ##< literal -> [(id,subs)]
+        self._prefixTrie     = {}   ##< char -> node, _SUBS -> [(id,subs)]
+        self._regex          = []   ##< [(id,subs)]
+        self._cache          = {}   ##< uri -> [subs]
+        
+        for (id,subs) in sorted(subscriptions.items()):
+            kind = subs.get_kind()
+            if   kind==Subscription.Subscription.KIND_EXACT:
+                self._exact.setdefault(subs.get_literal(),[]).append((id,subs))
+            elif kind==Subscription.Subscription.KIND_PREFIX:
+                node = self._prefixTrie
+                for c in subs.get_literal():
+                    node = node.setdefault(c,{})
+                node.setdefault(self._SUBS,[]).append((id,subs))
+            else:
+                self._regex.append((id,subs))
+    
+    #======================== public ==========================================
+    
+    def lookup(self, uri):
+        '''
+        \brief Retrieve the subscriptions matching a URI.
+        
+        \param uri The published URI.
+        
+        \returns The list of matching subscriptions, in the order they were
+                 made. The list must not be modified.
+        '''
+        returnVal = self._cache.get(uri)
+        if returnVal is None:
+            returnVal = self._resolve(uri)
+            if len(self._cache)>=self.MAX_CACHE_SIZE:
+                self._cache = {}
+            self._cache[uri] = returnVal
+        return returnVal
+    
+    #======================== private =========================================
+    
+    def _resolve(self, uri):
+        matches   = []
+        
+        # exact, '$' also matches before a trailing newline
+        matches  += self._exact.get(uri,[])
+        if uri.endswith('\n'):
+            matches += self._exact.get(uri[:-1],[])
+        
+        # prefix, walking the trie along the URI
+        node      = self._prefixTrie
+        matches  += node.get(self._SUBS,[])
+        for c in uri:
+            node  = node.get(c)
+            if node is None:
+                break
+            matches += node.get(self._SUBS,[])
+        
+        # regular expressions
+        matches  += [(id,subs) for (id,subs) in self._regex if subs.matches_uri(uri)]
+        
+        return [subs for (id,subs) in sorted(matches)]
@@ -6,12 +6,17 @@ sys.path.insert(0, os.path.join(sys.path[0], '..'))
 
 import time
 import pprint
+import threading
+import json
 import logging
 import logging.handlers
 
 import pytest
 
 import EventBus
+import Subscription
+import SubscriptionIndex
+import Histogram
 
 #============================ logging =========================================
 
@@ -74,6 +79,29 @@ class Subscriber(object):
 def prettyformat(dataToPrint):
     pp = pprint.PrettyPrinter(indent=4)
     return pp.pformat(dataToPrint)
+
+def waitFor(condition,timeout=10):
+    start = time.time()
+    while not condition():
+        assert time.time()-start<timeout
+        time.sleep(0.01)
+
+def closeGate():
+    '''
+    \brief Hold the eventBus thread in a subscriber, so the events published
+           asynchronously stay queued.
+    
+    \returns A (gate,id) tuple: set gate to let the eventBus thread go, and
+             unsubscribe id.
+    '''
+    gate = threading.Event()
+    id   = EventBus.EventBus().subscribe(lambda: gate.wait(),'gate$')
+    EventBus.EventBus().publish('gate')
+    waitFor(lambda: EventBus.EventBus()._pending_events.getDepth()==0)
+    return (gate,id)
+
+def queueStats(uri):
+    return [s for s in json.loads(EventBus.EventBus().getStats()) if s['uri']==uri][0]
     
 #============================ tests ===========================================
 
@@ -259,6 +287,450 @@ def test_unsubscription():
         'num':  [(1,2)],
     }
 
+#---- delivery outside the lock
+
+def test_slowSubscriber():
+    '''
+    \brief A subscriber blocked in its callback blocks neither publishers nor
+           subscriptions.
+    '''
+    
+    log.debug("\n\n----------test_slowSubscriber")
+    
+    release    = threading.Event()
+    received   = []
+    def _slow():
+        release.wait()
+    def _fast(data):
+        received.append(data)
+    
+    slowId     = EventBus.EventBus().subscribe(_slow,'slow')
+    fastId     = EventBus.EventBus().subscribe(_fast,'fast')
+    
+    publisher  = threading.Thread(target=EventBus.EventBus().publish_sync,args=('slow',))
+    publisher.daemon = True
+    publisher.start()
+    
+    # the slow subscriber is called, and does not return
+    time.sleep(0.1)
+    assert publisher.is_alive()
+    
+    EventBus.EventBus().publish_sync('fast','fastText')
+    otherId    = EventBus.EventBus().subscribe(_fast,'other')
+    assert received==['fastText']
+    
+    release.set()
+    publisher.join(1)
+    assert not publisher.is_alive()
+    
+    for id in [slowId,fastId,otherId]:
+        assert EventBus.EventBus().unsubscribe(id)
+
+#---- worker pool
+
+def test_workers_order():
+    '''
+    \brief With worker threads, events of a same URI are delivered in order.
+    '''
+    
+    log.debug("\n\n----------test_workers_order")
+    
+    NUM_URIS   = 10
+    NUM_EVENTS = 1000
+    
+    received   = []
+    def _record(uri,seqNum):
+        received.append((uri,seqNum))
+    
+    ids        = [
+        EventBus.EventBus().subscribe(
+            lambda seqNum,uri=uri: _record(uri,seqNum),
+            uri,
+        )
+        for uri in ['order{0}'.format(i) for i in range(NUM_URIS)]
+    ]
+    
+    EventBus.EventBus().setNumWorkers(4)
+    assert EventBus.EventBus().getNumWorkers()==4
+    
+    for seqNum in range(NUM_EVENTS):
+        EventBus.EventBus().publish('order{0}'.format(seqNum%NUM_URIS),seqNum)
+    
+    start = time.time()
+    while len(received)<NUM_EVENTS:
+        assert time.time()-start<10
+        time.sleep(0.01)
+    
+    for i in range(NUM_URIS):
+        uri = 'order{0}'.format(i)
+        assert [n for (u,n) in received if u==uri]==range(i,NUM_EVENTS,NUM_URIS)
+    
+    EventBus.EventBus().setNumWorkers(0)
+    assert EventBus.EventBus().getNumWorkers()==0
+    
+    for id in ids:
+        assert EventBus.EventBus().unsubscribe(id)
+
+#---- bounded queue
+
+def test_queue_dropNewest():
+    
+    log.debug("\n\n----------test_queue_dropNewest")
+    
+    received = []
+    id       = EventBus.EventBus().subscribe(received.append,'queue/newest')
+    EventBus.EventBus().setQueueLimit(3,EventBus.EventBus.POLICY_DROP_NEWEST)
+    
+    (gate,gateId) = closeGate()
+    accepted = [EventBus.EventBus().publish('queue/newest',i) for i in range(5)]
+    assert accepted==[True,True,True,False,False]
+    assert queueStats('queue/newest')['queueDepth']==3
+    gate.set()
+    
+    waitFor(lambda: len(received)==3)
+    assert received==[0,1,2]
+    stats = queueStats('queue/newest')
+    assert (stats['numDropped'],stats['maxQueueDepth'],stats['queueDepth'])==(2,3,0)
+    
+    EventBus.EventBus().setQueueLimit(None)
+    for i in [id,gateId]:
+        assert EventBus.EventBus().unsubscribe(i)
+
+def test_queue_dropOldest():
+    '''
+    \brief A URI limit drops the oldest events of that URI only.
+    '''
+    
+    log.debug("\n\n----------test_queue_dropOldest")
+    
+    received = []
+    ids      = [
+        EventBus.EventBus().subscribe(lambda i: received.append(('oldest',i)),'queue/oldest'),
+        EventBus.EventBus().subscribe(lambda i: received.append(('other',i)), 'queue/other'),
+    ]
+    EventBus.EventBus().setQueueLimit(2,EventBus.EventBus.POLICY_DROP_OLDEST,'queue/oldest')
+    
+    (gate,gateId) = closeGate()
+    for i in range(5):
+        assert EventBus.EventBus().publish('queue/oldest',i)
+        assert EventBus.EventBus().publish('queue/other',i)
+    gate.set()
+    
+    waitFor(lambda: len(received)==7)
+    assert [i for (u,i) in received if u=='oldest']==[3,4]
+    assert [i for (u,i) in received if u=='other']==range(5)
+    assert queueStats('queue/oldest')['numDropped']==3
+    assert queueStats('queue/other')['numDropped']==0
+    
+    EventBus.EventBus().setQueueLimit(None,uri='queue/oldest')
+    for i in ids+[gateId]:
+        assert EventBus.EventBus().unsubscribe(i)
+
+def test_queue_coalesce():
+    '''
+    \brief Only the latest value of a state-style event is delivered.
+    '''
+    
+    log.debug("\n\n----------test_queue_coalesce")
+    
+    received = []
+    id       = EventBus.EventBus().subscribe(received.append,'queue/state')
+    EventBus.EventBus().setQueueLimit(1,EventBus.EventBus.POLICY_COALESCE,'queue/state')
+    
+    (gate,gateId) = closeGate()
+    assert EventBus.EventBus().publish('queue/state',0)
+    time.sleep(0.1)
+    for i in range(1,10):
+        assert EventBus.EventBus().publish('queue/state',i)
+    gate.set()
+    
+    waitFor(lambda: received)
+    time.sleep(0.1)
+    assert received==[9]
+    assert queueStats('queue/state')['numCoalesced']==9
+    
+    # the queue delay counts from the first event coalesced
+    queueDelay = EventBus.EventBus().getStatsSnapshot()['uris']['queue/state']['queueDelay']
+    assert queueDelay['count']==1
+    assert queueDelay['max']>=0.1
+    
+    EventBus.EventBus().setQueueLimit(None,uri='queue/state')
+    for i in [id,gateId]:
+        assert EventBus.EventBus().unsubscribe(i)
+
+def test_queue_block():
+    '''
+    \brief With POLICY_BLOCK, the publisher waits for room, nothing is lost.
+    '''
+    
+    log.debug("\n\n----------test_queue_block")
+    
+    received  = []
+    id        = EventBus.EventBus().subscribe(received.append,'queue/block')
+    EventBus.EventBus().setQueueLimit(2,EventBus.EventBus.POLICY_BLOCK)
+    
+    (gate,gateId) = closeGate()
+    publisher = threading.Thread(
+        target = lambda: [EventBus.EventBus().publish('queue/block',i) for i in range(5)],
+    )
+    publisher.daemon = True
+    publisher.start()
+    
+    time.sleep(0.1)
+    assert publisher.is_alive()
+    assert EventBus.EventBus()._pending_events.getDepth()==2
+    gate.set()
+    
+    publisher.join(10)
+    waitFor(lambda: len(received)==5)
+    assert received==range(5)
+    assert queueStats('queue/block')['numBlocked']>=1
+    assert queueStats('queue/block')['numDropped']==0
+    
+    EventBus.EventBus().setQueueLimit(None)
+    for i in [id,gateId]:
+        assert EventBus.EventBus().unsubscribe(i)
+
+def test_queue_workers():
+    '''
+    \brief Limits also apply when workers dispatch the events.
+    '''
+    
+    log.debug("\n\n----------test_queue_workers")
+    
+    gate      = threading.Event()
+    received  = []
+    def _slow(i):
+        gate.wait()
+        received.append(i)
+    id        = EventBus.EventBus().subscribe(_slow,'queue/workers')
+    EventBus.EventBus().setNumWorkers(2)
+    EventBus.EventBus().setQueueLimit(1,EventBus.EventBus.POLICY_COALESCE,'queue/workers')
+    
+    EventBus.EventBus().publish('queue/workers',0)
+    waitFor(lambda: EventBus.EventBus()._pending_events.getDepth()==0)
+    for i in range(1,10):
+        EventBus.EventBus().publish('queue/workers',i)
+    gate.set()
+    
+    EventBus.EventBus().setNumWorkers(0)
+    assert received==[0,9]
+    
+    EventBus.EventBus().setQueueLimit(None,uri='queue/workers')
+    assert EventBus.EventBus().unsubscribe(id)
+
+#---- statistics
+
+def test_histogram():
+    
+    log.debug("\n\n----------test_histogram")
+    
+    histogram = Histogram.Histogram()
+    assert histogram.getSummary()['p50']==None
+    
+    values    = [i/1000000.0 for i in range(1,100001)]   # 1us to 100ms
+    for v in values:
+        histogram.record(v)
+    summary   = histogram.getSummary()
+    
+    assert summary['count']==len(values)
+    assert (summary['min'],summary['max'])==(values[0],values[-1])
+    for p in Histogram.Histogram.PERCENTILES:
+        exact = values[int(len(values)*p/100.0)-1]
+        assert exact<=summary['p{0}'.format(p)]<=exact*(1+1.0/Histogram.Histogram.HALF_SUB_BUCKETS)+1e-6
+    
+    # a few hundred buckets cover 1us to 100ms
+    assert len(histogram.counts)<200
+
+def test_stats_slowSubscriber():
+    '''
+    \brief The snapshot points at the subscriber slowing a URI down.
+    '''
+    
+    log.debug("\n\n----------test_stats_slowSubscriber")
+    
+    def _fast():
+        pass
+    def _slow():
+        time.sleep(0.06)
+    fastId = EventBus.EventBus().subscribe(_fast,'stats/slow')
+    slowId = EventBus.EventBus().subscribe(_slow,'stats/slow')
+    EventBus.EventBus().setSlowCallThreshold(0.05)
+    
+    EventBus.EventBus().publish_sync('stats/slow')
+    EventBus.EventBus().publish('stats/slow')
+    waitFor(lambda: EventBus.EventBus().getStatsSnapshot()['uris']['stats/slow']['numOut']==4)
+    
+    snapshot = EventBus.EventBus().getStatsSnapshot()
+    log.debug(prettyformat(snapshot))
+    
+    uriStats = snapshot['uris']['stats/slow']
+    assert uriStats['numIn']==2
+    assert uriStats['callbackTime']['count']==4
+    assert uriStats['callbackTime']['max']>=0.05
+    assert uriStats['queueDelay']['count']==1   # only the asynchronous one
+    
+    assert snapshot['subscribers'][slowId]['function']=='_slow'
+    assert snapshot['subscribers'][slowId]['numCalls']==2
+    assert snapshot['subscribers'][slowId]['numSlowCalls']==2
+    assert snapshot['subscribers'][fastId]['numSlowCalls']==0
+    assert snapshot['slowCallThreshold']==0.05
+    
+    # the snapshot is plain data
+    json.dumps(snapshot)
+    row = [r for r in json.loads(EventBus.EventBus().getStats()) if r['uri']=='stats/slow'][0]
+    assert row['callbackTimeMax']==uriStats['callbackTime']['max']
+    
+    EventBus.EventBus().setSlowCallThreshold(EventBus.EventBus.DFLT_SLOW_CALL_THRESHOLD)
+    for id in [fastId,slowId]:
+        assert EventBus.EventBus().unsubscribe(id)
+
+#---- subscription index
+
+def test_index_classify():
+    
+    log.debug("\n\n----------test_index_classify")
+    
+    for (uri,kind,literal) in [
+            (None,          Subscription.Subscription.KIND_PREFIX, ''),
+            ('text',        Subscription.Subscription.KIND_PREFIX, 'text'),
+            ('text.*',      Subscription.Subscription.KIND_PREFIX, 'text'),
+            ('.*',          Subscription.Subscription.KIND_PREFIX, ''),
+            ('text$',       Subscription.Subscription.KIND_EXACT,  'text'),
+            (r'a\.b$',      Subscription.Subscription.KIND_EXACT,  'a.b'),
+            (r'a\$',        Subscription.Subscription.KIND_PREFIX, 'a$'),
+            ('a.b',         Subscription.Subscription.KIND_REGEX,  None),
+            (r'a\d',        Subscription.Subscription.KIND_REGEX,  None),
+            (r'a\\$',       Subscription.Subscription.KIND_REGEX,  None),
+            ('(x|y)z',      Subscription.Subscription.KIND_REGEX,  None),
+        ]:
+        subs = Subscription.Subscription(lambda: None,uri)
+        assert (subs.get_kind(),subs.get_literal())==(kind,literal)
+
+def test_index_sameAsScan():
+    '''
+    \brief The index resolves the same subscriptions as matching each of them.
+    '''
+    
+    log.debug("\n\n----------test_index_sameAsScan")
+    
+    patterns      = [None,'text','text$','te','text.*','a.b',r'a\.b$',
+                     r'a\.b','(x|y)z','x','a$','','infoErrorCritical']
+    uris          = ['text','texts','tex','te','t','a.b','axb','a.bc','xz',
+                     'yz','x','a','a\n','text\n','infoErrorCritical']
+    subscriptions = dict([
+        (id,Subscription.Subscription(lambda: None,p))
+        for (id,p) in enumerate(patterns,1)
+    ])
+    index         = SubscriptionIndex.SubscriptionIndex(subscriptions)
+    
+    for uri in uris:
+        expected = [subs for (id,subs) in sorted(subscriptions.items()) if subs.matches_uri(uri)]
+        assert index.lookup(uri)==expected
+        assert index.lookup(uri)==expected  # cached
+
+#---- benchmark
+
+def test_benchmark_scaling():
+    '''
+    \brief Time to resolve the subscribers of an event, by scanning all
+           subscriptions or through the index, as subscriptions grow.
+    '''
+    
+    log.debug("\n\n----------test_benchmark_scaling")
+    
+    NUM_LOOKUPS   = 2000
+    
+    for numSubscriptions in [10,100,1000]:
+        
+        # mostly exact and prefix subscriptions, a few regular expressions
+        patterns      = []
+        for i in range(numSubscriptions):
+            if   i%10==0:
+                patterns += ['moteState/[0-9]+/{0}'.format(i)]
+            elif i%2==0:
+                patterns += ['moteState/{0}/status$'.format(i)]
+            else:
+                patterns += ['moteState/{0}/'.format(i)]
+        subscriptions = dict([
+            (id,Subscription.Subscription(lambda: None,p))
+            for (id,p) in enumerate(patterns,1)
+        ])
+        uris          = ['moteState/{0}/status'.format(i%numSubscriptions) for i in range(NUM_LOOKUPS)]
+        
+        start         = time.time()
+        for uri in uris:
+            scanned   = [subs for (id,subs) in sorted(subscriptions.items()) if subs.matches_uri(uri)]
+        scanRate      = NUM_LOOKUPS/(time.time()-start)
+        
+        index         = SubscriptionIndex.SubscriptionIndex(subscriptions)
+        start         = time.time()
+        for uri in uris:
+            indexed   = index.lookup(uri)
+        indexRate     = NUM_LOOKUPS/(time.time()-start)
+        
+        assert indexed==scanned
+        
+        log.info("{0:>4} subscriptions: {1:>8.0f} lookups/s scanning, {2:>8.0f} lookups/s indexed".format(
+            numSubscriptions,
+            scanRate,
+            indexRate,
+        ))
+        
+        if numSubscriptions>=100:
+            assert indexRate>scanRate
+
+
+def test_benchmark():
+    '''
+    \brief Events per second delivered, with 1, 10 and 100 subscribers.
+    '''
+    
+    log.debug("\n\n----------test_benchmark")
+    
+    NUM_EVENTS = 2000
+    
+    # measure publishing, not logging
+    busLogger  = logging.getLogger('EventBus')
+    busLevel   = busLogger.level
+    busLogger.setLevel(logging.INFO)
+    
+    try:
+        for numSubscribers in [1,10,100]:
+            
+            counter    = [0]
+            def _count(seqNum):
+                counter[0] += 1
+            ids        = [EventBus.EventBus().subscribe(_count,'bench') for _ in range(numSubscribers)]
+            
+            # synchronous
+            start      = time.time()
+            for seqNum in range(NUM_EVENTS):
+                EventBus.EventBus().publish_sync('bench',seqNum)
+            syncRate   = NUM_EVENTS/(time.time()-start)
+            assert counter[0]==NUM_EVENTS*numSubscribers
+            
+            # asynchronous, through workers
+            counter[0] = 0
+            EventBus.EventBus().setNumWorkers(4)
+            start      = time.time()
+            for seqNum in range(NUM_EVENTS):
+                EventBus.EventBus().publish('bench',seqNum)
+            EventBus.EventBus().setNumWorkers(0)   # returns once all delivered
+            asyncRate  = NUM_EVENTS/(time.time()-start)
+            assert counter[0]==NUM_EVENTS*numSubscribers
+            
+            log.info("{0:>3} subscribers: {1:>8.0f} events/s sync, {2:>8.0f} events/s through workers".format(
+                numSubscribers,
+                syncRate,
+                asyncRate,
+            ))
+            
+            for id in ids:
+                assert EventBus.EventBus().unsubscribe(id)
+    finally:
+        busLogger.setLevel(busLevel)
+
 #----- teardown
 
 def test_teardown():
@@ -0,0 +1,36 @@
+"""Benchmark of send, cached and resolving receivers every time
+
+Not part of the test suite, as the rates depend on the machine:
+run it with python examples/send_rate.py
+"""
+import time
+from pydispatch import dispatcher, robustapply
+
+NUM_SENDS = 5000
+
+class Receiver( object ):
+	def a( self, a ):
+		return a
+
+def uncachedSend( signal, sender, **named ):
+	"""Send as before receiversCache, resolving the receivers every time"""
+	for receiver in dispatcher.liveReceivers(dispatcher.getAllReceivers(sender, signal)):
+		robustapply.robustApply(receiver, signal=signal, sender=sender, **named)
+
+def measure( sendFunction, signal ):
+	start = time.time()
+	for i in range(NUM_SENDS):
+		sendFunction(signal, dispatcher.Anonymous, a=i)
+	return NUM_SENDS/(time.time()-start)
+
+if __name__ == "__main__":
+	signal = 'bytesFromSerialPort/dev/ttyUSB0'
+	for numReceivers in (1, 10):
+		receivers = [Receiver() for i in range(numReceivers)]
+		for receiver in receivers:
+			dispatcher.connect( receiver.a, signal )
+		print '%d receivers: %.0f sends/s uncached, %.0f sends/s cached'%(
+			numReceivers, measure(uncachedSend, signal), measure(dispatcher.send, signal),
+		)
+		for receiver in receivers:
+			dispatcher.disconnect( receiver.a, signal )
@@ -24,9 +24,15 @@ Internal attributes:
 		used for cleaning up receiver references on receiver
 		deletion, (considerably speeds up the cleanup process
 		vs. the original code.)
+	receiversCache -- { (senderkey (id), signal) : [(receiver, adapter)...]}
+		the receivers getAllReceivers yields for a sender and
+		signal, with their robustapply.Adapter, as used by send.
+		Cleared by connect, disconnect and the removal of dead
+		receivers and senders, and when MAX_CACHE_SIZE is reached
 """
 from __future__ import generators
 import weakref
+import threading
 from pydispatch import saferef, robustapply, errors
 
 __author__ = "Patrick K. O'Brien <pobrien@orbtech.com>"
@@ -74,6 +80,11 @@ connections = {}
 senders = {}
 sendersBack = {}
 
+MAX_CACHE_SIZE = 1024
+receiversCache = {}
+_cacheLock = threading.RLock()
+_cacheGeneration = [0]
+
 
 def connect(receiver, signal=Any, sender=Any, weak=True):
 	"""Connect receiver to sender for signal
@@ -169,6 +180,7 @@ def connect(receiver, signal=Any, sender=Any, weak=True):
 		pass
 
 	receivers.append(receiver)
+	_invalidateCache()
 
 
 
@@ -226,6 +238,7 @@ def disconnect(receiver, signal=Any, sender=Any, weak=True):
 			)
 		)
 	_cleanupConnections(senderkey, signal)
+	_invalidateCache()
 
 def getReceivers( sender = Any, signal = Any ):
 	"""Get list of receivers from global tables
@@ -334,8 +347,13 @@ def send(signal=Any, sender=Anonymous, *arguments, **named):
 	# Call each receiver with whatever arguments it can accept.
 	# Return a list of tuple pairs [(receiver, response), ... ].
 	responses = []
-	for receiver in liveReceivers(getAllReceivers(sender, signal)):
-		response = robustapply.robustApply(
+	for receiver, adapter in _cachedReceivers(sender, signal):
+		if isinstance( receiver, WEAKREF_TYPES):
+			# Dereference the weak reference.
+			receiver = receiver()
+			if receiver is None:
+				continue
+		response = adapter(
 			receiver,
 			signal=signal,
 			sender=sender,
@@ -365,11 +383,53 @@ def sendExact( signal=Any, sender=Anonymous, *arguments, **named ):
 	return responses
 	
 
+def _cachedReceivers(sender, signal):
+	"""Get the receivers of getAllReceivers, with their adapters
+
+	The list is computed on the first send for a sender and
+	signal, and kept in receiversCache until the connections
+	change.  It holds the receivers as stored in the connections
+	table, i.e. weak references are not resolved.
+	"""
+	key = (id(sender), signal)
+	try:
+		return receiversCache[key]
+	except KeyError:
+		pass
+	generation = _cacheGeneration[0]
+	receivers = []
+	for receiver in getAllReceivers(sender, signal):
+		for live in liveReceivers((receiver,)):
+			receivers.append((receiver, robustapply.Adapter(live)))
+	_cacheLock.acquire()
+	try:
+		# skip if the connections changed in the meantime
+		if generation == _cacheGeneration[0]:
+			if len(receiversCache) >= MAX_CACHE_SIZE:
+				receiversCache.clear()
+			receiversCache[key] = receivers
+	finally:
+		_cacheLock.release()
+	return receivers
+
+def _invalidateCache():
+	"""Drop the receivers cached by send, the connections changed"""
+	if receiversCache is None or _cacheLock is None:
+		# During module cleanup the mapping will be replaced with None
+		return
+	_cacheLock.acquire()
+	try:
+		_cacheGeneration[0] += 1
+		receiversCache.clear()
+	finally:
+		_cacheLock.release()
+
 def _removeReceiver(receiver):
 	"""Remove receiver from connections."""
 	if not sendersBack:
 		# During module cleanup the mapping will be replaced with None
 		return False
+	_invalidateCache()
 	backKey = id(receiver)
 	try:
 		backSet = sendersBack.pop(backKey)
@@ -415,6 +475,7 @@ def _cleanupConnections(senderkey, signal):
 
 def _removeSender(senderkey):
 	"""Remove senderkey from connections."""
+	_invalidateCache()
 	_removeBackrefs(senderkey)
 	try:
 		del connections[senderkey]
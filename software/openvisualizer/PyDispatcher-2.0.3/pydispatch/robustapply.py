@@ -39,19 +39,39 @@ def function( receiver ):
 def robustApply(receiver, *arguments, **named):
 	"""Call receiver with arguments and an appropriate subset of named
 	"""
-	receiver, codeObject, startIndex = function( receiver )
-	acceptable = codeObject.co_varnames[startIndex+len(arguments):codeObject.co_argcount]
-	for name in codeObject.co_varnames[startIndex:startIndex+len(arguments)]:
-		if name in named:
-			raise TypeError(
-				"""Argument %r specified both positionally and as a keyword for calling %r"""% (
-					name, receiver,
-				)
-			)
-	if not (codeObject.co_flags & 8):
-		# fc does not have a **kwds type parameter, therefore 
-		# remove unacceptable arguments.
-		for arg in named.keys():
-			if arg not in acceptable:
-				del named[arg]
-	return receiver(*arguments, **named)
+	return Adapter( receiver )( receiver, *arguments, **named )
+
+class Adapter(object):
+	"""robustApply with the introspection of the receiver done once
+
+	An Adapter is created for a given receiver, and can then be
+	called any number of times with that receiver (or a new
+	bound method of the same function on the same object, as
+	returned by a weak reference) and the arguments to apply,
+	without inspecting the receiver's code object again.
+	"""
+	def __init__( self, receiver ):
+		receiver, codeObject, startIndex = function( receiver )
+		self.names = codeObject.co_varnames[startIndex:codeObject.co_argcount]
+		self.acceptsAll = bool(codeObject.co_flags & 8)
+	def __call__( self, receiver, *arguments, **named ):
+		"""Call receiver with arguments and an appropriate subset of named
+		"""
+		if arguments:
+			acceptable = self.names[len(arguments):]
+			for name in self.names[:len(arguments)]:
+				if name in named:
+					raise TypeError(
+						"""Argument %r specified both positionally and as a keyword for calling %r"""% (
+							name, receiver,
+						)
+					)
+		else:
+			acceptable = self.names
+		if not self.acceptsAll:
+			# fc does not have a **kwds type parameter, therefore 
+			# remove unacceptable arguments.
+			for arg in named.keys():
+				if arg not in acceptable:
+					del named[arg]
+		return receiver(*arguments, **named)
@@ -1,5 +1,5 @@
 from pydispatch.dispatcher import *
-from pydispatch import dispatcher, robust
+from pydispatch import dispatcher, robust, robustapply
 
 import unittest, pprint
 def x(a):
@@ -123,6 +123,89 @@ class DispatcherTests(unittest.TestCase):
 		assert isinstance( err, ValueError )
 		assert err.args == ('this',)
 
+	def testCacheConnect(self):
+		"""Receivers cached by send follow connect and disconnect"""
+		a = Dummy()
+		b = Callable()
+		signal = 'this'
+		connect( x, signal, a )
+		assert send(signal,a, a=a) == [(x,a)]
+		assert (id(a),signal) in dispatcher.receiversCache
+		connect( b, signal )
+		assert send(signal,a, a=a) == [(x,a),(b,a)]
+		disconnect( x, signal, a )
+		assert send(signal,a, a=a) == [(b,a)]
+		disconnect( b, signal )
+		assert send(signal,a, a=a) == []
+		self._isclean()
+	def testCacheGarbageCollected(self):
+		"""A cached receiver stops receiving once collected"""
+		a = Callable()
+		b = Dummy()
+		signal = 'this'
+		connect( a.a, signal, b )
+		assert len(send(signal,b, a=b)) == 1
+		del a
+		assert dispatcher.receiversCache == {}
+		assert send(signal,b, a=b) == []
+		self._isclean()
+	def testCacheArguments(self):
+		"""Each cached receiver gets the arguments it accepts"""
+		def takesAll( **named ):
+			return sorted(named.keys())
+		def takesNone():
+			return None
+		a = Dummy()
+		signal = 'this'
+		receivers = (x, takesAll, takesNone, Callable())
+		for receiver in receivers:
+			connect( receiver, signal, a, weak=False )
+		for i in range(3):
+			result = [response for receiver, response in send(signal,a, a=i)]
+			assert result == [i, ['a','sender','signal'], None, i], result
+		self.assertRaises( TypeError, send, signal, a, i, a=i )
+		for receiver in receivers:
+			disconnect( receiver, signal, a, weak=False )
+		self._isclean()
+	def testCacheSize(self):
+		"""The cache does not grow past MAX_CACHE_SIZE"""
+		signal = 'this'
+		connect( x, signal )
+		senders = [Dummy() for i in range(dispatcher.MAX_CACHE_SIZE+10)]
+		for sender in senders:
+			send(signal,sender, a=sender)
+		assert 0 < len(dispatcher.receiversCache) <= dispatcher.MAX_CACHE_SIZE
+		disconnect( x, signal )
+		self._isclean()
+	def testCacheInvalidation(self):
+		"""The cached receivers are reused, and rebuilt once the connections change"""
+		a = Dummy()
+		b = Callable()
+		signal = 'this'
+		key = (id(a),signal)
+		connect( x, signal, a )
+		assert send(signal,a, a=a) == [(x,a)]
+		cached = dispatcher.receiversCache[key]
+		assert send(signal,a, a=a) == [(x,a)]
+		assert dispatcher.receiversCache[key] is cached
+		# a receiver connected after a send is honoured
+		generation = dispatcher._cacheGeneration[0]
+		connect( b, signal, a )
+		assert dispatcher._cacheGeneration[0] > generation
+		assert key not in dispatcher.receiversCache
+		assert send(signal,a, a=a) == [(x,a),(b,a)]
+		assert dispatcher.receiversCache[key] is not cached
+		assert len(dispatcher.receiversCache[key]) == 2
+		# a receiver disconnected after a send is not called anymore
+		cached = dispatcher.receiversCache[key]
+		disconnect( x, signal, a )
+		assert key not in dispatcher.receiversCache
+		assert send(signal,a, a=a) == [(b,a)]
+		assert dispatcher.receiversCache[key] is not cached
+		disconnect( b, signal, a )
+		assert send(signal,a, a=a) == []
+		self._isclean()
+
 def getSuite():
 	return unittest.makeSuite(DispatcherTests,'test')
 		
@@ -7,6 +7,7 @@ if __name__=='__main__':
     sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
 
 from moteProbe     import moteProbe
+from moteConnector import TcpFramer
 from OpenCli       import OpenCli
 
 TCP_PORT_START = 8090
@@ -27,6 +28,11 @@ class moteProbeCli(OpenCli):
                              'print status',
                              [],
                              self._handlerStatus)
+        self.registerCommand('stats',
+                             'st',
+                             'print the statistics of the frames sent to the motes',
+                             [],
+                             self._handlerStats)
     
     #======================== public ==========================================
     
@@ -38,10 +44,21 @@ class moteProbeCli(OpenCli):
         output = []
         
         for mp in self.moteProbe_handlers:
-            output += [' - serial port {0}@{1} presented on TCP port {2}'.format(
+            output += [' - serial port {0}@{1} presented on TCP port {2} ({3} engine)'.format(
                             mp.getSerialPortName(),
                             mp.getSerialPortBaudrate(),
-                            mp.getTcpPort())]
+                            mp.getTcpPort(),
+                            mp.getEngine())]
+        
+        print '\n'.join(output)
+    
+    def _handlerStats(self,params):
+        output = []
+        
+        for mp in self.moteProbe_handlers:
+            output += [' - serial port {0}:'.format(mp.getSerialPortName())]
+            for (k,v) in sorted(mp.getStats().items()):
+                output += ['    {0:<20} {1}'.format(k,v)]
         
         print '\n'.join(output)
     
@@ -53,13 +70,25 @@ class moteProbeCli(OpenCli):
 
 def main():
     
-    moteProbe_handlers = []
-
+    # the moteProbe engine and TCP framing can be passed on the command line,
+    # e.g. 'moteProbeCli.py select length' serves all motes from a single
+    # thread, with length-prefixed frames on the TCP ports
+    engine              = moteProbe.moteProbe.ENGINE_THREAD
+    tcpFraming          = TcpFramer.TcpFramer.FRAMING_RAW
+    if len(sys.argv)>1:
+        engine          = sys.argv[1]
+    if len(sys.argv)>2:
+        tcpFraming      = sys.argv[2]
+    if (engine not in moteProbe.moteProbe.ENGINE_ALL) or (tcpFraming not in TcpFramer.TcpFramer.FRAMING_ALL):
+        print 'usage: {0} [{1} [{2}]]'.format(
+            sys.argv[0],
+            '|'.join(moteProbe.moteProbe.ENGINE_ALL),
+            '|'.join(TcpFramer.TcpFramer.FRAMING_ALL),
+        )
+        return
+    
     # create a moteProbe for each mote connected to this computer
-    serialPortNames     = moteProbe.utils.findSerialPorts()
-    port_numbers        = [TCP_PORT_START+i for i in range(len(serialPortNames))]
-    for (serialPortName,port_number) in zip(serialPortNames,port_numbers):
-        moteProbe_handlers.append(moteProbe.moteProbe(serialPortName,port_number))
+    moteProbe_handlers  = moteProbe.createMoteProbes(TCP_PORT_START,engine=engine,tcpFraming=tcpFraming)
 
     # create an open CLI
     cli = moteProbeCli(moteProbe_handlers)
@@ -74,8 +103,11 @@ logHandler = logging.handlers.RotatingFileHandler('moteProbe.log',
                                                   mode='w')
 logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
 for loggerName in ['moteProbe',
+                   'moteProbeSerialProtocol',
+                   'moteProbeOutputQueue',
                    'moteProbeSerialThread',
                    'moteProbeSocketThread',
+                   'moteProbeSelectLoop',
                    'moteProbeUtils',
                    ]:
     temp = logging.getLogger(loggerName)
@@ -7,11 +7,17 @@ if __name__=='__main__':
 
 from moteProbe     import moteProbe
 from moteConnector import moteConnector
+from moteConnector import TcpFramer
 from moteState     import moteState
 from OpenCli       import OpenCli
 
 LOCAL_ADDRESS  = '127.0.0.1'
 TCP_PORT_START = 8090
+MOTEPROBE_ENGINE = moteProbe.moteProbe.ENGINE_THREAD # or ENGINE_SELECT, to serve all motes from one thread
+TCP_FRAMING    = TcpFramer.TcpFramer.FRAMING_LENGTH   # moteProbe and moteConnector both run here
+STATUS_BATCH   = True                                # dispatch status frames to moteState in bursts
+MOTEPROBE_TRANSPORT = moteProbe.moteProbe.TRANSPORT_TCP # or TRANSPORT_PIPE, to hand the frames to the moteConnectors in-process
+DIRECT_CONSUMERS = False                             # deliver the notifications to the consumers without the dispatcher
 
 class MoteStateCli(OpenCli):
     
@@ -73,14 +79,11 @@ def main():
     moteState_handlers     = []
     
     # create a moteProbe for each mote connected to this computer
-    serialPorts    = moteProbe.utils.findSerialPorts()
-    tcpPorts       = [TCP_PORT_START+i for i in range(len(serialPorts))]
-    for (serialPort,tcpPort) in zip(serialPorts,tcpPorts):
-        moteProbe_handlers.append(moteProbe.moteProbe(serialPort,tcpPort))
+    moteProbe_handlers += moteProbe.createMoteProbes(TCP_PORT_START,engine=MOTEPROBE_ENGINE,tcpFraming=TCP_FRAMING,transport=MOTEPROBE_TRANSPORT)
     
     # create a moteConnector for each moteProbe
     for mp in moteProbe_handlers:
-       moteConnector_handlers.append(moteConnector.moteConnector(LOCAL_ADDRESS,mp.getTcpPort()))
+       moteConnector_handlers.append(moteConnector.moteConnector(LOCAL_ADDRESS,mp.getTcpPort(),framing=TCP_FRAMING,batch=STATUS_BATCH,pipe=mp.getPipe(),direct=DIRECT_CONSUMERS))
     
     # create a moteState for each moteConnector
     for mc in moteConnector_handlers:
@@ -8,6 +8,7 @@ if __name__=='__main__':
 
 from moteProbe     import moteProbe
 from moteConnector import moteConnector
+from moteConnector import TcpFramer
 from moteState     import moteState
 from networkState  import networkState
 from lbrClient     import lbrClient
@@ -19,6 +20,11 @@ import Tkinter
 
 LOCAL_ADDRESS  = '127.0.0.1'
 TCP_PORT_START = 8090
+MOTEPROBE_ENGINE = moteProbe.moteProbe.ENGINE_THREAD # or ENGINE_SELECT, to serve all motes from one thread
+TCP_FRAMING    = TcpFramer.TcpFramer.FRAMING_LENGTH   # moteProbe and moteConnector both run here
+STATUS_BATCH   = True                                # dispatch status frames to moteState in bursts
+MOTEPROBE_TRANSPORT = moteProbe.moteProbe.TRANSPORT_TCP # or TRANSPORT_PIPE, to hand the frames to the moteConnectors in-process
+DIRECT_CONSUMERS = False                             # deliver the notifications to the consumers without the dispatcher
 
 class MoteStateGui(object):
     
@@ -142,24 +148,21 @@ class MoteStateGui_app(object):
         self.lbrClient_handler         = None
         
         # create a moteProbe for each mote connected to this computer
-        serialPorts    = moteProbe.utils.findSerialPorts()
-        tcpPorts       = [TCP_PORT_START+i for i in range(len(serialPorts))]
-        for (serialPort,tcpPort) in zip(serialPorts,tcpPorts):
-            self.moteProbe_handlers.append(moteProbe.moteProbe(serialPort,tcpPort))
+        self.moteProbe_handlers += moteProbe.createMoteProbes(TCP_PORT_START,engine=MOTEPROBE_ENGINE,tcpFraming=TCP_FRAMING,transport=MOTEPROBE_TRANSPORT)
         
         # create a moteConnector for each moteProbe
         for mp in self.moteProbe_handlers:
-           self.moteConnector_handlers.append(moteConnector.moteConnector(LOCAL_ADDRESS,mp.getTcpPort()))
+           self.moteConnector_handlers.append(moteConnector.moteConnector(LOCAL_ADDRESS,mp.getTcpPort(),framing=TCP_FRAMING,batch=STATUS_BATCH,pipe=mp.getPipe(),direct=DIRECT_CONSUMERS))
         
         # create a moteState for each moteConnector
         for mc in self.moteConnector_handlers:
            self.moteState_handlers.append(moteState.moteState(mc))
         
         # create one networkState
-        self.networkState_handler = networkState.networkState()
+        self.networkState_handler = networkState.networkState(direct=DIRECT_CONSUMERS)
         
         # create one lbrClient
-        self.lbrClient_handler    = lbrClient.lbrClient()
+        self.lbrClient_handler    = lbrClient.lbrClient(direct=DIRECT_CONSUMERS)
         
         # create an open GUI
         gui = MoteStateGui(self.moteProbe_handlers,
@@ -9,11 +9,13 @@ if __name__=='__main__':
     
 from moteProbe     import moteProbe
 from moteConnector.SerialTester import SerialTester
+from moteConnector import TcpFramer
 from OpenCli       import OpenCli
 
 LOCAL_ADDRESS     = '127.0.0.1'
 TCP_PORT_START    = 8090
 MAX_BYTES_TO_SEND = 50
+TCP_FRAMING       = TcpFramer.TcpFramer.FRAMING_LENGTH
 
 class serialTesterCli(OpenCli):
     
@@ -42,6 +44,16 @@ class serialTesterCli(OpenCli):
                              'timeout for answer, in seconds',
                              ['timeout'],
                              self._handle_timeout)
+        self.registerCommand('mode',
+                             'm',
+                             'test mode, stop-and-wait or pipelined',
+                             ['sw/pl'],
+                             self._handle_mode)
+        self.registerCommand('window',
+                             'win',
+                             'number of test packets in flight, in pipelined mode',
+                             ['window'],
+                             self._handle_window)
         self.registerCommand('trace',
                              'trace',
                              'activate console trace',
@@ -52,6 +64,11 @@ class serialTesterCli(OpenCli):
                              'test serial port',
                              [],
                              self._handle_testserial)
+        self.registerCommand('sweep',
+                             'sw',
+                             'test serial port for each packet length',
+                             ['pklen,pklen,...'],
+                             self._handle_sweep)
         self.registerCommand('stats',
                              'st',
                              'print stats',
@@ -79,6 +96,15 @@ class serialTesterCli(OpenCli):
     def _handle_timeout(self,params):
         self.moteConnector_handler.setTimeout(int(params[0]))
     
+    def _handle_mode(self,params):
+        if params[0] in ['pl','pipelined']:
+            self.moteConnector_handler.setMode(SerialTester.MODE_PIPELINED)
+        else:
+            self.moteConnector_handler.setMode(SerialTester.MODE_STOPANDWAIT)
+    
+    def _handle_window(self,params):
+        self.moteConnector_handler.setWindow(int(params[0]))
+    
     def _handle_trace(self,params):
         if params[0] in [1,'on','yes']:
             self.moteConnector_handler.setTrace(self._indicate_trace)
@@ -88,11 +114,32 @@ class serialTesterCli(OpenCli):
     def _handle_testserial(self,params):
         self.moteConnector_handler.test(blocking=False)
     
+    def _handle_sweep(self,params):
+        pktLens = [int(l) for l in params[0].split(',')]
+        self.moteConnector_handler.sweep(pktLens,blocking=False)
+    
     def _handle_stats(self,params):
         stats = self.moteConnector_handler.getStats()
         output  = []
-        for k in ['numSent','numOk','numCorrupted','numTimeout']:
+        for k in ['numSent','numOk','numCorrupted','numTimeout','numUnexpected','duration','throughputBps','throughputFps','loss']:
             output += ['- {0:<15} : {1}'.format(k,stats[k])]
+        for k in ['min','p50','p90','p99','max']:
+            output += ['- {0:<15} : {1}'.format('rtt '+k,stats['rtt'][k])]
+        
+        # last sweep, if any
+        sweepResults = self.moteConnector_handler.getSweepResults()
+        if sweepResults:
+            output += ['sweep:']
+            output += ['  {0:>6} {1:>10} {2:>10} {3:>8} {4:>10}'.format('pklen','bytes/s','frames/s','loss','rtt p50')]
+            for (pktLen,s) in sweepResults:
+                output += ['  {0:>6} {1:>10.1f} {2:>10.1f} {3:>8.3f} {4:>10}'.format(
+                    pktLen,
+                    s['throughputBps'] or 0,
+                    s['throughputFps'] or 0,
+                    s['loss'] or 0,
+                    s['rtt']['p50'],
+                )]
+        
         output  = '\n'.join(output)
         print output
     
@@ -119,12 +166,13 @@ def main():
     tcpPort        = TCP_PORT_START
     
     # create a moteProbe
-    moteProbe_handler = moteProbe.moteProbe(serialPort,tcpPort)
+    moteProbe_handler = moteProbe.moteProbe(serialPort,tcpPort,tcpFraming=TCP_FRAMING)
     
     # create a SerialTester to attached to the moteProbe
     moteConnector_handler = SerialTester(
                                 LOCAL_ADDRESS,
-                                moteProbe_handler.getTcpPort()
+                                moteProbe_handler.getTcpPort(),
+                                framing = TCP_FRAMING,
                             )
     
     # create an open CLI
@@ -144,6 +192,7 @@ logHandler = logging.handlers.RotatingFileHandler('serialTesterCli.log',
 logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
 for loggerName in [
                    'SerialTester',
+                   'moteProbeSerialProtocol',
                    'moteProbeSerialThread',
                    'OpenHdlc',
                    ]:
@@ -22,7 +22,20 @@ class lbrClient(threading.Thread):
     
     AUTHTIMEOUT              = 5.0
     
-    def __init__(self):
+    def __init__(self,direct=False,
+            queueSize=MoteConnectorConsumer.MoteConnectorConsumer.QUEUESIZE,
+            queuePolicy=MoteConnectorConsumer.MoteConnectorConsumer.DFLT_POLICY,
+            batchSize=None):
+        '''
+        \param direct      If True, receive the data from the moteConnectors
+                           created with direct=True, see
+                           MoteConnectorConsumer.
+        \param queueSize   The size of the queue of packets to send.
+        \param queuePolicy What to do when it is full, one of
+                           MoteConnectorConsumer.POLICY_ALL.
+        \param batchSize   If set, send up to batchSize queued packets at
+                           once.
+        '''
     
         # store params
         
@@ -36,7 +49,11 @@ class lbrClient(threading.Thread):
         self.connectorConsumer    = MoteConnectorConsumer.MoteConnectorConsumer(
             signal        = 'inputFromMoteProbe.data.internet',
             sender        = dispatcher.Any,
-            notifCallback = self.send,
+            notifCallback = self._sendBatch if batchSize else self.send,
+            direct        = direct,
+            queueSize     = queueSize,
+            policy        = queuePolicy,
+            batchSize     = batchSize,
         )
         
         # reset the statistics
@@ -296,6 +313,10 @@ class lbrClient(threading.Thread):
     
     #======================== private =========================================
     
+    def _sendBatch(self,lowpans):
+        for lowpan in lowpans:
+            self.send(lowpan)
+    
     #===== stats handling
     
     def _resetStats(self,disconnectReason=None):
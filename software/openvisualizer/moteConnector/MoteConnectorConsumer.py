@@ -8,18 +8,80 @@ log.addHandler(NullHandler())
 
 import threading
 import socket
-import Queue
+import collections
+import time
 
 from pydispatch import dispatcher
 
 import OpenParser
 import ParserException
+import MoteConnectorRouter
 
 class MoteConnectorConsumer(threading.Thread):
+    '''
+    \brief Thread consuming the notifications of moteConnectors, through a
+           bounded queue.
     
-    QUEUESIZE = 100
+    When the queue is full, a new notification is handled according to the
+    policy:
+    - POLICY_BLOCK: the sender waits for room, up to blockTimeout, then the
+      notification is dropped.
+    - POLICY_DROP_NEWEST: the notification is dropped.
+    - POLICY_COALESCE: the latest queued notification with the same
+      coalesceKey is replaced by the new one. If there is none, or the key
+      is None, the notification is dropped.
+    Either way the sender never gets an exception, drops are counted in
+    getStats().
     
-    def __init__(self,signal,sender,notifCallback):
+    In batch mode (batchSize set), the thread takes up to batchSize
+    notifications from the queue at once, and calls notifCallback with the
+    list of them.
+    '''
+    
+    QUEUESIZE                 = 100
+    
+    POLICY_BLOCK              = 'block'
+    POLICY_DROP_NEWEST        = 'dropNewest'
+    POLICY_COALESCE           = 'coalesce'
+    POLICY_ALL                = [POLICY_BLOCK,
+                                 POLICY_DROP_NEWEST,
+                                 POLICY_COALESCE,]
+    
+    DFLT_POLICY               = POLICY_BLOCK
+    DFLT_BLOCK_TIMEOUT        = 1.0     ##< max. time a sender waits for room, in s
+    
+    def __init__(self,signal,sender,notifCallback,direct=False,
+            queueSize=QUEUESIZE,
+            policy=DFLT_POLICY,
+            blockTimeout=DFLT_BLOCK_TIMEOUT,
+            coalesceKey=None,
+            batchSize=None):
+        '''
+        \param signal        The signal of the notifications to consume.
+        \param sender        The name of the moteConnector they must come
+                             from, dispatcher.Any for all.
+        \param notifCallback Function called, from this thread, with the data
+                             of each notification.
+        \param direct        If True, the notifications are received from
+                             the moteConnectors created with direct=True,
+                             through the MoteConnectorRouter, rather than
+                             from the dispatcher.
+        \param queueSize     The maximum number of notifications queued.
+        \param policy        One of POLICY_ALL, applied when the queue is
+                             full.
+        \param blockTimeout  With POLICY_BLOCK, the maximum time, in s, a
+                             sender waits for room.
+        \param coalesceKey   With POLICY_COALESCE, function returning the key
+                             of a notification, notifications with the same
+                             key replacing each other; None if it cannot be
+                             coalesced. By default, none can.
+        \param batchSize     If set, notifCallback is called with a list of up
+                             to batchSize notifications, rather than with
+                             each one.
+        '''
+        assert queueSize>0
+        assert policy in self.POLICY_ALL
+        assert batchSize==None or batchSize>0
         
         # log
         log.debug("create instance")
@@ -27,6 +89,12 @@ class MoteConnectorConsumer(threading.Thread):
         # store params
         self.notifCallback = notifCallback
         self.sender        = sender
+        self.direct        = direct
+        self.queueSize     = queueSize
+        self.policy        = policy
+        self.blockTimeout  = blockTimeout
+        self.coalesceKey   = coalesceKey
+        self.batchSize     = batchSize
         
         # initialize parent class
         threading.Thread.__init__(self)
@@ -36,32 +104,108 @@ class MoteConnectorConsumer(threading.Thread):
         
         # local variables
         self.goOn          = True
-        self.dataQueue     = Queue.Queue(self.QUEUESIZE)
-        
-        # connect to dispatcher
-        dispatcher.connect(
-            #notifCallback,
-            self._eventBusNotification,
-            signal = signal,
-        )
+        self.dataLock      = threading.Lock()
+        self.notEmpty      = threading.Condition(self.dataLock)
+        self.notFull       = threading.Condition(self.dataLock)
+        self.dataQueue     = collections.deque() ##< [key,data] items
+        self.stats         = {
+            'numQueued':      0,    ##< notifications queued
+            'numDropped':     0,    ##< notifications dropped, the queue being full
+            'numCoalesced':   0,    ##< notifications which replaced a queued one
+            'numBlocked':     0,    ##< notifications whose sender had to wait
+            'maxDepth':       0,    ##< highest depth reached
+            'numCallbacks':   0,    ##< calls of notifCallback
+        }
         
+        # connect to dispatcher, or to the router
+        if self.direct:
+            MoteConnectorRouter.MoteConnectorRouter().connect(
+                self,
+                signal = signal,
+                sender = MoteConnectorRouter.MoteConnectorRouter.ANY if sender==dispatcher.Any else sender,
+            )
+        else:
+            dispatcher.connect(
+                #notifCallback,
+                self._eventBusNotification,
+                signal = signal,
+            )
+    
     def run(self):
         # log
         log.debug("starting to run")
-    
-        while self.goOn:
         
+        while self.goOn:
+            
             # get data from the queue
-            newData = self.dataQueue.get()
+            with self.dataLock:
+                while not self.dataQueue:
+                    self.notEmpty.wait()
+                if self.batchSize==None:
+                    newData = self.dataQueue.popleft()[1]
+                else:
+                    newData = [
+                        self.dataQueue.popleft()[1]
+                        for _ in range(min(self.batchSize,len(self.dataQueue)))
+                    ]
+                self.stats['numCallbacks'] += 1
+                self.notFull.notify_all()
             
             # log
-            log.debug("got data: {0}".format(newData))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("got data: {0}".format(newData))
             
             # call the callback
             self.notifCallback(newData)
     
     #======================== public ==========================================
     
+    def put(self,data):
+        '''
+        \brief Queue a notification, for notifCallback.
+        
+        \returns True if the notification was queued (or coalesced), False
+                 if it was dropped.
+        '''
+        key = None
+        if self.policy==self.POLICY_COALESCE and self.coalesceKey:
+            key = self.coalesceKey(data)
+        
+        with self.dataLock:
+            if len(self.dataQueue)>=self.queueSize:
+                if   self.policy==self.POLICY_BLOCK:
+                    self.stats['numBlocked']         += 1
+                    deadline = time.time()+self.blockTimeout
+                    while len(self.dataQueue)>=self.queueSize and time.time()<deadline:
+                        self.notFull.wait(deadline-time.time())
+                elif self.policy==self.POLICY_COALESCE and key!=None:
+                    for item in reversed(self.dataQueue):
+                        if item[0]==key:
+                            item[1] = data
+                            self.stats['numCoalesced'] += 1
+                            return True
+                if len(self.dataQueue)>=self.queueSize:
+                    self.stats['numDropped']         += 1
+                    if self.stats['numDropped']==1:
+                        log.warning('{0} queue full, dropping notifications'.format(self.name))
+                    return False
+            
+            self.dataQueue.append([key,data])
+            self.stats['numQueued']                  += 1
+            self.stats['maxDepth']                    = max(self.stats['maxDepth'],len(self.dataQueue))
+            self.notEmpty.notify()
+            return True
+    
+    def getStats(self):
+        '''
+        \returns A dictionary with the counters of self.stats, plus the
+                 current 'depth'.
+        '''
+        with self.dataLock:
+            returnVal          = dict(self.stats)
+            returnVal['depth'] = len(self.dataQueue)
+        return returnVal
+    
     #======================== private =========================================
     
     def _eventBusNotification(self,signal,sender,data):
@@ -69,7 +213,4 @@ class MoteConnectorConsumer(threading.Thread):
         if (self.sender!=dispatcher.Any) and (sender!=self.sender):
             return
         
-        if self.dataQueue.full():
-            raise SystemError("Queue is full")
-        
-        self.dataQueue.put(data)
\ No newline at end of file
+        self.put(data)
\ No newline at end of file
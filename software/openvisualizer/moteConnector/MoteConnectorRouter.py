@@ -0,0 +1,90 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('MoteConnectorRouter')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import threading
+
+class MoteConnectorRouter(object):
+    '''
+    \brief Delivers the notifications of the moteConnectors to the
+           MoteConnectorConsumers created with direct=True, without going
+           through the dispatcher.
+    
+    The consumers are indexed by signal: sending a notification is a
+    dictionary lookup, then a put() into the bounded queue of each consumer
+    of that signal, no weak references are resolved and no signatures
+    inspected. The index is replaced, not modified, when a consumer
+    connects or disconnects, so send() takes no lock.
+    
+    It is implemented as a singleton, i.e. all moteConnectors and consumers
+    share the same router.
+    '''
+    _instance                 = None
+    _init                     = False
+    
+    ANY                       = None    ##< sender of consumers accepting any moteConnector
+    
+    def __new__(cls, *args, **kwargs):
+        '''
+        \brief Override creation of the object so it is create only once
+               (singleton pattern)
+        '''
+        if not cls._instance:
+            cls._instance = super(MoteConnectorRouter, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+    
+    def __init__(self):
+        
+        if self._init:
+            return
+        
+        # log
+        log.debug("create instance")
+        
+        # local variables
+        self.dataLock             = threading.Lock()
+        self.consumers            = {}      ##< signal -> ((sender,consumer),...)
+        self._init                = True
+    
+    #======================== public ==========================================
+    
+    def connect(self,consumer,signal,sender=ANY):
+        '''
+        \param consumer The MoteConnectorConsumer, its put() method is called
+                        with the data of each notification.
+        \param signal   The signal of the notifications, e.g.
+                        'inputFromMoteProbe.status'.
+        \param sender   The name of the moteConnector the notifications must
+                        come from, ANY for all.
+        '''
+        with self.dataLock:
+            consumers         = dict(self.consumers)
+            consumers[signal] = consumers.get(signal,())+((sender,consumer),)
+            self.consumers    = consumers
+    
+    def disconnect(self,consumer,signal):
+        with self.dataLock:
+            consumers         = dict(self.consumers)
+            consumers[signal] = tuple([c for c in consumers.get(signal,()) if c[1] is not consumer])
+            if not consumers[signal]:
+                del consumers[signal]
+            self.consumers    = consumers
+    
+    def send(self,signal,sender,data):
+        '''
+        \brief Deliver a notification to the consumers of its signal.
+        
+        \returns The number of consumers it was delivered to.
+        '''
+        returnVal = 0
+        for (consumerSender,consumer) in self.consumers.get(signal,()):
+            if consumerSender is self.ANY or consumerSender==sender:
+                consumer.put(data)
+                returnVal += 1
+        return returnVal
+    
+    #======================== private =========================================
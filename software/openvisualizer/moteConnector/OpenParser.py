@@ -7,6 +7,8 @@ log = logging.getLogger('OpenParser')
 log.setLevel(logging.ERROR)
 log.addHandler(NullHandler())
 
+import collections
+
 from ParserException import ParserException
 import Parser
 import ParserStatus
@@ -76,4 +78,28 @@ class OpenParser(Parser.Parser):
     
     #======================== public ==========================================
     
+    def parseBatch(self,frames):
+        '''
+        \brief Parse a burst of frames at once.
+        
+        A frame which cannot be parsed is logged and skipped, so it does not
+        prevent the rest of the burst from being parsed.
+        
+        \param frames The list of frames, each a string.
+        
+        \returns An OrderedDict mapping each event subtype to the list of
+                 its parsed notifications, in the order the frames were
+                 received. Subtypes are ordered by first occurrence.
+        '''
+        returnVal = collections.OrderedDict()
+        for frame in frames:
+            try:
+                (eventSubType,parsedNotif) = self.parseInput(frame)
+            except ParserException as err:
+                # log
+                log.error(str(err))
+            else:
+                returnVal.setdefault(eventSubType,[]).append(parsedNotif)
+        return returnVal
+    
     #======================== private =========================================
\ No newline at end of file
@@ -8,6 +8,7 @@ log.setLevel(logging.ERROR)
 log.addHandler(NullHandler())
 
 from ParserException import ParserException
+import openvisualizer_utils as u
 
 class ParsingKey(object):
     
@@ -41,33 +42,44 @@ class Parser(object):
         
         # local variables
         self.parsingKeys          = []
+        self.parsingTable         = {}    # index -> {val -> parser}, built from parsingKeys
         self.headerParsingKeys    = []
         self.named_tuple          = {}
     
     #======================== public ==========================================
     
     def parseInput(self,input):
+        '''
+        \brief Parse a frame, by handing it to the sub-parser its key selects.
+        
+        \param input The frame, a string. It is only sliced, never converted
+                     to a list of ints, so the sub-parsers can unpack their
+                     fields straight from it.
+        
+        \returns The (eventSubType,data) tuple of the sub-parser.
+        '''
         
         # log
-        log.debug("received input={0}".format(input))
-        #print "PARSER received input={0}".format(input)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("received input={0}".format(u.formatBuf(input)))
         
         # ensure input not short longer than header
         self._checkLength(input)
         
         # parse the header
         # TODO
-     
+        
         # call the next header parser
-        for key in self.parsingKeys:
-            if input[key.index]==key.val:
-                return key.parser(input[self.headerLength:])
+        for (index,parsers) in self.parsingTable.iteritems():
+            parser = parsers.get(ord(input[index]))
+            if parser:
+                return parser(input[self.headerLength:])
         
         # if you get here, no key was found
-     
+        
         raise ParserException(ParserException.NO_KEY, "type={0} (\"{1}\")".format(
-            input[0],
-            chr(input[0])))
+            ord(input[0]),
+            input[0]))
     
     #======================== private =========================================
     
@@ -76,4 +88,6 @@ class Parser(object):
             raise ParserException(ParserException.TOO_SHORT)
     
     def _addSubParser(self,index=None,val=None,parser=None):
-        self.parsingKeys.append(ParsingKey(index,val,parser))
\ No newline at end of file
+        key = ParsingKey(index,val,parser)
+        self.parsingKeys.append(key)
+        self.parsingTable.setdefault(key.index,{})[key.val] = key.parser
\ No newline at end of file
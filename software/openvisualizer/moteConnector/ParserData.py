@@ -13,6 +13,7 @@ from pydispatch import dispatcher
 
 from ParserException import ParserException
 import Parser
+import openvisualizer_utils as u
 
 class ParserData(Parser.Parser):
     
@@ -22,7 +23,7 @@ class ParserData(Parser.Parser):
     IPHC_SAM       = 4
     IPHC_DAM       = 0
     
-     
+    
     def __init__(self):
         
         # log
@@ -40,31 +41,39 @@ class ParserData(Parser.Parser):
     #======================== public ==========================================
     
     def parseInput(self,input):
+        '''
+        \brief Parse a data frame.
+        
+        \param input The frame, a string, without its type byte.
+        
+        \returns A (eventType,data) tuple, where data is the frame stripped
+                 of the headers the mote added, as a list of ints.
+        '''
+        debug = log.isEnabledFor(logging.DEBUG)
+        
         # log
-        log.debug("received data {0}".format(input))
+        if debug:
+            log.debug("received data {0}".format(u.formatBuf(input)))
         # ensure input not short longer than header
         self._checkLength(input)
-    
-        headerBytes = input[:2]
+        
         #asn comes in the next 5bytes.  
         asnbytes=input[2:7]
-        (self._asn) = struct.unpack('<BHH',''.join([chr(c) for c in asnbytes]))
+        (self._asn) = struct.unpack_from('<BHH',input,2)
         
         #source and destination of the message
         dest = input[7:15]
         #source is elided!!! so it is not there.. check that.
         source = input[15:23]
         
-        a="".join(hex(c) for c in dest)
-        log.debug("destination address of the packet is {0} ".format(a))
-        #print a
-        a="".join(hex(c) for c in source)
-        log.debug("source address (just previous hop) of the packet is {0} ".format(a))
+        if debug:
+            log.debug("destination address of the packet is {0} ".format(u.formatBuf(dest)))
+            log.debug("source address (just previous hop) of the packet is {0} ".format(u.formatBuf(source)))
         
         
         #check if the message is local or internet
         if (len(input) > 35):
-            iphcHeader  = input[23:35]
+            iphcHeader  = bytearray(input[23:35])
             #from 6LoWPAN compression draft:
             # DAM/SAM 
             # 0 bits.  The address is fully elided.  The first 64 bits
@@ -80,36 +89,28 @@ class ParserData(Parser.Parser):
                     log.debug("local pkt from first hop as src address is elided")
                     #rplheader=input[27:29]
                     #inject source address to the packet so the DAO parsing is the same in any case.
-                    src=[]
-                    src=list(source)
-                    dao=[]
-                    dao=list(input[:27])
-                    dao.extend(src)
-                    dao.extend(list(input[27:]))
-                    input=list(dao)
-                    rplheader=input[35:37]
-                        
+                    input=input[:27]+source+input[27:]
+                    rplheader=bytearray(input[35:37])
+                
                 elif (sam==0x01):
                     #rest of hops src is not compressed 
                     log.debug("local pkt from further hop as src address is not elided")
                     source=input[27:35]
-                    for i in range(len(source)):
-                        input[15+i]=input[27+i]
-                        
-                    a="".join(hex(c) for c in source)
-                    log.debug("source address of the packet is {0} ".format(a))
-                    #print a
+                    input=input[:15]+source+input[23:]
+                    
+                    if debug:
+                        log.debug("source address of the packet is {0} ".format(u.formatBuf(source)))
                     
-                    rplheader=input[35:37]  
+                    rplheader=bytearray(input[35:37])
                 else:
                     log.error("local pkt with src address in 128b format.. this should never happen.")
                     while 1:
                         pass
-                            
+                
                 #source is not elided so it is in the iphc header.
                 #skip 2 bytes of ICMP header being nexhop, hop limit,..
                 icmpHeader = input[25:27]
-    
+                
                 if (rplheader[0]==155 and rplheader[1]==4):
                     #this is a DAO
                     eventType = 'data.local'
@@ -117,7 +118,7 @@ class ParserData(Parser.Parser):
                     input = input[7:]
                     log.debug("data is local")  
                     
-                    return (eventType,input)
+                    return (eventType,list(bytearray(input)))
                 else:
                     pass
             else:
@@ -130,9 +131,9 @@ class ParserData(Parser.Parser):
         log.debug("data destination is in internet")
             # extract moteId and statusElem
         try:
-          (moteId) = struct.unpack('<H',''.join([chr(c) for c in headerBytes]))
+          (moteId) = struct.unpack_from('<H',input)
         except struct.error:
-           raise ParserException(ParserException.DESERIALIZE,"could not extract moteId from {0}".format(headerBytes))
+           raise ParserException(ParserException.DESERIALIZE,"could not extract moteId from {0}".format(u.formatBuf(input[:2])))
             # log
         log.debug("moteId={0}".format(moteId))
             #remove asn src and dest and mote id at the beginning.
@@ -144,13 +145,13 @@ class ParserData(Parser.Parser):
         #then notify a latency component that will plot that information.
         # port 61001==0xee,0x49
         if (len(input) >37):
-           if (input[36]==238 and input[37]==73):
+           if (ord(input[36])==238 and ord(input[37])==73):
             #udp port 61001 for udplatency app.
                aux=input[len(input)-5:]                 #last 5 bytes of the packet are the ASN in the UDP latency packet
                diff=self._asndiference(aux,asnbytes)    #calculate difference 
                timeinus=diff*self.MSPERSLOT             #compute time in ms 
-               parent=input[len(input)-21:len(input)-13]#the parent node is the first element (used to know topology)
-               node=input[len(input)-13:len(input)-5] #the node address
+               parent=list(bytearray(input[len(input)-21:len(input)-13]))#the parent node is the first element (used to know topology)
+               node=list(bytearray(input[len(input)-13:len(input)-5])) #the node address
                
                if (timeinus<0xFFFF):
                #notify latency manager component. only if a valid value
@@ -162,7 +163,7 @@ class ParserData(Parser.Parser):
                else:
                    #this usually happens when the serial port framing is not correct and more than one message is parsed at the same time. this will be solved with HDLC framing.
                    print "Wrong latency computation {0} = {1} mS".format(str(node),timeinus)
-                   print ",".join(hex(c) for c in input)
+                   print ",".join(hex(ord(c)) for c in input)
                    log.debug("Wrong latency computation {0} = {1} mS".format(str(node),timeinus))
                    pass
                #in case we want to send the computed time to internet..
@@ -175,14 +176,14 @@ class ParserData(Parser.Parser):
                pass     
         else:
            pass      
-        return (eventType,input)
-
- #======================== private =========================================
+        return (eventType,list(bytearray(input)))
  
+ #======================== private =========================================
+    
     def _asndiference(self,init,end):
-      
-       asninit = struct.unpack('<HHB',''.join([chr(c) for c in init]))
-       asnend  = struct.unpack('<HHB',''.join([chr(c) for c in end]))
+       
+       asninit = struct.unpack('<HHB',init)
+       asnend  = struct.unpack('<HHB',end)
        if (asnend[2] != asninit[2]): #'byte4'
           return 0xFFFFFFFF
        else:
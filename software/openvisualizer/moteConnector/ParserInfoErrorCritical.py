@@ -11,6 +11,7 @@ import struct
 
 from ParserException import ParserException
 import Parser
+import openvisualizer_utils as u
 
 import StackDefines
 
@@ -25,6 +26,8 @@ class ParserInfoErrorCritical(Parser.Parser):
                            SEVERITY_ERROR,
                            SEVERITY_CRITICAL,]
     
+    ERROR_FORMAT        = struct.Struct('>HBBHH')
+    
     def __init__(self,severity):
         assert severity in self.SEVERITY_ALL
         
@@ -42,7 +45,8 @@ class ParserInfoErrorCritical(Parser.Parser):
     def parseInput(self,input):
         
         # log
-        log.debug("received data {0}".format(input))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("received data {0}".format(u.formatBuf(input)))
         
         # parse packet
         try:
@@ -50,9 +54,9 @@ class ParserInfoErrorCritical(Parser.Parser):
             callingComponent,
             error_code,
             arg1,
-            arg2) = struct.unpack('>HBBHH',''.join([chr(c) for c in input]))
+            arg2) = self.ERROR_FORMAT.unpack(input)
         except struct.error:
-            raise ParserException(ParserException.DESERIALIZE,"could not extract data from {0}".format(input))
+            raise ParserException(ParserException.DESERIALIZE,"could not extract data from {0}".format(u.formatBuf(input)))
         
         # turn into string
         output = "{MOTEID:x} [{COMPONENT}] {ERROR_DESC}".format(
@@ -71,7 +75,7 @@ class ParserInfoErrorCritical(Parser.Parser):
         else:
             raise SystemError("unexpected severity={0}".format(self.severity))
         
-        return ('error',input)
+        return ('error',list(bytearray(input)))
     
     #======================== private =========================================
     
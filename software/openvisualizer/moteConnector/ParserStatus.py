@@ -11,19 +11,44 @@ log.addHandler(NullHandler())
 
 from ParserException import ParserException
 import Parser
+import openvisualizer_utils as u
 
 class FieldParsingKey(object):
-
+    
+    namedTuples         = {}    ##< (val,name,fields) -> namedtuple class, shared by all parsers
+    
     def __init__(self,index,val,name,structure,fields):
         self.index      = index
         self.val        = val
         self.name       = name
         self.structure  = structure
         self.fields     = fields
-
+        self.struct     = struct.Struct(structure)
+        self.size       = self.struct.size
+        self.namedTuple = self._namedTuple(val,name,fields)
+    
+    def _namedTuple(self,val,name,fields):
+        '''
+        \brief The namedtuple class of the fields, created once and shared by
+               all parsers, as each class takes several kB.
+        '''
+        key       = (val,name,tuple(fields))
+        returnVal = self.namedTuples.get(key)
+        if returnVal==None:
+            returnVal = collections.namedtuple("Tuple_"+name, fields)
+            
+            # tag the tuples with their statusElem, so consumers route them
+            # by a dictionary lookup
+            returnVal._statusElem = val
+            
+            returnVal = self.namedTuples.setdefault(key,returnVal)
+        return returnVal
+    
 class ParserStatus(Parser.Parser):
     
     HEADER_LENGTH       = 4
+    STATUS_HEADER       = struct.Struct('<HB')   # moteId, statusElem
+    STATUS_HEADER_SIZE  = STATUS_HEADER.size
     
     def __init__(self):
         
@@ -35,6 +60,7 @@ class ParserStatus(Parser.Parser):
         
         # local variables
         self.fieldsParsingKeys    = []
+        self.fieldsParsingTable   = {}    # statusElem -> FieldParsingKey
         
         # register fields
         self._addFieldsParser   (
@@ -201,69 +227,83 @@ class ParserStatus(Parser.Parser):
     #======================== public ==========================================
     
     def parseInput(self,input):
+        '''
+        \brief Parse a status frame.
+        
+        The fields are unpacked in place, at their offset in the frame, so
+        the payload is never copied.
+        
+        \param input The frame, a string, without its type byte.
+        
+        \returns A ('status',namedtuple) tuple. The namedtuple carries the
+                 statusElem it was parsed from as its _statusElem attribute.
+        '''
+        debug = log.isEnabledFor(logging.DEBUG)
         
         # log
-        log.debug("received input={0}".format(input))
+        if debug:
+            log.debug("received input={0}".format(u.formatBuf(input)))
         
         # ensure input not short longer than header
         self._checkLength(input)
         
-        headerBytes = input[:3]
-        
         # extract moteId and statusElem
         try:
-           (moteId,statusElem) = struct.unpack('<HB',''.join([chr(c) for c in headerBytes]))
+           (moteId,statusElem) = self.STATUS_HEADER.unpack_from(input)
         except struct.error:
-            raise ParserException(ParserException.DESERIALIZE,"could not extract moteId and statusElem from {0}".format(headerBytes))
+            raise ParserException(ParserException.DESERIALIZE,"could not extract moteId and statusElem from {0}".format(u.formatBuf(input[:self.STATUS_HEADER_SIZE])))
         
         # log
-        log.debug("moteId={0} statusElem={1}".format(moteId,statusElem))
-        
-        # jump the header bytes
-        input = input[3:]
+        if debug:
+            log.debug("moteId={0} statusElem={1}".format(moteId,statusElem))
         
         # call the next header parser
-        for key in self.fieldsParsingKeys:
-            if statusElem==key.val:
-            
-                # log
-                log.debug("parsing {0}, ({1} bytes) as {2}".format(input,len(input),key.name))
-                
-                # parse byte array
-                try:
-                    fields = struct.unpack(key.structure,''.join([chr(c) for c in input]))                     
-                except struct.error as err:
-                    raise ParserException(
-                            ParserException.DESERIALIZE,
-                            "could not extract tuple {0} by applying {1} to {2} ({3} bytes); error: {4}".format(
-                                key.name,
-                                key.structure,
-                                input,
-                                len(input),
-                                str(err)
-                            )
-                        )
-                
-                # map to name tuple
-                returnTuple = self.named_tuple[key.name](*fields)
-                
-                # log
-                log.debug("parsed into {0}".format(returnTuple))
-                
-                # map to name tuple
-                return ('status',returnTuple)
+        key = self.fieldsParsingTable.get(statusElem)
+        if key==None:
+            raise ParserException(ParserException.NO_KEY, "statusElem={0}".format(statusElem))
+        
+        # the payload follows the header bytes
+        payloadLen = len(input)-self.STATUS_HEADER_SIZE
+        
+        # log
+        if debug:
+            log.debug("parsing {0}, ({1} bytes) as {2}".format(u.formatBuf(input[self.STATUS_HEADER_SIZE:]),payloadLen,key.name))
+        
+        # parse byte array
+        try:
+            if payloadLen!=key.size:
+                raise struct.error('unpack requires a string argument of length {0}'.format(key.size))
+            fields = key.struct.unpack_from(input,self.STATUS_HEADER_SIZE)
+        except struct.error as err:
+            raise ParserException(
+                    ParserException.DESERIALIZE,
+                    "could not extract tuple {0} by applying {1} to {2} ({3} bytes); error: {4}".format(
+                        key.name,
+                        key.structure,
+                        u.formatBuf(input[self.STATUS_HEADER_SIZE:]),
+                        payloadLen,
+                        str(err)
+                    )
+                )
         
-        # if you get here, no key was found
-        raise ParserException(ParserException.NO_KEY, "type={0} (\"{1}\")".format(
-            input[0],
-            chr(input[0])))
+        # map to name tuple
+        returnTuple = key.namedTuple(*fields)
+        
+        # log
+        if debug:
+            log.debug("parsed into {0}".format(returnTuple))
+        
+        return ('status',returnTuple)
     
     #======================== private =========================================
     
     def _addFieldsParser(self,index=None,val=None,name=None,structure=None,fields=None):
-    
-        # add to fields parsing keys
-        self.fieldsParsingKeys.append(FieldParsingKey(index,val,name,structure,fields))
+        
+        key = FieldParsingKey(index,val,name,structure,fields)
+        
+        # add to fields parsing keys, and to the table parseInput looks up
+        self.fieldsParsingKeys.append(key)
+        self.fieldsParsingTable[key.val] = key
         
         # define named tuple
-        self.named_tuple[name] = collections.namedtuple("Tuple_"+name, fields)
\ No newline at end of file
+        self.named_tuple[name] = key.namedTuple
\ No newline at end of file
@@ -9,16 +9,41 @@ log.addHandler(NullHandler())
 import threading
 import socket
 import random
+import struct
+import time
 
 from moteConnector import OpenParser
+from moteConnector import TcpFramer
 
 class SerialTester(threading.Thread):
+    '''
+    \brief Tests the serial link to a mote, by having it echo test packets.
+    
+    Two modes are supported:
+    - MODE_STOPANDWAIT: a packet is sent once the previous one was echoed,
+      or timed out.
+    - MODE_PIPELINED: up to window packets are in flight at once. Each packet
+      starts with a sequence number, so echoes are matched to the packet
+      they answer whatever the order they arrive in.
+    
+    In both modes, the round-trip time of each packet is measured, and the
+    stats report the throughput, RTT percentiles and loss of the last test.
+    '''
     
     DFLT_TESTPKT_LENGTH = 10  ##< number of bytes in a test packet
     DFLT_NUM_TESTPKT    = 20  ##< number of test packets to send
     DFLT_TIMEOUT        = 5   ##< timeout in second for getting a reply
+    DFLT_WINDOW         = 4   ##< number of packets in flight, in MODE_PIPELINED
+    
+    MODE_STOPANDWAIT    = 'stopAndWait'
+    MODE_PIPELINED      = 'pipelined'
+    MODE_ALL            = [MODE_STOPANDWAIT,
+                           MODE_PIPELINED,]
     
-    def __init__(self,moteProbeIp,moteProbeTcpPort):
+    SEQNUM_FORMAT       = struct.Struct('>I')   ##< sequence number at the start of a pipelined test packet
+    RTT_PERCENTILES     = [50,90,99]
+    
+    def __init__(self,moteProbeIp,moteProbeTcpPort,framing=TcpFramer.TcpFramer.FRAMING_RAW):
         
         # log
         log.debug("creating instance")
@@ -30,15 +55,22 @@ class SerialTester(threading.Thread):
         # local variables
         self.dataLock             = threading.RLock()
         self.socket               = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.framer               = TcpFramer.TcpFramer(framing)
         self.goOn                 = True
         self.testPktLen           = self.DFLT_TESTPKT_LENGTH
         self.numTestPkt           = self.DFLT_NUM_TESTPKT
         self.timeout              = self.DFLT_TIMEOUT
+        self.mode                 = self.MODE_STOPANDWAIT
+        self.window               = self.DFLT_WINDOW
         self.traceCb              = None
         self.busyTesting          = False
         self.lastSent             = []
         self.lastReceived         = []
         self.waitForReply         = threading.Event()
+        self.inFlight             = {}      ##< seqNum -> (send time,packet), in MODE_PIPELINED
+        self.inFlightChanged      = threading.Condition(self.dataLock)
+        self.rtts                 = []
+        self.sweepResults         = []
         self._resetStats()
         
         # initialize parent class
@@ -46,7 +78,7 @@ class SerialTester(threading.Thread):
         
         # give this thread a name
         self.name = 'SerialTester@{0}:{1}'.format(self.moteProbeIp,self.moteProbeTcpPort)
-        
+    
     def run(self):
         # log
         log.debug("starting to run")
@@ -57,27 +89,18 @@ class SerialTester(threading.Thread):
                 self.socket.connect((self.moteProbeIp,self.moteProbeTcpPort))
                 log.debug("connecting to moteProbe@{0}:{1}".format(self.moteProbeIp,self.moteProbeTcpPort))
                 
+                self.framer.reset()
+                
                 while True:
                     
                     # retrieve the string of bytes from the socket
                     inputString        = self.socket.recv(1024)
-                    input              = [ord(c) for c in inputString]
-                    
-                    # handle input
-                    if (chr(input[0])==chr(OpenParser.OpenParser.SERFRAME_MOTE2PC_DATA)):
-                        
-                        # don't handle if I'm not testing
-                        with self.dataLock:
-                            if not self.busyTesting:
-                                continue
-                        
-                        with self.dataLock:
-                            # record what I just received
-                            self.lastReceived = input[1+2+5:] # type (1B), moteId (2B), ASN (5B)
-                            
-                            # wake up other thread
-                            self.waitForReply.set()
+                    if not inputString:
+                        raise socket.error('connection closed by moteProbe')
                     
+                    for frame in self.framer.decode(inputString):
+                        self._handleFrame([ord(c) for c in frame])
+            
             except socket.error as err:
                 log.error(err)
                 pass
@@ -106,10 +129,20 @@ class SerialTester(threading.Thread):
             self.timeout     = newTimeout
     
     def setTrace(self,newTraceCb):
-        assert callable(newTraceCb)
+        assert newTraceCb==None or callable(newTraceCb)
         with self.dataLock:
             self.traceCb     = newTraceCb
     
+    def setMode(self,newMode):
+        assert newMode in self.MODE_ALL
+        with self.dataLock:
+            self.mode        = newMode
+    
+    def setWindow(self,newWindow):
+        assert type(newWindow)==int and newWindow>0
+        with self.dataLock:
+            self.window      = newWindow
+    
     #===== run test
     
     def test(self,blocking=True):
@@ -118,31 +151,151 @@ class SerialTester(threading.Thread):
         else:
             threading.Thread(target=self._runtest).start()
     
+    def sweep(self,testPktLens,blocking=True):
+        '''
+        \brief Run a test for each test packet length, e.g. to plot the
+               throughput against the frame size.
+        
+        \param testPktLens The list of test packet lengths, in bytes.
+        
+        The results are retrieved with getSweepResults().
+        '''
+        if blocking:
+            self._runsweep(testPktLens)
+        else:
+            threading.Thread(target=self._runsweep,args=(testPktLens,)).start()
+    
     #===== get test results
     
     def getStats(self):
+        '''
+        \brief Retrieve the results of the last test.
+        
+        \returns A dictionary with:
+                 - 'numSent', 'numOk', 'numCorrupted', 'numTimeout': the
+                   number of packets sent, echoed correctly, echoed
+                   corrupted, and not echoed in time.
+                 - 'numUnexpected': echoes which did not match any packet
+                   in flight, e.g. arriving after their timeout.
+                 - 'numBytesOk': the bytes of the packets echoed correctly.
+                 - 'duration': the duration of the test, in s.
+                 - 'throughputBps', 'throughputFps': the bytes and packets
+                   echoed correctly per s.
+                 - 'loss': the fraction of the packets sent which were not
+                   echoed.
+                 - 'rtt': a dictionary with the 'min', 'p50', 'p90', 'p99'
+                   and 'max' round-trip times, in s (None if no packet was
+                   echoed).
+        '''
         returnVal = None
         with self.dataLock:
             returnVal = self.stats.copy()
+            returnVal['rtt'] = self.stats['rtt'].copy()
         return returnVal
     
+    def getSweepResults(self):
+        '''
+        \returns A list of (testPktLen,stats) tuples, one per length of the
+                 last sweep, where stats is as returned by getStats().
+        '''
+        with self.dataLock:
+            return list(self.sweepResults)
+    
     #======================== private =========================================
     
+    def _handleFrame(self,input):
+        
+        # handle input
+        if (chr(input[0])==chr(OpenParser.OpenParser.SERFRAME_MOTE2PC_DATA)):
+            
+            # don't handle if I'm not testing
+            with self.dataLock:
+                if not self.busyTesting:
+                    return
+            
+            with self.dataLock:
+                # record what I just received
+                self.lastReceived = input[1+2+5:] # type (1B), moteId (2B), ASN (5B)
+                
+                if self.mode==self.MODE_PIPELINED:
+                    self._handleEcho(self.lastReceived)
+                else:
+                    # wake up other thread
+                    self.waitForReply.set()
+    
+    def _handleEcho(self,received):
+        '''
+        \brief Match an echo to the packet in flight it answers.
+        
+        \note Called with dataLock held.
+        '''
+        now    = time.time()
+        seqNum = None
+        if len(received)>=self.SEQNUM_FORMAT.size:
+            (seqNum,) = self.SEQNUM_FORMAT.unpack(''.join([chr(b) for b in received[:self.SEQNUM_FORMAT.size]]))
+        
+        if seqNum not in self.inFlight:
+            self.stats['numUnexpected']         += 1
+            self._log('!! unexpected: {0}'.format(self.formatList(received)))
+            return
+        
+        (sentTime,sent) = self.inFlight.pop(seqNum)
+        self.rtts.append(now-sentTime)
+        if received==sent:
+            self.stats['numOk']                 += 1
+            self.stats['numBytesOk']            += len(sent)
+        else:
+            self.stats['numCorrupted']          += 1
+            self._log('!! corrupted: {0}'.format(self.formatList(received)))
+        
+        self.inFlightChanged.notify()
+    
+    def _runsweep(self,testPktLens):
+        
+        with self.dataLock:
+            self.sweepResults = []
+            testPktLen        = self.testPktLen
+        
+        for l in testPktLens:
+            self.setTestPktLength(l)
+            self._runtest()
+            with self.dataLock:
+                self.sweepResults += [(l,self.getStats())]
+        
+        self.setTestPktLength(testPktLen)
+    
     def _runtest(self):
         
         # I'm testing
         with self.dataLock:
             self.busyTesting = True
-            
+            mode             = self.mode
+        
+        # reset stats
+        self._resetStats()
+        
+        start = time.time()
+        if mode==self.MODE_PIPELINED:
+            self._runtestPipelined()
+        else:
+            self._runtestStopAndWait()
+        
+        # summarize
+        with self.dataLock:
+            self._summarize(time.time()-start)
+        
+        # I'm not testing
+        with self.dataLock:
+            self.busyTesting = False
+    
+    def _runtestStopAndWait(self):
+        
         # gather test parameters
         with self.dataLock:
             testPktLen = self.testPktLen
             numTestPkt = self.numTestPkt
             timeout    = self.timeout
         
-        # reset stats
-        self._resetStats()
-        
         # send packets and collect stats
         for i in range(numTestPkt):
             
@@ -157,15 +310,14 @@ class SerialTester(threading.Thread):
                 self.lastSent = packetToSend[:]
             
             # send
-            self.socket.send(''.join([chr(OpenParser.OpenParser.SERFRAME_PC2MOTE_TRIGGERSERIALECHO)]+[chr(b) for b in packetToSend]))
-            with self.dataLock:
-                self.stats['numSent']                 += 1
+            self.waitForReply.clear()
+            sentTime = time.time()
+            self._send(packetToSend)
             
             # log
             self._log('sent:     {0}'.format(self.formatList(self.lastSent)))
             
             # wait for answer
-            self.waitForReply.clear()
             if self.waitForReply.wait(timeout):
                 
                 # log
@@ -173,8 +325,10 @@ class SerialTester(threading.Thread):
                 
                 # echo received
                 with self.dataLock:
+                    self.rtts.append(time.time()-sentTime)
                     if self.lastReceived==self.lastSent:
                         self.stats['numOk']           += 1
+                        self.stats['numBytesOk']      += len(self.lastSent)
                     else:
                         self.stats['numCorrupted']    += 1
                         self._log('!! corrupted.')
@@ -183,10 +337,81 @@ class SerialTester(threading.Thread):
                 with self.dataLock:
                     self.stats['numTimeout']          += 1
                     self._log('!! timeout.')
+    
+    def _runtestPipelined(self):
         
-        # I'm not testing
+        # gather test parameters
         with self.dataLock:
-            self.busyTesting = False
+            testPktLen = max(self.testPktLen,self.SEQNUM_FORMAT.size)
+            numTestPkt = self.numTestPkt
+            timeout    = self.timeout
+            window     = self.window
+            self.inFlight = {}
+        
+        # send packets, keeping up to window of them in flight
+        for seqNum in range(numTestPkt):
+            
+            # prepare sequence-numbered random packet to send
+            packetToSend  = [ord(c) for c in self.SEQNUM_FORMAT.pack(seqNum)]
+            packetToSend += [random.randint(0x00,0xff) for _ in range(testPktLen-len(packetToSend))]
+            
+            with self.dataLock:
+                while len(self.inFlight)>=window:
+                    self._waitInFlight(timeout)
+                self.inFlight[seqNum] = (time.time(),packetToSend)
+                self.lastSent         = packetToSend
+            
+            self._send(packetToSend)
+        
+        # wait for the last echoes
+        with self.dataLock:
+            while self.inFlight:
+                self._waitInFlight(timeout)
+    
+    def _waitInFlight(self,timeout):
+        '''
+        \brief Wait for an echo, or for the oldest packet in flight to time
+               out.
+        
+        \note Called with dataLock held.
+        '''
+        oldest = min([t for (t,_) in self.inFlight.values()])
+        delay  = oldest+timeout-time.time()
+        if delay>0:
+            self.inFlightChanged.wait(delay)
+        
+        # expire the packets which timed out
+        now = time.time()
+        for (seqNum,(sentTime,_)) in self.inFlight.items():
+            if now-sentTime>=timeout:
+                del self.inFlight[seqNum]
+                self.stats['numTimeout']              += 1
+                self._log('!! timeout, seqNum {0}.'.format(seqNum))
+    
+    def _send(self,packetToSend):
+        self.socket.sendall(self.framer.encode(''.join([chr(OpenParser.OpenParser.SERFRAME_PC2MOTE_TRIGGERSERIALECHO)]+[chr(b) for b in packetToSend])))
+        with self.dataLock:
+            self.stats['numSent']                     += 1
+    
+    def _summarize(self,duration):
+        '''
+        \brief Fill in the throughput, loss and RTT stats of the test.
+        
+        \note Called with dataLock held.
+        '''
+        self.stats['duration']          = duration
+        if duration>0:
+            self.stats['throughputBps'] = self.stats['numBytesOk']/duration
+            self.stats['throughputFps'] = self.stats['numOk']/duration
+        if self.stats['numSent']:
+            self.stats['loss']          = float(self.stats['numTimeout'])/self.stats['numSent']
+        
+        rtts                            = sorted(self.rtts)
+        if rtts:
+            self.stats['rtt']['min']    = rtts[0]
+            for p in self.RTT_PERCENTILES:
+                self.stats['rtt']['p{0}'.format(p)] = rtts[min(len(rtts)-1,len(rtts)*p/100)]
+            self.stats['rtt']['max']    = rtts[-1]
     
     def _log(self,msg):
         log.debug(msg)
@@ -196,11 +421,21 @@ class SerialTester(threading.Thread):
     
     def _resetStats(self):
         with self.dataLock:
+            self.rtts                 = []
             self.stats                = {
                 'numSent'             : 0,
                 'numOk'               : 0,
                 'numCorrupted'        : 0,
                 'numTimeout'          : 0,
+                'numUnexpected'       : 0,
+                'numBytesOk'          : 0,
+                'duration'            : None,
+                'throughputBps'       : None,
+                'throughputFps'       : None,
+                'loss'                : None,
+                'rtt'                 : dict(
+                    [(k,None) for k in ['min']+['p{0}'.format(p) for p in self.RTT_PERCENTILES]+['max']]
+                ),
             }
     
     def formatList(self,l):
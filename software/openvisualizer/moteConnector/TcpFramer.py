@@ -0,0 +1,100 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('TcpFramer')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import struct
+
+class TcpFramerException(Exception):
+    pass
+
+class TcpFramer(object):
+    '''
+    \brief Delimits the frames exchanged over the TCP connection between a
+           moteProbe and a moteConnector.
+    
+    Two framings are supported:
+    - FRAMING_RAW: frames are written as is, and each recv() is taken for a
+      single frame. This is the historical behavior; it breaks as soon as
+      TCP coalesces or splits frames.
+    - FRAMING_LENGTH: each frame is preceded by its length, on 2 bytes, in
+      network byte order. The decoder is incremental, so any number of
+      frames, or part of a frame, can be passed at once.
+    
+    Both ends of a connection need to use the same framing. Use one
+    TcpFramer per connection, the decoder keeps the partial frame received
+    so far.
+    '''
+    
+    FRAMING_RAW               = 'raw'
+    FRAMING_LENGTH            = 'length'
+    FRAMING_ALL               = [FRAMING_RAW,
+                                 FRAMING_LENGTH,]
+    
+    LENGTH_FORMAT             = '>H'
+    LENGTH_SIZE               = struct.calcsize(LENGTH_FORMAT)
+    MAX_FRAME_LENGTH          = 0xffff
+    
+    def __init__(self,framing=FRAMING_RAW):
+        assert framing in self.FRAMING_ALL
+        
+        # store params
+        self.framing              = framing
+        
+        # local variables
+        self.rxBuf                = bytearray()
+    
+    #======================== public ==========================================
+    
+    def encode(self,frame):
+        '''
+        \brief Frame a string of bytes before writing it to the socket.
+        
+        \param frame The frame to send, a string.
+        
+        \returns The string to write to the socket.
+        '''
+        if self.framing==self.FRAMING_RAW:
+            return frame
+        
+        if len(frame)>self.MAX_FRAME_LENGTH:
+            raise TcpFramerException('frame too long ({0} bytes)'.format(len(frame)))
+        return struct.pack(self.LENGTH_FORMAT,len(frame))+frame
+    
+    def decode(self,rxBytes):
+        '''
+        \brief Extract the frames from bytes read from the socket.
+        
+        \param rxBytes The bytes read, a string.
+        
+        \returns The list of complete frames, as strings. Empty if rxBytes
+                 only contains the beginning of a frame.
+        '''
+        if self.framing==self.FRAMING_RAW:
+            if rxBytes:
+                return [rxBytes]
+            return []
+        
+        self.rxBuf   += rxBytes
+        returnVal     = []
+        pos           = 0
+        while len(self.rxBuf)-pos>=self.LENGTH_SIZE:
+            (length,) = struct.unpack_from(self.LENGTH_FORMAT,buffer(self.rxBuf),pos)
+            end       = pos+self.LENGTH_SIZE+length
+            if end>len(self.rxBuf):
+                break
+            returnVal.append(str(self.rxBuf[pos+self.LENGTH_SIZE:end]))
+            pos       = end
+        if pos:
+            del self.rxBuf[:pos]
+        
+        return returnVal
+    
+    def reset(self):
+        '''
+        \brief Discard the partial frame, e.g. when the connection is lost.
+        '''
+        del self.rxBuf[:]
@@ -8,11 +8,15 @@ log.addHandler(NullHandler())
 
 import threading
 import socket
+import time
 
 from pydispatch import dispatcher
 
 import OpenParser
 import ParserException
+import openvisualizer_utils as u
+import TcpFramer
+import MoteConnectorRouter
 
 class moteConnector(threading.Thread):
     
@@ -20,7 +24,37 @@ class moteConnector(threading.Thread):
     SERFRAME_MOTE2PC_ERROR   = OpenParser.OpenParser.SERFRAME_MOTE2PC_ERROR
     SERFRAME_MOTE2PC_DATA    = OpenParser.OpenParser.SERFRAME_MOTE2PC_DATA
     
-    def __init__(self,moteProbeIp,moteProbeTcpPort):
+    RX_BUF_SIZE              = 4096
+    RECONNECT_DELAY_MIN      = 0.1          ##< delay before reconnecting to the moteProbe, in s, doubled at each failure
+    RECONNECT_DELAY_MAX      = 5.0          ##< max. delay before reconnecting, in s
+    BATCH_SUBTYPES           = ['status']   ##< event subtypes dispatched as one list per burst in batch mode
+    
+    def __init__(self,moteProbeIp,moteProbeTcpPort,framing=TcpFramer.TcpFramer.FRAMING_RAW,batch=False,pipe=None,direct=False):
+        '''
+        \param moteProbeIp      The IP address of the moteProbe.
+        \param moteProbeTcpPort The TCP port of the moteProbe.
+        \param framing          The TcpFramer framing used by the moteProbe.
+        \param batch            If True, the frames completed by a same recv()
+                                are parsed together, and the notifications of
+                                the BATCH_SUBTYPES are dispatched as a single
+                                list, rather than one at a time.
+        \param pipe             The moteProbePipe of the moteProbe (see
+                                moteProbe.getPipe()) to exchange the frames
+                                through, in-process, None to connect to its
+                                TCP port. moteProbeIp and moteProbeTcpPort
+                                then only name this moteConnector.
+        \param direct           If True, the notifications are sent to the
+                                MoteConnectorConsumers created with
+                                direct=True, through the
+                                MoteConnectorRouter, rather than dispatched.
+                                The dispatcher is bypassed: receivers of
+                                the 'inputFromMoteProbe.*' signals connected
+                                with dispatcher.connect() receive nothing,
+                                they must register with the
+                                MoteConnectorRouter instead, e.g. a
+                                moteProbeVirtualMoteFarm created with
+                                direct=True.
+        '''
         
         # log
         log.debug("creating instance")
@@ -28,12 +62,21 @@ class moteConnector(threading.Thread):
         # store params
         self.moteProbeIp               = moteProbeIp
         self.moteProbeTcpPort          = moteProbeTcpPort
+        self.batch                     = batch
+        self.pipe                      = pipe
+        self.direct                    = direct
         
         # local variables
+        self.socketLock                = threading.Lock()   ##< protects socket and connected, replaced at each reconnection
         self.socket                    = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connected                 = False
+        self.framer                    = TcpFramer.TcpFramer(framing)
         self.parser                    = OpenParser.OpenParser()
         self.goOn                      = True
         self._subcribedDataForDagRoot  = False
+        self.router                    = None
+        if self.direct:
+            self.router                = MoteConnectorRouter.MoteConnectorRouter()
         
         # initialize parent class
         threading.Thread.__init__(self)
@@ -46,11 +89,16 @@ class moteConnector(threading.Thread):
             self._updateConnectedToDagRoot,
             signal='infoDagRoot',
         )
-        
+    
     def run(self):
         # log
         log.debug("starting to run")
-    
+        
+        if self.pipe:
+            self._runPipe()
+            return
+        
+        reconnectDelay = self.RECONNECT_DELAY_MIN
         while self.goOn:
             try:
                 # log
@@ -58,35 +106,33 @@ class moteConnector(threading.Thread):
                 
                 # connect
                 self.socket.connect((self.moteProbeIp,self.moteProbeTcpPort))
+                self.framer.reset()
+                with self.socketLock:
+                    self.connected = True
+                reconnectDelay = self.RECONNECT_DELAY_MIN
                 while True:
                     # retrieve the string of bytes from the socket
-                    inputString                  = self.socket.recv(1024)
-                    
-                    # convert to a byte array
-                    input                        = [ord(c) for c in inputString]
-                    
-                    # log
-                    log.debug("received input={0}".format(input))
+                    inputString                  = self.socket.recv(self.RX_BUF_SIZE)
+                    if not inputString:
+                        raise socket.error('connection closed by moteProbe')
                     
-                    # parse input
-                    try:
-                        (eventSubType,parsedNotif)  = self.parser.parseInput(input)
-                        assert isinstance(eventSubType,str)
-                    except ParserException.ParserException as err:
-                        # log
-                        log.error(str(err))
-                        pass
+                    # handle the frames it completes
+                    if self.batch:
+                        self._handleFrames(self.framer.decode(inputString))
                     else:
-                        # dispatch                            
-                        dispatcher.send(
-                            signal        = 'inputFromMoteProbe.'+eventSubType,
-                            sender        = self.name,
-                            data          = parsedNotif,
-                        )
-                
+                        for frame in self.framer.decode(inputString):
+                            self._handleFrame(frame)
+            
             except socket.error as err:
                 log.error(err)
-                pass
+                
+                # a socket cannot connect again, start over with a new one
+                with self.socketLock:
+                    self.socket.close()
+                    self.socket    = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    self.connected = False
+                time.sleep(reconnectDelay)
+                reconnectDelay = min(reconnectDelay*2,self.RECONNECT_DELAY_MAX)
     
     #======================== public ==========================================
     
@@ -107,7 +153,7 @@ class moteConnector(threading.Thread):
                 )
                 
                 self._subcribedDataForDagRoot = True
-            
+        
         else:
             # this moteConnector is *not* connected to a DAGroot
             
@@ -121,13 +167,95 @@ class moteConnector(threading.Thread):
                 self._subcribedDataForDagRoot = False
     
     def write(self,data,headerByte=chr(OpenParser.OpenParser.SERFRAME_MOTE2PC_DATA)):
-        try:
-            self.socket.send(headerByte+data)
-        except socket.error:
-            log.error(err)
-            pass
+        '''
+        \brief Send a frame to the mote, through the moteProbe.
+        
+        \returns False if the frame was dropped, e.g. while reconnecting to
+                 the moteProbe.
+        '''
+        if self.pipe:
+            return self.pipe.write(headerByte+data)
+        with self.socketLock:
+            if not self.connected:
+                log.warning('not connected to moteProbe, dropped {0} bytes'.format(len(data)+1))
+                return False
+            try:
+                self.socket.sendall(self.framer.encode(headerByte+data))
+            except socket.error as err:
+                log.error(err)
+                return False
+        return True
     
     def quit(self):
         raise NotImplementedError()
     
-    #======================== private =========================================
\ No newline at end of file
+    #======================== private =========================================
+    
+    def _runPipe(self):
+        
+        # log
+        log.debug("reading from the pipe of moteProbe@{0}:{1}".format(self.moteProbeIp,self.moteProbeTcpPort))
+        
+        while self.goOn:
+            # retrieve all the frames pending
+            frames = self.pipe.get()
+            if frames==None:
+                break
+            
+            # handle them
+            if self.batch:
+                self._handleFrames(frames)
+            else:
+                for frame in frames:
+                    self._handleFrame(frame)
+    
+    def _dispatch(self,eventSubType,data):
+        if self.router:
+            self.router.send(
+                'inputFromMoteProbe.'+eventSubType,
+                self.name,
+                data,
+            )
+        else:
+            dispatcher.send(
+                signal        = 'inputFromMoteProbe.'+eventSubType,
+                sender        = self.name,
+                data          = data,
+            )
+    
+    def _handleFrame(self,input):
+        
+        # log
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("received input={0}".format(u.formatBuf(input)))
+        
+        # parse input, straight from the string received
+        try:
+            (eventSubType,parsedNotif)  = self.parser.parseInput(input)
+            assert isinstance(eventSubType,str)
+        except ParserException.ParserException as err:
+            # log
+            log.error(str(err))
+            pass
+        else:
+            # dispatch
+            self._dispatch(eventSubType,parsedNotif)
+    
+    def _handleFrames(self,frames):
+        
+        if not frames:
+            return
+        
+        # log
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("received {0} frames".format(len(frames)))
+        
+        # parse the whole burst
+        for (eventSubType,parsedNotifs) in self.parser.parseBatch(frames).items():
+            if eventSubType in self.BATCH_SUBTYPES:
+                # dispatch all notifications at once
+                self._dispatch(eventSubType,parsedNotifs)
+            else:
+                # dispatch one at a time
+                for parsedNotif in parsedNotifs:
+                    self._dispatch(eventSubType,parsedNotif)
@@ -0,0 +1,207 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteConnector/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import threading
+import time
+
+import pytest
+
+from pydispatch import dispatcher
+
+import MoteConnectorConsumer
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_consumer.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_consumer')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_consumer',
+                        'moteConnectorConsumer',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+SIGNAL  = 'inputFromMoteProbe.test'
+TIMEOUT = 10.0
+
+#============================ helpers =========================================
+
+def _waitFor(condition):
+    start = time.time()
+    while not condition():
+        assert time.time()-start<TIMEOUT
+        time.sleep(0.01)
+
+def _consumer(received,signal=SIGNAL,sender=dispatcher.Any,**kwargs):
+    '''
+    \brief Create a consumer appending what it is called with to received.
+
+    The consumer is not started, so it queues what it is sent.
+    '''
+    consumer = MoteConnectorConsumer.MoteConnectorConsumer(
+        signal        = signal,
+        sender        = sender,
+        notifCallback = received.append,
+        **kwargs
+    )
+    consumer.daemon = True
+    return consumer
+
+#============================ tests ===========================================
+
+def test_dispatcher():
+    '''
+    \brief Notifications are consumed in order, from the expected sender.
+    '''
+
+    log.debug("\n---------- test_dispatcher")
+
+    received = []
+    consumer = _consumer(received,signal=SIGNAL+'.dispatcher',sender='moteConnector@a')
+    consumer.start()
+
+    for i in range(10):
+        for sender in ['moteConnector@a','moteConnector@b']:
+            dispatcher.send(
+                signal = SIGNAL+'.dispatcher',
+                sender = sender,
+                data   = i,
+            )
+    _waitFor(lambda: len(received)==10)
+
+    assert received==range(10)
+    assert consumer.getStats()['numCallbacks']==10
+
+def test_dropNewest():
+    '''
+    \brief A full queue drops the new notifications, without raising.
+    '''
+
+    log.debug("\n---------- test_dropNewest")
+
+    received = []
+    consumer = _consumer(
+        received,
+        queueSize = 5,
+        policy    = MoteConnectorConsumer.MoteConnectorConsumer.POLICY_DROP_NEWEST,
+    )
+
+    assert [consumer.put(i) for i in range(8)]==[True]*5+[False]*3
+
+    stats = consumer.getStats()
+    assert (stats['numQueued'],stats['numDropped'],stats['depth'],stats['maxDepth'])==(5,3,5,5)
+
+    consumer.start()
+    _waitFor(lambda: len(received)==5)
+    assert received==range(5)
+
+def test_block():
+    '''
+    \brief A full queue makes the sender wait for room, up to blockTimeout.
+    '''
+
+    log.debug("\n---------- test_block")
+
+    BLOCK_TIMEOUT = 0.2
+
+    # nobody consumes: the sender gives up
+    received = []
+    consumer = _consumer(received,queueSize=2,blockTimeout=BLOCK_TIMEOUT)
+    assert consumer.policy==MoteConnectorConsumer.MoteConnectorConsumer.POLICY_BLOCK
+
+    assert consumer.put(0) and consumer.put(1)
+    start    = time.time()
+    assert not consumer.put(2)
+    assert time.time()-start>=BLOCK_TIMEOUT*0.9
+    stats    = consumer.getStats()
+    assert (stats['numBlocked'],stats['numDropped'])==(1,1)
+
+    # a slow consumer: the sender waits, nothing is lost
+    received = []
+    def _slow(data):
+        time.sleep(0.01)
+        received.append(data)
+    consumer = MoteConnectorConsumer.MoteConnectorConsumer(
+        signal        = SIGNAL,
+        sender        = dispatcher.Any,
+        notifCallback = _slow,
+        queueSize     = 2,
+        blockTimeout  = TIMEOUT,
+    )
+    consumer.daemon = True
+    consumer.start()
+
+    assert all([consumer.put(i) for i in range(20)])
+    _waitFor(lambda: len(received)==20)
+
+    stats    = consumer.getStats()
+    assert received==range(20)
+    assert stats['numBlocked']>0
+    assert stats['numDropped']==0
+
+def test_coalesce():
+    '''
+    \brief A full queue replaces the latest notification with the same key.
+    '''
+
+    log.debug("\n---------- test_coalesce")
+
+    received = []
+    consumer = _consumer(
+        received,
+        queueSize   = 3,
+        policy      = MoteConnectorConsumer.MoteConnectorConsumer.POLICY_COALESCE,
+        coalesceKey = lambda data: data[0],
+    )
+
+    for data in [('a',1),('b',1),('c',1),('a',2),('b',2),('d',1)]:
+        consumer.put(data)
+
+    stats = consumer.getStats()
+    assert (stats['numQueued'],stats['numCoalesced'],stats['numDropped'])==(3,2,1)
+
+    consumer.start()
+    _waitFor(lambda: len(received)==3)
+    assert received==[('a',2),('b',2),('c',1)]
+
+def test_batch():
+    '''
+    \brief In batch mode, the callback gets lists of up to batchSize
+           notifications.
+    '''
+
+    log.debug("\n---------- test_batch")
+
+    received = []
+    consumer = _consumer(received,batchSize=4)
+
+    for i in range(10):
+        consumer.put(i)
+    consumer.start()
+    _waitFor(lambda: sum([len(batch) for batch in received])==10)
+
+    assert received==[[0,1,2,3],[4,5,6,7],[8,9]]
+    assert consumer.getStats()['numCallbacks']==3
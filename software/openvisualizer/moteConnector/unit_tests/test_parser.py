@@ -0,0 +1,226 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteConnector/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import random
+import struct
+import time
+
+import pytest
+
+from pydispatch import dispatcher
+
+import OpenParser
+import ParserException
+import moteConnector
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_parser.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_parser')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_parser',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+BENCHMARK_NUM_FRAMES = 20000
+
+#============================ helpers =========================================
+
+def _statusFrames():
+    '''
+    \brief One status frame per statusElem, as a mote would send them, with
+           random field values.
+    '''
+    parser    = OpenParser.OpenParser()
+    returnVal = []
+    for key in parser.parserStatus.fieldsParsingKeys:
+        payload = ''.join([chr(random.randint(0x00,0xff)) for _ in range(key.size)])
+        returnVal.append('S'+struct.pack('<HB',0x1234,key.val)+payload)
+    return returnVal
+
+def _legacyParseStatus(parser,input):
+    '''
+    \brief Reference status parsing, as done before frames were parsed as
+           strings: the frame is converted to a list of ints, and each field
+           group joined back into a string to be unpacked.
+    '''
+    input               = [ord(c) for c in input]
+    input               = input[OpenParser.OpenParser.HEADER_LENGTH:]
+    (moteId,statusElem) = struct.unpack('<HB',''.join([chr(c) for c in input[:3]]))
+    input               = input[3:]
+    for key in parser.parserStatus.fieldsParsingKeys:
+        if statusElem==key.val:
+            fields = struct.unpack(key.structure,''.join([chr(c) for c in input]))
+            return ('status',parser.parserStatus.named_tuple[key.name](*fields))
+
+def _mixedFrames():
+    '''
+    \brief A replay of status, data, info, error and critical frames, in the
+           proportions a network of motes typically produces them.
+    '''
+    returnVal  = []
+    returnVal += _statusFrames()*4
+    returnVal += ['D'+'\x00'*24+'\x55'*random.randint(0,40) for _ in range(8)]
+    for severity in ['I','E','C']:
+        returnVal += [severity+struct.pack('>HBBHH',0x1234,1,2,3,4)]
+    random.shuffle(returnVal)
+    return returnVal
+
+#============================ tests ===========================================
+
+def test_status():
+
+    log.debug("\n---------- test_status")
+
+    parser = OpenParser.OpenParser()
+
+    for frame in _statusFrames():
+        assert parser.parseInput(frame)==_legacyParseStatus(parser,frame)
+
+def test_statusWrongLength():
+
+    log.debug("\n---------- test_statusWrongLength")
+
+    parser = OpenParser.OpenParser()
+
+    for frame in _statusFrames():
+        for badFrame in [frame[:-1],frame+'\x00']:
+            with pytest.raises(ParserException.ParserException):
+                parser.parseInput(badFrame)
+
+def test_noKey():
+
+    log.debug("\n---------- test_noKey")
+
+    parser = OpenParser.OpenParser()
+
+    with pytest.raises(ParserException.ParserException):
+        parser.parseInput('Z\x00\x00\x00\x00')
+    with pytest.raises(ParserException.ParserException):
+        parser.parseInput('S'+struct.pack('<HB',0x1234,0xff)+'\x00')
+
+def test_data():
+
+    log.debug("\n---------- test_data")
+
+    parser = OpenParser.OpenParser()
+
+    # moteId (2B), ASN (5B), addresses (16B), payload
+    frame  = 'D'+'\x00'*24+'\x55\xaa'
+    assert parser.parseInput(frame)==('data.internet',[0x00,0x55,0xaa])
+
+def test_error():
+
+    log.debug("\n---------- test_error")
+
+    parser = OpenParser.OpenParser()
+
+    # moteId, callingComponent, error_code, arg1, arg2
+    frame  = 'E'+struct.pack('>HBBHH',0x1234,1,2,3,4)
+    assert parser.parseInput(frame)==('error',[ord(c) for c in frame[1:]])
+
+    with pytest.raises(ParserException.ParserException):
+        parser.parseInput(frame[:-1])
+
+def test_parseBatch():
+
+    log.debug("\n---------- test_parseBatch")
+
+    parser = OpenParser.OpenParser()
+    frames = _mixedFrames()+['Z\x00\x00\x00\x00']
+
+    # same results as one frame at a time, grouped by subtype, bad frame skipped
+    expected = {}
+    for frame in frames[:-1]:
+        (eventSubType,parsedNotif) = parser.parseInput(frame)
+        expected.setdefault(eventSubType,[]).append(parsedNotif)
+
+    result = parser.parseBatch(frames)
+    assert dict(result)==expected
+    assert result.keys()[0]==parser.parseInput(frames[0])[0]
+
+def test_batchDispatch():
+
+    log.debug("\n---------- test_batchDispatch")
+
+    connector = moteConnector.moteConnector('127.0.0.1',0,batch=True)
+    frames    = _mixedFrames()
+
+    received = {}
+    def _rx(signal,data):
+        received.setdefault(signal,[]).append(data)
+    dispatcher.connect(_rx,sender=connector.name)
+
+    connector._handleFrames(frames)
+
+    # one notification for all status frames, one per other frame
+    status = [connector.parser.parseInput(f)[1] for f in frames if f[0]=='S']
+    assert received['inputFromMoteProbe.status']==[status]
+    assert len(received['inputFromMoteProbe.data.internet'])==len([f for f in frames if f[0]=='D'])
+    assert len(received['inputFromMoteProbe.error'])==3
+
+def test_benchmark():
+    '''
+    \brief Compare the status frame rate of the legacy parsing to the current
+           one.
+    '''
+
+    log.debug("\n---------- test_benchmark")
+
+    parser = OpenParser.OpenParser()
+    frames = _statusFrames()
+    frames = [frames[i%len(frames)] for i in range(BENCHMARK_NUM_FRAMES)]
+
+    results = {}
+    for (name,parse) in [
+            ('legacy',  lambda frame: _legacyParseStatus(parser,frame)),
+            ('current', parser.parseInput),
+        ]:
+        start = time.clock()
+        for frame in frames:
+            parse(frame)
+        results[name] = BENCHMARK_NUM_FRAMES/(time.clock()-start)
+        log.info("{0}: {1:.0f} status frames/s".format(name,results[name]))
+
+    log.info("speedup: {0:.2f}x".format(results['current']/results['legacy']))
+
+def test_benchmarkMixed():
+    '''
+    \brief Measure the frame rate of the parser over a replay of all frame
+           types.
+    '''
+
+    log.debug("\n---------- test_benchmarkMixed")
+
+    parser = OpenParser.OpenParser()
+    frames = _mixedFrames()
+    frames = [frames[i%len(frames)] for i in range(BENCHMARK_NUM_FRAMES)]
+
+    start = time.clock()
+    for frame in frames:
+        parser.parseInput(frame)
+    log.info("mixed: {0:.0f} frames/s".format(BENCHMARK_NUM_FRAMES/(time.clock()-start)))
@@ -0,0 +1,264 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteConnector/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','moteProbe'))         # moteProbe/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import random
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from pydispatch import dispatcher
+
+import TcpFramer
+import moteConnector
+import moteProbeSocketThread
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_tcpFramer.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_tcpFramer')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_tcpFramer',
+                        'TcpFramer',
+                        'moteProbeSocketThread',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+LOCAL_ADDRESS    = '127.0.0.1'
+STRESS_NUM_FRAMES= 5000
+TIMEOUT          = 10.0
+
+#============================ fixtures ========================================
+
+CHUNKSIZES = [1,2,3,7,64,4096]
+
+@pytest.fixture(params=CHUNKSIZES)
+def chunkSize(request):
+    return request.param
+
+#============================ helpers =========================================
+
+def _randomFrames(num,maxLen=130):
+    return [
+        ''.join([chr(random.randint(0x00,0xff)) for _ in range(random.randint(0,maxLen))])
+        for _ in range(num)
+    ]
+
+def _freeTcpPort():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind((LOCAL_ADDRESS,0))
+    returnVal = s.getsockname()[1]
+    s.close()
+    return returnVal
+
+def _waitFor(condition):
+    start = time.time()
+    while not condition():
+        assert time.time()-start<TIMEOUT
+        time.sleep(0.01)
+
+def _startProbeAndConnector(serialportName):
+    '''
+    \brief Start a moteProbeSocketThread and a moteConnector connected to it
+           through the loopback interface, both length-framed.
+    '''
+    tcpport      = _freeTcpPort()
+
+    socketThread = moteProbeSocketThread.moteProbeSocketThread(
+        tcpport,
+        serialportName,
+        framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+    )
+    socketThread.daemon = True
+    socketThread.start()
+
+    connector    = moteConnector.moteConnector(
+        LOCAL_ADDRESS,
+        tcpport,
+        framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+    )
+    connector.daemon = True
+    connector.start()
+
+    _waitFor(lambda: socketThread.conn!=None and connector.connected)
+
+    return (socketThread,connector)
+
+#============================ tests ===========================================
+
+def test_raw():
+
+    log.debug("\n---------- test_raw")
+
+    framer = TcpFramer.TcpFramer(TcpFramer.TcpFramer.FRAMING_RAW)
+
+    # each read is taken for a frame
+    assert framer.encode('abc')=='abc'
+    assert framer.decode('abc')==['abc']
+    assert framer.decode('')==[]
+
+def test_length(chunkSize):
+
+    log.debug("\n---------- test_length chunkSize={0}".format(chunkSize))
+
+    frames = _randomFrames(200)
+    tx     = TcpFramer.TcpFramer(TcpFramer.TcpFramer.FRAMING_LENGTH)
+    rx     = TcpFramer.TcpFramer(TcpFramer.TcpFramer.FRAMING_LENGTH)
+
+    stream = ''.join([tx.encode(f) for f in frames])
+    assert stream[:2]==struct.pack('>H',len(frames[0]))
+
+    result = []
+    for i in range(0,len(stream),chunkSize):
+        result += rx.decode(stream[i:i+chunkSize])
+    assert result==frames
+    assert len(rx.rxBuf)==0
+
+def test_reset():
+
+    log.debug("\n---------- test_reset")
+
+    framer = TcpFramer.TcpFramer(TcpFramer.TcpFramer.FRAMING_LENGTH)
+
+    assert framer.decode(framer.encode('abcdef')[:4])==[]
+    framer.reset()
+    assert framer.decode(framer.encode('xyz'))==['xyz']
+
+def test_tooLong():
+
+    log.debug("\n---------- test_tooLong")
+
+    framer = TcpFramer.TcpFramer(TcpFramer.TcpFramer.FRAMING_LENGTH)
+
+    with pytest.raises(TcpFramer.TcpFramerException):
+        framer.encode('x'*(TcpFramer.TcpFramer.MAX_FRAME_LENGTH+1))
+
+def test_stressProbeToConnector():
+    '''
+    \brief Frames dispatched back-to-back by the moteProbe are parsed one by
+           one by the moteConnector, however TCP segments them.
+    '''
+
+    log.debug("\n---------- test_stressProbeToConnector")
+
+    serialportName = 'stressProbeToConnector'
+    (socketThread,connector) = _startProbeAndConnector(serialportName)
+
+    received = []
+    def _rx(data):
+        received.append(data)
+    dispatcher.connect(_rx,signal='inputFromMoteProbe.data.internet',sender=connector.name)
+
+    # data frames: type (1B), moteId (2B), ASN (5B), addresses (16B), payload
+    frames = []
+    for i in range(STRESS_NUM_FRAMES):
+        frames.append('D'+'\x00'*23+struct.pack('>H',i)+'\x55'*random.randint(0,10))
+
+    for f in frames:
+        dispatcher.send(
+            signal        = 'bytesFromSerialPort'+serialportName,
+            data          = f,
+        )
+
+    _waitFor(lambda: len(received)==STRESS_NUM_FRAMES)
+    assert received==[[ord(c) for c in f[24:]] for f in frames]
+
+def test_stressConnectorToProbe():
+    '''
+    \brief Frames written back-to-back by the moteConnector are dispatched
+           one by one by the moteProbe.
+    '''
+
+    log.debug("\n---------- test_stressConnectorToProbe")
+
+    serialportName = 'stressConnectorToProbe'
+    (socketThread,connector) = _startProbeAndConnector(serialportName)
+
+    received = []
+    def _rx(data):
+        received.append(data)
+    dispatcher.connect(_rx,signal='bytesFromTcpPort'+serialportName)
+
+    frames = _randomFrames(STRESS_NUM_FRAMES)
+    for f in frames:
+        connector.write(f)
+
+    _waitFor(lambda: len(received)==STRESS_NUM_FRAMES)
+    assert received==['D'+f for f in frames]
+
+def test_reconnect():
+    '''
+    \brief The moteConnector reconnects when the moteProbe closes the
+           connection, and handles the frames of the new one.
+    '''
+
+    log.debug("\n---------- test_reconnect")
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind((LOCAL_ADDRESS,0))
+    server.listen(1)
+    server.settimeout(TIMEOUT)
+
+    connector = moteConnector.moteConnector(
+        LOCAL_ADDRESS,
+        server.getsockname()[1],
+        framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+    )
+    received = []
+    def _rx(data):
+        received.append(data)
+    dispatcher.connect(_rx,signal='inputFromMoteProbe.data.internet',sender=connector.name)
+
+    # frames written while not connected are reported dropped
+    assert connector.write('toMote')==False
+
+    connector.daemon = True
+    connector.start()
+
+    # the moteProbe goes away
+    (conn,_) = server.accept()
+    _waitFor(lambda: connector.connected)
+    assert connector.write('toMote')==True
+    conn.close()
+    _waitFor(lambda: not connector.connected)
+    assert connector.write('toMote')==False
+
+    # the moteConnector comes back, after a delay
+    start = time.time()
+    (conn,_) = server.accept()
+    assert time.time()-start>=moteConnector.moteConnector.RECONNECT_DELAY_MIN/2
+
+    frame = 'D'+'\x00'*23+'\x55'
+    conn.sendall(TcpFramer.TcpFramer(TcpFramer.TcpFramer.FRAMING_LENGTH).encode(frame))
+    _waitFor(lambda: len(received)==1)
+    assert received==[[0x55]]
+
+    conn.close()
+    server.close()
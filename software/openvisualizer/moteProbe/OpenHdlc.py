@@ -12,6 +12,9 @@ log = logging.getLogger('OpenHdlc')
 log.setLevel(logging.ERROR)
 log.addHandler(NullHandler())
 
+import struct
+import binascii
+
 import openvisualizer_utils as u
 
 class HdlcException(Exception):
@@ -61,6 +64,20 @@ class OpenHdlc(object):
         0x7bc7, 0x6a4e, 0x58d5, 0x495c, 0x3de3, 0x2c6a, 0x1ef1, 0x0f78,
     )
     
+    def __init__(self,crcBackend=None):
+        '''
+        \brief Initializer.
+        
+        \param crcBackend The class of the CRC backend to use, e.g.
+                          Fcs16SliceBy4. Defaults to the fastest backend
+                          available, selected at import time.
+        '''
+        if crcBackend is None:
+            crcBackend     = DFLT_CRC_BACKEND
+        
+        # local variables
+        self.crc           = crcBackend()
+    
     #============================ public ======================================
     
     def hdlcify(self,inBuf):
@@ -70,21 +87,17 @@ class OpenHdlc(object):
         \note Use 0x00 for both addr byte, and control byte.
         '''
         
-        # make copy of input
-        outBuf     = inBuf[:]
-        
         # calculate CRC
-        crc        = self.HDLC_CRCINIT
-        for b in outBuf:
-            crc    = self._crcIteration(crc,b)
+        crc        = self.crc.compute(inBuf)
         crc        = 0xffff-crc
         
         # append CRC
-        outBuf     = outBuf + chr(crc & 0xff) + chr((crc & 0xff00) >> 8)
+        outBuf     = inBuf + chr(crc & 0xff) + chr((crc & 0xff00) >> 8)
         
-        # stuff bytes
-        outBuf     = outBuf.replace(self.HDLC_ESCAPE, self.HDLC_ESCAPE+self.HDLC_ESCAPE_ESCAPED)
-        outBuf     = outBuf.replace(self.HDLC_FLAG,   self.HDLC_ESCAPE+self.HDLC_FLAG_ESCAPED)
+        # stuff bytes, only if needed
+        if (self.HDLC_ESCAPE in outBuf) or (self.HDLC_FLAG in outBuf):
+            outBuf = outBuf.replace(self.HDLC_ESCAPE, self.HDLC_ESCAPE+self.HDLC_ESCAPE_ESCAPED)
+            outBuf = outBuf.replace(self.HDLC_FLAG,   self.HDLC_ESCAPE+self.HDLC_FLAG_ESCAPED)
         
         # add flags
         outBuf     = self.HDLC_FLAG + outBuf + self.HDLC_FLAG
@@ -100,37 +113,185 @@ class OpenHdlc(object):
         assert inBuf[ 0]==self.HDLC_FLAG
         assert inBuf[-1]==self.HDLC_FLAG
         
-        # make copy of input
-        outBuf     = inBuf[:]
-        log.debug("got           {0}".format(u.formatBuf(outBuf)))
+        debug      = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug("got           {0}".format(u.formatBuf(inBuf)))
         
         # remove flags
-        outBuf     = outBuf[1:-1]
-        log.debug("after flags:     {0}".format(u.formatBuf(outBuf)))
+        outBuf     = inBuf[1:-1]
         
-        # unstuff
-        outBuf     = outBuf.replace(self.HDLC_ESCAPE+self.HDLC_FLAG_ESCAPED,   self.HDLC_FLAG)
-        outBuf     = outBuf.replace(self.HDLC_ESCAPE+self.HDLC_ESCAPE_ESCAPED, self.HDLC_ESCAPE)
-        log.debug("after unstuff:   {0}".format(u.formatBuf(outBuf)))
+        # unstuff, only if needed
+        if self.HDLC_ESCAPE in outBuf:
+            outBuf = outBuf.replace(self.HDLC_ESCAPE+self.HDLC_FLAG_ESCAPED,   self.HDLC_FLAG)
+            outBuf = outBuf.replace(self.HDLC_ESCAPE+self.HDLC_ESCAPE_ESCAPED, self.HDLC_ESCAPE)
+        if debug:
+            log.debug("after unstuff:   {0}".format(u.formatBuf(outBuf)))
         
         if len(outBuf)<2:
             raise HdlcException('packet too short')
         
         # check CRC
-        crc        = self.HDLC_CRCINIT
-        for b in outBuf:
-            crc    = self._crcIteration(crc,b)
+        crc        = self.crc.compute(outBuf)
         if crc!=self.HDLC_CRCGOOD:
            raise HdlcException('wrong CRC')
         
         # remove CRC
         outBuf     = outBuf[:-2] # remove CRC
-        log.debug("after CRC:       {0}".format(u.formatBuf(outBuf)))
+        if debug:
+            log.debug("after CRC:       {0}".format(u.formatBuf(outBuf)))
         
         return outBuf
 
-    #============================ private =====================================
+#============================ CRC backends ====================================
+
+class Fcs16SliceBy4(object):
+    '''
+    \brief Pure-Python FCS16 computation, consuming 4 bytes per iteration.
+    
+    Tables T1..T3 are derived from OpenHdlc.FCS16TAB (T0): Tk[i] is the CRC
+    register after feeding byte i followed by k zero bytes. This allows
+    folding 4 input bytes into the register with 4 table lookups.
+    '''
+    
+    NAME      = 'sliceBy4'
+    
+    T0        = OpenHdlc.FCS16TAB
+    T1        = tuple([(T0[i]>>8)^T0[T0[i]&0xff] for i in range(256)])
+    T2        = tuple([(T1[i]>>8)^T0[T1[i]&0xff] for i in range(256)])
+    T3        = tuple([(T2[i]>>8)^T0[T2[i]&0xff] for i in range(256)])
+    
+    def compute(self,buf,crc=OpenHdlc.HDLC_CRCINIT):
+        '''
+        \brief Run the bytes of buf through the FCS16 register.
+        
+        \param buf A string of bytes.
+        \param crc The initial value of the register.
+        
+        \returns The value of the register after the last byte.
+        '''
+        (T0,T1,T2,T3) = (self.T0,self.T1,self.T2,self.T3)
+        
+        numWords      = len(buf)>>2
+        
+        # 4 bytes at a time
+        for w in struct.unpack('<{0}I'.format(numWords),buf[:numWords<<2]):
+            x         = crc^(w & 0xffff)
+            crc       = T3[x & 0xff]^T2[x>>8]^T1[(w>>16) & 0xff]^T0[w>>24]
+        
+        # remaining bytes
+        for b in bytearray(buf[numWords<<2:]):
+            crc       = (crc>>8)^T0[(crc^b) & 0xff]
+        
+        return crc
+
+class Fcs16Hqx(object):
+    '''
+    \brief FCS16 computation in C, using binascii.crc_hqx.
+    
+    crc_hqx implements the same polynomial as FCS16, but MSB-first, while
+    HDLC transmits LSB-first. Bit-reversing every input byte (str.translate)
+    as well as the register in and out yields the exact FCS16 value.
+    '''
+    
+    NAME      = 'hqx'
+    
+    REV8      = tuple([int('{0:08b}'.format(i)[::-1],2) for i in range(256)])
+    REV8STR   = ''.join([chr(b) for b in REV8])
+    
+    def compute(self,buf,crc=OpenHdlc.HDLC_CRCINIT):
+        '''
+        \brief Run the bytes of buf through the FCS16 register.
+        
+        \param buf A string of bytes.
+        \param crc The initial value of the register.
+        
+        \returns The value of the register after the last byte.
+        '''
+        REV8          = self.REV8
+        
+        crc           = binascii.crc_hqx(
+                            buf.translate(self.REV8STR),
+                            (REV8[crc & 0xff]<<8) | REV8[crc>>8],
+                        )
+        
+        return (REV8[crc & 0xff]<<8) | REV8[crc>>8]
+
+CRC_BACKENDS     = [Fcs16SliceBy4,Fcs16Hqx]
+
+# select the fastest backend available on this platform
+if hasattr(binascii,'crc_hqx'):
+    DFLT_CRC_BACKEND = Fcs16Hqx
+else:
+    DFLT_CRC_BACKEND = Fcs16SliceBy4
+
+log.debug("using CRC backend {0}".format(DFLT_CRC_BACKEND.NAME))
+
+class HdlcFrameSplitter(object):
+    '''
+    \brief Incremental HDLC frame extractor.
+    
+    Bytes read from the serial port are fed in chunks of arbitrary size; the
+    splitter scans them for HDLC_FLAG boundaries and returns every complete
+    frame (flags included), ready to be passed to OpenHdlc.dehdlcify().
     
-    def _crcIteration(self,crc,b):
-        return (crc>>8)^self.FCS16TAB[((crc^(ord(b))) & 0xff)]
-    
\ No newline at end of file
+    It keeps the start/middle/end-of-frame semantics of the per-byte receive
+    loop: a frame starts on the first non-flag byte which follows a flag, and
+    ends on the next flag. Consecutive flags are skipped, and the closing flag
+    of a frame also acts as the opening flag of the next one.
+    '''
+    
+    def __init__(self):
+        
+        # local variables
+        self.busyReceiving         = False
+        self.inputBuf              = bytearray()
+    
+    #============================ public ======================================
+    
+    def feed(self,rxBytes):
+        '''
+        \brief Feed bytes received from the serial port.
+        
+        \param rxBytes A string of bytes, of any length.
+        
+        \returns A (possibly empty) list of complete HDLC frames, as strings.
+        '''
+        
+        frames     = []
+        pos        = 0
+        numBytes   = len(rxBytes)
+        
+        while pos<numBytes:
+            
+            if not self.busyReceiving:
+                
+                if rxBytes[pos]==OpenHdlc.HDLC_FLAG:
+                    # consecutive flags
+                    
+                    pos                   += 1
+                
+                else:
+                    # start of frame
+                    
+                    self.busyReceiving     = True
+                    self.inputBuf          = bytearray(OpenHdlc.HDLC_FLAG)
+            
+            else:
+                
+                idx = rxBytes.find(OpenHdlc.HDLC_FLAG,pos)
+                
+                if idx==-1:
+                    # middle of frame
+                    
+                    self.inputBuf         += rxBytes[pos:]
+                    break
+                
+                # end of frame
+                
+                self.inputBuf             += rxBytes[pos:idx+1]
+                frames.append(str(self.inputBuf))
+                
+                self.busyReceiving         = False
+                pos                        = idx+1
+        
+        return frames
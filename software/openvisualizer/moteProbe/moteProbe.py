@@ -8,18 +8,61 @@ log.addHandler(NullHandler())
 
 import threading
 
+import moteProbeSerialProtocol
 import moteProbeSerialThread
 import moteProbeSocketThread
+import moteProbePipe
 import utils
 
+from moteConnector import TcpFramer
+
 class moteProbe(object):
     
-    def __init__(self,serialport,tcpport):
+    ENGINE_THREAD           = 'thread'  ##< one serial thread and one socket thread per moteProbe
+    ENGINE_SELECT           = 'select'  ##< all moteProbes served by a single moteProbeSelectLoop thread
+    ENGINE_ALL              = [ENGINE_THREAD,
+                               ENGINE_SELECT,]
+    
+    TRANSPORT_TCP           = 'tcp'     ##< frames exchanged with the moteConnector over the TCP port
+    TRANSPORT_PIPE          = 'pipe'    ##< frames exchanged with the moteConnector in-process, see getPipe()
+    TRANSPORT_ALL           = [TRANSPORT_TCP,
+                               TRANSPORT_PIPE,]
+    
+    def __init__(self,serialport,tcpport,
+            readMode=moteProbeSerialThread.moteProbeSerialThread.READMODE_BULK,
+            engine=ENGINE_THREAD,
+            flowControl=moteProbeSerialProtocol.moteProbeSerialProtocol.FLOWCONTROL_SINGLE,
+            outputBufSize=moteProbeSerialProtocol.moteProbeSerialProtocol.DFLT_OUTPUTBUF_SIZE,
+            outputBufLowWatermark=None,
+            outputBufPolicy=moteProbeSerialProtocol.moteProbeSerialProtocol.DFLT_OUTPUTBUF_POLICY,
+            tcpFraming=TcpFramer.TcpFramer.FRAMING_RAW,
+            capture=None,
+            transport=TRANSPORT_TCP):
+        '''
+        \param capture   A moteProbeCaptureWriter recording the frames
+                         received from the mote, or None.
+        \param transport One of TRANSPORT_ALL. With TRANSPORT_PIPE, no TCP
+                         port is opened: tcpport only identifies the
+                         moteProbe, and the moteConnector is given getPipe().
+        '''
+        assert engine in self.ENGINE_ALL
+        assert transport in self.TRANSPORT_ALL
+        # the capture taps the 'bytesFromSerialPort' signal, which the pipe bypasses
+        assert not (capture and transport==self.TRANSPORT_PIPE)
         
         # store params
         self.serialportName     = serialport[0]
         self.serialportBaudrate = serialport[1]
         self.tcpport            = tcpport
+        self.readMode           = readMode
+        self.engine             = engine
+        self.flowControl        = flowControl
+        self.outputBufSize      = outputBufSize
+        self.outputBufLowWatermark = outputBufLowWatermark
+        self.outputBufPolicy    = outputBufPolicy
+        self.tcpFraming         = tcpFraming
+        self.capture            = capture
+        self.transport          = transport
         
         # log
         log.info("creating moteProbe attaching to {0}@{1}, listening to TCP port {1}".format(
@@ -30,14 +73,55 @@ class moteProbe(object):
         
         # local variables
         self.dataLock     = threading.Lock()
+        self.pipe         = None
+        if self.transport==self.TRANSPORT_PIPE:
+            self.pipe     = moteProbePipe.moteProbePipe()
+        
+        self.serialProtocol = moteProbeSerialProtocol.moteProbeSerialProtocol(
+                                self.serialportName,
+                                self.serialportBaudrate,
+                                flowControl           = self.flowControl,
+                                outputBufSize         = self.outputBufSize,
+                                outputBufLowWatermark = self.outputBufLowWatermark,
+                                outputBufPolicy       = self.outputBufPolicy,
+                                pipe                  = self.pipe,
+                            )
         
-        # declare serial and socket threads
-        self.serialThread = moteProbeSerialThread.moteProbeSerialThread(self.serialportName,self.serialportBaudrate)
-        self.socketThread = moteProbeSocketThread.moteProbeSocketThread(self.tcpport,self.serialportName)
+        # record the frames received before anything else is started
+        if self.capture:
+            self.capture.tap(self.serialportName)
         
-        # start threads
-        self.serialThread.start()
-        self.socketThread.start()
+        if self.engine==self.ENGINE_THREAD:
+            
+            # declare serial and socket threads
+            self.serialThread = moteProbeSerialThread.moteProbeSerialThread(
+                                    self.serialProtocol,
+                                    readMode = self.readMode,
+                                )
+            self.socketThread = None
+            if not self.pipe:
+                self.socketThread = moteProbeSocketThread.moteProbeSocketThread(
+                                    self.tcpport,
+                                    self.serialportName,
+                                    framing  = self.tcpFraming,
+                                )
+            
+            # start threads
+            self.serialThread.start()
+            if self.socketThread:
+                self.socketThread.start()
+        
+        else:
+            
+            # import here, select() on serial ports is POSIX-only
+            import moteProbeSelectLoop
+            
+            # hand over to the loop shared by all moteProbes
+            moteProbeSelectLoop.moteProbeSelectLoop().addMoteProbe(
+                self.serialProtocol,
+                None if self.pipe else self.tcpport,
+                framing  = self.tcpFraming,
+            )
     
     #======================== public ==========================================
     
@@ -61,8 +145,50 @@ class moteProbe(object):
         self.dataLock.release()
         
         return returnVal
+    
+    def getEngine(self):
+        return self.engine
+    
+    def getPipe(self):
+        '''
+        \returns The moteProbePipe to pass to the moteConnector, None with
+                 TRANSPORT_TCP.
+        '''
+        return self.pipe
+    
+    def getStats(self):
+        '''
+        \brief Retrieve the statistics of the frames sent to the mote: queued,
+               sent, dropped, max. depth, queueing latency percentiles, etc.
         
+        \returns A dictionary, see moteProbeSerialProtocol.getStats().
+        '''
+        return self.serialProtocol.getStats()
+    
     def quit(self):
         raise NotImplementedError()
     
-    #======================== private =========================================
\ No newline at end of file
+    #======================== private =========================================
+
+#============================ helpers =========================================
+
+def createMoteProbes(tcpPortStart,serialports=None,engine=moteProbe.ENGINE_THREAD,**kwargs):
+    '''
+    \brief Create a moteProbe for each mote connected to this computer.
+    
+    \param tcpPortStart The TCP port of the first mote, the others are
+                        presented on the following ports.
+    \param serialports  A list of (name,baudrate) tuples, as returned by
+                        utils.findSerialPorts() (the default).
+    \param engine       One of moteProbe.ENGINE_ALL.
+    \param kwargs       Other parameters passed to each moteProbe.
+    
+    \returns The list of moteProbe instances.
+    '''
+    if serialports==None:
+        serialports = utils.findSerialPorts()
+    
+    return [
+        moteProbe(serialport,tcpPortStart+i,engine=engine,**kwargs)
+        for (i,serialport) in enumerate(serialports)
+    ]
@@ -0,0 +1,226 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('moteProbeCapture')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import mmap
+import struct
+import threading
+import time
+
+from pydispatch import dispatcher
+
+class moteProbeCaptureException(Exception):
+    pass
+
+class moteProbeCapture(object):
+    '''
+    \brief Binary format of the capture files.
+    
+    A capture file starts with FILE_HEADER (magic, version), followed by
+    records. Each record is a RECORD_HEADER (type, timestamp, port id,
+    payload length), little endian, followed by its payload:
+    - TYPE_PORT: declares a port id; the payload is the serial port name.
+      It precedes the first frame of that port.
+    - TYPE_FRAME: a frame received from the serial port (i.e. after HDLC
+      decoding); the payload is the frame.
+    
+    Records have a fixed-size header and no trailer, so a file can be
+    appended to as frames arrive, and read through mmap without parsing it
+    first.
+    '''
+    
+    MAGIC                     = 'OVCP'
+    VERSION                   = 1
+    FILE_HEADER               = struct.Struct('<4sB')     # magic, version
+    RECORD_HEADER             = struct.Struct('<BdHH')    # type, timestamp, port id, length
+    
+    TYPE_PORT                 = 0
+    TYPE_FRAME                = 1
+    
+    MAX_PAYLOAD_LENGTH        = 0xffff
+    MAX_PORTS                 = 0xffff
+
+class moteProbeCaptureWriter(moteProbeCapture):
+    '''
+    \brief Records the frames received from serial ports into a capture file.
+    
+    A single writer can record any number of ports. Call tap() to record
+    the frames a moteProbe dispatches for a port, or write() to record
+    frames explicitly.
+    '''
+    
+    def __init__(self,filename,clock=time.time):
+        '''
+        \param filename The capture file, overwritten if it exists.
+        \param clock    Function returning the current time, in s.
+        '''
+        
+        # log
+        log.info("create instance, capturing to {0}".format(filename))
+        
+        # store params
+        self.filename             = filename
+        self.clock                = clock
+        
+        # local variables
+        self.dataLock             = threading.Lock()
+        self.portIds              = {}      ##< serial port name -> port id
+        self.taps                 = []      ##< signals connected by tap()
+        self.stats                = {
+            'numFrames':          0,
+            'numBytes':           0,
+        }
+        self.file                 = open(self.filename,'wb')
+        self.file.write(self.FILE_HEADER.pack(self.MAGIC,self.VERSION))
+    
+    #======================== public ==========================================
+    
+    def tap(self,serialportName):
+        '''
+        \brief Record all the frames received from a serial port.
+        
+        \param serialportName The name of the serial port, as used in the
+                              'bytesFromSerialPort' signal of its moteProbe.
+        '''
+        signal = 'bytesFromSerialPort'+serialportName
+        with self.dataLock:
+            self.taps += [signal]
+        dispatcher.connect(
+            self._tapFrame,
+            signal = signal,
+        )
+    
+    def write(self,serialportName,frame,timestamp=None):
+        '''
+        \brief Record a frame.
+        
+        \param serialportName The name of the serial port it was received on.
+        \param frame          The frame, a string.
+        \param timestamp      The reception time, in s. Defaults to now.
+        '''
+        if timestamp==None:
+            timestamp = self.clock()
+        if len(frame)>self.MAX_PAYLOAD_LENGTH:
+            raise moteProbeCaptureException('frame too long ({0} bytes)'.format(len(frame)))
+        
+        with self.dataLock:
+            
+            # declare the port the first time it is seen
+            portId = self.portIds.get(serialportName)
+            if portId==None:
+                if len(self.portIds)>=self.MAX_PORTS:
+                    raise moteProbeCaptureException('too many ports')
+                portId = len(self.portIds)
+                self.portIds[serialportName] = portId
+                self.file.write(self.RECORD_HEADER.pack(self.TYPE_PORT,timestamp,portId,len(serialportName)))
+                self.file.write(serialportName)
+            
+            self.file.write(self.RECORD_HEADER.pack(self.TYPE_FRAME,timestamp,portId,len(frame)))
+            self.file.write(frame)
+            
+            self.stats['numFrames'] += 1
+            self.stats['numBytes']  += len(frame)
+    
+    def flush(self):
+        with self.dataLock:
+            self.file.flush()
+    
+    def getStats(self):
+        with self.dataLock:
+            return dict(self.stats)
+    
+    def close(self):
+        
+        # log
+        log.info("closing {0}".format(self.filename))
+        
+        with self.dataLock:
+            taps       = self.taps
+            self.taps  = []
+        for signal in taps:
+            dispatcher.disconnect(
+                self._tapFrame,
+                signal = signal,
+            )
+        
+        with self.dataLock:
+            self.file.close()
+    
+    #======================== private =========================================
+    
+    def _tapFrame(self,signal,data):
+        self.write(signal[len('bytesFromSerialPort'):],data)
+
+class moteProbeCaptureReader(moteProbeCapture):
+    '''
+    \brief Reads a capture file, through mmap.
+    
+    Iterating over the reader yields (timestamp,serialportName,frame) tuples,
+    in the order they were recorded. A truncated last record, e.g. when the
+    capture was interrupted, is ignored.
+    '''
+    
+    def __init__(self,filename):
+        
+        # log
+        log.info("create instance, reading {0}".format(filename))
+        
+        # store params
+        self.filename             = filename
+        
+        # local variables
+        self.file                 = open(self.filename,'rb')
+        try:
+            self.buf              = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        except (ValueError,mmap.error) as err:
+            self.file.close()
+            raise moteProbeCaptureException('cannot map {0}: {1}'.format(self.filename,err))
+        
+        if len(self.buf)<self.FILE_HEADER.size:
+            self.close()
+            raise moteProbeCaptureException('{0} is not a capture file'.format(self.filename))
+        (magic,version) = self.FILE_HEADER.unpack_from(self.buf)
+        if magic!=self.MAGIC or version!=self.VERSION:
+            self.close()
+            raise moteProbeCaptureException('{0} is not a capture file, or of an unsupported version'.format(self.filename))
+    
+    def __iter__(self):
+        ports = {}
+        for (recordType,timestamp,portId,payload) in self._records():
+            if recordType==self.TYPE_PORT:
+                ports[portId] = payload
+            elif recordType==self.TYPE_FRAME:
+                yield (timestamp,ports[portId],payload)
+    
+    #======================== public ==========================================
+    
+    def getPortNames(self):
+        '''
+        \returns The names of the ports in the capture, in the order they
+                 first appear.
+        '''
+        return [payload for (recordType,_,_,payload) in self._records() if recordType==self.TYPE_PORT]
+    
+    def close(self):
+        self.buf.close()
+        self.file.close()
+    
+    #======================== private =========================================
+    
+    def _records(self):
+        buf    = self.buf
+        end    = len(buf)
+        pos    = self.FILE_HEADER.size
+        while pos+self.RECORD_HEADER.size<=end:
+            (recordType,timestamp,portId,length) = self.RECORD_HEADER.unpack_from(buf,pos)
+            start = pos+self.RECORD_HEADER.size
+            if start+length>end:
+                break
+            yield (recordType,timestamp,portId,buf[start:start+length])
+            pos    = start+length
+        if pos!=end:
+            log.warning("{0}: ignoring truncated record at offset {1}".format(self.filename,pos))
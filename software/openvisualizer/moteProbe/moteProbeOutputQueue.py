@@ -0,0 +1,158 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('moteProbeOutputQueue')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import threading
+import collections
+import time
+
+class moteProbeOutputQueue(object):
+    '''
+    \brief Bounded queue of the frames waiting to be written to a mote.
+    
+    The queue accepts frames until its depth reaches highWatermark. It then
+    is congested, and stays so until the mote has drained it down to
+    lowWatermark. While congested, each new frame is handled according to
+    the policy:
+    - POLICY_DROP_NEWEST: the new frame is dropped.
+    - POLICY_DROP_OLDEST: the oldest frame is dropped, the new one queued.
+    
+    The time each frame spends in the queue is recorded, over the last
+    LATENCY_SAMPLES frames, so getStats() can report percentiles.
+    '''
+    
+    POLICY_DROP_NEWEST        = 'dropNewest'
+    POLICY_DROP_OLDEST        = 'dropOldest'
+    POLICY_ALL                = [POLICY_DROP_NEWEST,
+                                 POLICY_DROP_OLDEST,]
+    
+    DFLT_HIGH_WATERMARK       = 100     ##< depth at which the queue becomes congested
+    LATENCY_SAMPLES           = 1000    ##< number of queueing latencies kept for the percentiles
+    LATENCY_PERCENTILES       = [50,90,99]
+    
+    def __init__(self,highWatermark=DFLT_HIGH_WATERMARK,lowWatermark=None,policy=POLICY_DROP_NEWEST,clock=time.time):
+        '''
+        \param highWatermark The maximum depth of the queue.
+        \param lowWatermark  The depth below which a congested queue accepts
+                             frames again. Defaults to highWatermark, i.e.
+                             no hysteresis.
+        \param policy        One of POLICY_ALL.
+        \param clock         Function returning the current time, in s.
+        '''
+        if lowWatermark==None:
+            lowWatermark = highWatermark
+        assert 0<=lowWatermark<=highWatermark
+        assert highWatermark>0
+        assert policy in self.POLICY_ALL
+        
+        # store params
+        self.highWatermark        = highWatermark
+        self.lowWatermark         = lowWatermark
+        self.policy               = policy
+        self.clock                = clock
+        
+        # local variables
+        self.dataLock             = threading.Lock()
+        self.queue                = collections.deque()  ##< (enqueue time,frame) tuples
+        self.congested            = False
+        self.latencies            = collections.deque(maxlen=self.LATENCY_SAMPLES)
+        self.stats                = {
+            'numQueued':          0,    ##< frames accepted in the queue
+            'numSent':            0,    ##< frames popped to be written to the mote
+            'numDropped':         0,    ##< frames dropped, new or old
+            'numCongestions':     0,    ##< times the queue reached highWatermark
+            'maxDepth':           0,    ##< highest depth reached
+        }
+    
+    def __len__(self):
+        with self.dataLock:
+            return len(self.queue)
+    
+    #======================== public ==========================================
+    
+    def put(self,frame):
+        '''
+        \brief Add a frame at the tail of the queue.
+        
+        \param frame The frame to add.
+        
+        \returns True if the frame was queued, False if it was dropped.
+        '''
+        with self.dataLock:
+            
+            # enter congestion
+            if (not self.congested) and len(self.queue)>=self.highWatermark:
+                self.congested                  = True
+                self.stats['numCongestions']   += 1
+                log.warning('congested, depth {0}'.format(len(self.queue)))
+            
+            if self.congested:
+                self.stats['numDropped']       += 1
+                if self.policy==self.POLICY_DROP_NEWEST:
+                    return False
+                self.queue.popleft()
+            
+            self.queue.append((self.clock(),frame))
+            self.stats['numQueued']            += 1
+            self.stats['maxDepth']              = max(self.stats['maxDepth'],len(self.queue))
+            
+            return True
+    
+    def get(self,maxNum):
+        '''
+        \brief Pop frames from the head of the queue.
+        
+        \param maxNum The maximum number of frames to pop.
+        
+        \returns A list of up to maxNum frames, oldest first.
+        '''
+        with self.dataLock:
+            now       = self.clock()
+            returnVal = []
+            for _ in range(min(maxNum,len(self.queue))):
+                (ts,frame) = self.queue.popleft()
+                self.latencies.append(now-ts)
+                returnVal.append(frame)
+            self.stats['numSent'] += len(returnVal)
+            
+            # leave congestion
+            if self.congested and len(self.queue)<=self.lowWatermark:
+                self.congested = False
+                log.info('not congested anymore, depth {0}'.format(len(self.queue)))
+            
+            return returnVal
+    
+    def getStats(self):
+        '''
+        \brief Retrieve the counters of the queue.
+        
+        \returns A dictionary with the counters of self.stats, plus:
+                 - 'depth': the current depth.
+                 - 'congested': whether the queue is congested.
+                 - 'latency': a dictionary with the 'p50', 'p90', 'p99' and
+                   'max' queueing latencies of the last frames, in s (None
+                   if no frame was sent yet).
+        '''
+        with self.dataLock:
+            returnVal              = dict(self.stats)
+            returnVal['depth']     = len(self.queue)
+            returnVal['congested'] = self.congested
+            latencies              = sorted(self.latencies)
+        
+        returnVal['latency']       = {}
+        for p in self.LATENCY_PERCENTILES:
+            returnVal['latency']['p{0}'.format(p)] = self._percentile(latencies,p)
+        returnVal['latency']['max'] = latencies[-1] if latencies else None
+        
+        return returnVal
+    
+    #======================== private =========================================
+    
+    def _percentile(self,sortedVals,p):
+        if not sortedVals:
+            return None
+        return sortedVals[min(len(sortedVals)-1,len(sortedVals)*p/100)]
@@ -0,0 +1,160 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('moteProbePipe')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import threading
+import collections
+
+class moteProbePipe(object):
+    '''
+    \brief In-process link between a moteProbe and a moteConnector, in place
+           of the TCP connection on the loopback interface.
+    
+    The frames received from the mote are put() by the serial side of the
+    moteProbe into a bounded FIFO, and the moteConnector get()s them, all
+    those pending at once. The frames the moteConnector write()s are handed
+    straight to the function the serial side connect()ed. Frames are neither
+    framed for TCP nor dispatched: they are dehdlcified strings, passed as
+    is.
+    
+    When the FIFO is full, a new frame is handled according to the policy:
+    - POLICY_DROP_NEWEST: the new frame is dropped, so the serial port keeps
+      being read.
+    - POLICY_BLOCK: the serial side waits for the moteConnector, as it would
+      on a full TCP socket.
+    '''
+    
+    POLICY_DROP_NEWEST        = 'dropNewest'
+    POLICY_BLOCK              = 'block'
+    POLICY_ALL                = [POLICY_DROP_NEWEST,
+                                 POLICY_BLOCK,]
+    
+    DFLT_MAX_SIZE             = 1000    ##< frames pending, from the mote
+    
+    def __init__(self,maxSize=DFLT_MAX_SIZE,policy=POLICY_DROP_NEWEST):
+        '''
+        \param maxSize The maximum number of frames pending in the FIFO.
+        \param policy  One of POLICY_ALL.
+        '''
+        assert maxSize>0
+        assert policy in self.POLICY_ALL
+        
+        # store params
+        self.maxSize              = maxSize
+        self.policy               = policy
+        
+        # local variables
+        self.dataLock             = threading.Lock()
+        self.notEmpty             = threading.Condition(self.dataLock)
+        self.notFull              = threading.Condition(self.dataLock)
+        self.frames               = collections.deque()
+        self.closed               = False
+        self.toMote               = None
+        self.stats                = {
+            'numFrames':          0,    ##< frames put, from the mote
+            'numDropped':         0,    ##< frames dropped, the FIFO being full
+            'numBlocked':         0,    ##< frames put after waiting for room
+            'maxDepth':           0,    ##< highest depth reached
+            'numWrites':          0,    ##< frames written, to the mote
+        }
+    
+    #======================== public ==========================================
+    
+    #===== moteProbe side
+    
+    def connect(self,toMote):
+        '''
+        \param toMote Function called with each frame written to the mote.
+        '''
+        with self.dataLock:
+            self.toMote = toMote
+    
+    def put(self,frame):
+        '''
+        \brief Queue a frame received from the mote.
+        
+        \param frame The dehdlcified frame, a string.
+        
+        \returns True if the frame was queued, False if it was dropped.
+        '''
+        assert isinstance(frame,str)
+        with self.dataLock:
+            if len(self.frames)>=self.maxSize and not self.closed:
+                if self.policy==self.POLICY_DROP_NEWEST:
+                    self.stats['numDropped']   += 1
+                    return False
+                self.stats['numBlocked']       += 1
+                while len(self.frames)>=self.maxSize and not self.closed:
+                    self.notFull.wait()
+            if self.closed:
+                return False
+            self.frames.append(frame)
+            self.stats['numFrames']            += 1
+            self.stats['maxDepth']              = max(self.stats['maxDepth'],len(self.frames))
+            self.notEmpty.notify()
+            return True
+    
+    #===== moteConnector side
+    
+    def get(self):
+        '''
+        \brief Wait for frames from the mote.
+        
+        \returns The list of all the frames pending, oldest first, or None
+                 once the pipe is closed.
+        '''
+        with self.dataLock:
+            while not self.frames and not self.closed:
+                self.notEmpty.wait()
+            if self.closed:
+                return None
+            returnVal   = list(self.frames)
+            self.frames.clear()
+            self.notFull.notify_all()
+            return returnVal
+    
+    def write(self,frame):
+        '''
+        \brief Write a frame to the mote.
+        
+        \param frame The frame, starting with its header byte, a string.
+        
+        \returns False if the frame was dropped, no moteProbe being
+                 connected.
+        '''
+        with self.dataLock:
+            toMote = self.toMote
+            self.stats['numWrites']            += 1
+        if toMote:
+            toMote(frame)
+            return True
+        else:
+            log.warning('no moteProbe connected, dropped {0} bytes'.format(len(frame)))
+            return False
+    
+    #===== both
+    
+    def close(self):
+        '''
+        \brief Wake up both sides, get() returns None from now on.
+        '''
+        with self.dataLock:
+            self.closed = True
+            self.notEmpty.notify_all()
+            self.notFull.notify_all()
+    
+    def getStats(self):
+        '''
+        \returns A dictionary with the counters of self.stats, plus the
+                 current 'depth'.
+        '''
+        with self.dataLock:
+            returnVal          = dict(self.stats)
+            returnVal['depth'] = len(self.frames)
+        return returnVal
+    
+    #======================== private =========================================
@@ -0,0 +1,168 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('moteProbeReplay')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import threading
+import time
+
+from pydispatch import dispatcher
+
+import moteProbeCapture
+import moteProbeSocketThread
+
+from moteConnector import TcpFramer
+
+class moteProbeReplay(threading.Thread):
+    '''
+    \brief Replays a capture file as if the motes were connected.
+    
+    The recorded frames are dispatched on the 'bytesFromSerialPort' signal
+    of their port, as the moteProbe of that port would. When tcpPortStart is
+    given, a moteProbeSocketThread presents each port on a TCP port, so
+    moteConnectors connect to the replay as they would to moteProbes.
+    
+    The frames are replayed at their original pace multiplied by speed, or
+    back-to-back when speed is SPEED_MAX.
+    '''
+    
+    SPEED_MAX                 = None    ##< replay as fast as possible
+    CONNECT_TIMEOUT           = 10.0    ##< max. time waited for the moteConnectors to connect, in s
+    
+    def __init__(self,filename,tcpPortStart=None,speed=1.0,tcpFraming=TcpFramer.TcpFramer.FRAMING_RAW,waitForConnections=True):
+        '''
+        \param filename           The capture file.
+        \param tcpPortStart       The TCP port of the first port of the
+                                  capture, the others are presented on the
+                                  following ports. None to only dispatch the
+                                  frames.
+        \param speed              The replay speed factor, e.g. 2.0 replays
+                                  twice as fast as recorded, or SPEED_MAX.
+        \param tcpFraming         The TcpFramer framing used on the TCP ports.
+        \param waitForConnections If True, the replay only starts once a
+                                  moteConnector is connected to each TCP
+                                  port, or after CONNECT_TIMEOUT.
+        '''
+        assert speed==self.SPEED_MAX or speed>0
+        
+        # log
+        log.info("create instance, replaying {0} at speed {1}".format(filename,speed))
+        
+        # store params
+        self.filename             = filename
+        self.tcpPortStart         = tcpPortStart
+        self.speed                = speed
+        self.waitForConnections   = waitForConnections
+        
+        # local variables
+        self.dataLock             = threading.Lock()
+        self.goOn                 = True
+        self.reader               = moteProbeCapture.moteProbeCaptureReader(self.filename)
+        self.serialportNames      = self.reader.getPortNames()
+        self.socketThreads        = []
+        self.stats                = {
+            'numFrames':          0,
+            'numBytes':           0,
+            'duration':           None,
+        }
+        
+        # initialize the parent class
+        threading.Thread.__init__(self)
+        
+        # give this thread a name
+        self.name                 = 'moteProbeReplay'
+        
+        # present each port on a TCP port
+        if self.tcpPortStart!=None:
+            for (i,serialportName) in enumerate(self.serialportNames):
+                socketThread = moteProbeSocketThread.moteProbeSocketThread(
+                    self.tcpPortStart+i,
+                    serialportName,
+                    framing  = tcpFraming,
+                )
+                socketThread.daemon = True
+                socketThread.start()
+                self.socketThreads += [socketThread]
+    
+    def run(self):
+        
+        # log
+        log.debug("start running")
+        
+        if self.waitForConnections:
+            self._waitForConnections()
+        
+        start     = time.time()
+        firstTs   = None
+        for (timestamp,serialportName,frame) in self.reader:
+            
+            if not self.goOn:
+                break
+            
+            # keep the recorded pace
+            if self.speed!=self.SPEED_MAX:
+                if firstTs==None:
+                    firstTs = timestamp
+                delay = (timestamp-firstTs)/self.speed-(time.time()-start)
+                if delay>0:
+                    time.sleep(delay)
+            
+            dispatcher.send(
+                signal        = 'bytesFromSerialPort'+serialportName,
+                data          = frame,
+            )
+            
+            with self.dataLock:
+                self.stats['numFrames'] += 1
+                self.stats['numBytes']  += len(frame)
+        
+        with self.dataLock:
+            self.stats['duration'] = time.time()-start
+        
+        # log
+        log.info("replay done: {0}".format(self.getStats()))
+    
+    #======================== public ==========================================
+    
+    def getSerialPortNames(self):
+        return list(self.serialportNames)
+    
+    def getTcpPorts(self):
+        '''
+        \returns A list of (serialportName,tcpport) tuples, empty if the
+                 ports are not presented on TCP ports.
+        '''
+        return [(t.serialportName,t.socketport) for t in self.socketThreads]
+    
+    def getStats(self):
+        '''
+        \returns A dictionary with the number of frames and bytes replayed so
+                 far, and the duration of the replay, in s (None until it is
+                 done).
+        '''
+        with self.dataLock:
+            return dict(self.stats)
+    
+    def close(self):
+        '''
+        \brief Stop the replay, and free its TCP ports.
+        '''
+        self.goOn = False
+        if self.is_alive():
+            self.join()
+        for socketThread in self.socketThreads:
+            socketThread.close()
+        self.reader.close()
+    
+    #======================== private =========================================
+    
+    def _waitForConnections(self):
+        start = time.time()
+        while self.goOn and [t for t in self.socketThreads if t.conn==None]:
+            if time.time()-start>self.CONNECT_TIMEOUT:
+                log.warning("not all moteConnectors connected, replaying anyway")
+                break
+            time.sleep(0.01)
@@ -0,0 +1,435 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('moteProbeSelectLoop')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import os
+import errno
+import fcntl
+import select
+import socket
+import threading
+import time
+import collections
+
+from pydispatch import dispatcher
+
+from moteConnector import TcpFramer
+
+class moteProbeSelectLoop(threading.Thread):
+    '''
+    \brief Single thread serving the serial ports and TCP ports of any number
+           of moteProbes.
+    
+    This is an alternative to the moteProbeSerialThread/moteProbeSocketThread
+    pair which each moteProbe otherwise starts. All file descriptors are
+    polled from one select() loop, and the same 'bytesFromSerialPort' and
+    'bytesFromTcpPort' signals are dispatched, from this thread.
+    
+    It is implemented as a singleton, i.e. all moteProbes created with the
+    select engine share the same loop.
+    
+    \note select() only accepts serial ports on POSIX systems.
+    '''
+    _instance                 = None
+    _init                     = False
+    
+    SELECT_TIMEOUT            = 1.0     ##< max. time blocked in select(), in s
+    SERIAL_RETRY_PERIOD       = 1.0     ##< time between attempts to (re)open a serial port, in s
+    
+    def __new__(cls, *args, **kwargs):
+        '''
+        \brief Override creation of the object so it is create only once
+               (singleton pattern)
+        '''
+        if not cls._instance:
+            cls._instance = super(moteProbeSelectLoop, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+    
+    def __init__(self):
+        
+        if self._init:
+            return
+        
+        assert os.name=='posix'
+        
+        # log
+        log.debug("create instance")
+        
+        # initialize the parent class
+        threading.Thread.__init__(self)
+        
+        # give this thread a name
+        self.name                 = 'moteProbeSelectLoop'
+        
+        # local variables
+        self.dataLock             = threading.RLock()
+        self.goOn                 = True
+        self.readers              = {}      ##< fileno -> function called when readable
+        self.writers              = {}      ##< fileno -> function called when writable
+        self.serialsToOpen        = []      ##< (time,serialProtocol) of the serial ports to (re)open
+        self.tcpPorts             = []
+        (self.wakeupRx,self.wakeupTx) = os.pipe()
+        fcntl.fcntl(self.wakeupTx,fcntl.F_SETFL,os.O_NONBLOCK)
+        self.readers[self.wakeupRx] = self._handleWakeup
+        self._init                = True
+        
+        # start the loop
+        self.start()
+    
+    def run(self):
+        
+        # log
+        log.debug("start running")
+        
+        while self.goOn:
+            
+            # open the serial ports which are due
+            timeout = self._openSerialPorts()
+            
+            # wait for a file descriptor to be ready
+            with self.dataLock:
+                rlist = self.readers.keys()
+                wlist = self.writers.keys()
+            try:
+                (rready,wready,_) = select.select(rlist,wlist,[],timeout)
+            except select.error as err:
+                if err.args[0]==errno.EINTR:
+                    continue
+                raise
+            
+            # call the handlers, which may remove other file descriptors
+            for (ready,handlers) in [(rready,self.readers),(wready,self.writers)]:
+                for fileno in ready:
+                    with self.dataLock:
+                        handler = handlers.get(fileno)
+                    if handler:
+                        try:
+                            handler()
+                        except Exception as err:
+                            log.critical('handler {0} failed: {1}'.format(handler,err))
+        
+        # log
+        log.debug("stopped")
+    
+    #======================== public ==========================================
+    
+    def addMoteProbe(self,serialProtocol,tcpport,framing=TcpFramer.TcpFramer.FRAMING_RAW):
+        '''
+        \brief Serve a mote's serial port and its TCP port from this loop.
+        
+        \param serialProtocol The moteProbeSerialProtocol of the mote.
+        \param tcpport        The TCP port to present the mote on, None if
+                              the mote is reached through a moteProbePipe.
+        \param framing        The TcpFramer framing used on the TCP port.
+        '''
+        
+        # log
+        log.info("adding {0}@{1}, TCP port {2}".format(
+                serialProtocol.serialportName,
+                serialProtocol.serialportBaudrate,
+                tcpport,
+            )
+        )
+        
+        tcpPorts = []
+        if tcpport!=None:
+            tcpPorts += [moteProbeSelectTcpPort(self,tcpport,serialProtocol.serialportName,framing)]
+        with self.dataLock:
+            self.tcpPorts      += tcpPorts
+            self.serialsToOpen += [(0,serialProtocol)]
+        self.wakeup()
+    
+    def addReader(self,fileno,handler):
+        with self.dataLock:
+            self.readers[fileno] = handler
+        self.wakeup()
+    
+    def removeReader(self,fileno):
+        with self.dataLock:
+            self.readers.pop(fileno,None)
+    
+    def addWriter(self,fileno,handler):
+        with self.dataLock:
+            self.writers[fileno] = handler
+        self.wakeup()
+    
+    def removeWriter(self,fileno):
+        with self.dataLock:
+            self.writers.pop(fileno,None)
+    
+    def wakeup(self):
+        '''
+        \brief Interrupt select(), so it takes into account the file descriptors
+               which were added from another thread.
+        '''
+        if threading.current_thread() is self:
+            return
+        try:
+            os.write(self.wakeupTx,'x')
+        except OSError as err:
+            # the pipe is full, the loop will wake up anyway
+            if err.errno!=errno.EAGAIN:
+                raise
+    
+    def close(self):
+        '''
+        \brief Stop the loop and release its file descriptors.
+        
+        \note The singleton cannot be used anymore after this call.
+        '''
+        
+        # log
+        log.debug("closing...")
+        
+        self.goOn = False
+        self.wakeup()
+        if threading.current_thread() is not self:
+            self.join()
+        for tcpPort in self.tcpPorts:
+            tcpPort.close()
+        os.close(self.wakeupRx)
+        os.close(self.wakeupTx)
+    
+    #======================== private =========================================
+    
+    def _handleWakeup(self):
+        os.read(self.wakeupRx,4096)
+    
+    def _openSerialPorts(self):
+        '''
+        \brief Open the serial ports which are due.
+        
+        \returns The time until the next serial port is due, capped to
+                 SELECT_TIMEOUT.
+        '''
+        now = time.time()
+        
+        with self.dataLock:
+            dueNow             = [s for (t,s) in self.serialsToOpen if t<=now]
+            self.serialsToOpen = [(t,s) for (t,s) in self.serialsToOpen if t>now]
+        
+        for serialProtocol in dueNow:
+            try:
+                serialProtocol.openSerial(timeout=0)
+            except Exception as err:
+                log.warning(err)
+                self._retrySerial(serialProtocol)
+            else:
+                self.addReader(
+                    serialProtocol.serial.fileno(),
+                    lambda serialProtocol=serialProtocol: self._handleSerialReadable(serialProtocol),
+                )
+        
+        with self.dataLock:
+            if self.serialsToOpen:
+                nextDue = min([t for (t,s) in self.serialsToOpen])
+                return max(0,min(self.SELECT_TIMEOUT,nextDue-now))
+        return self.SELECT_TIMEOUT
+    
+    def _retrySerial(self,serialProtocol):
+        with self.dataLock:
+            self.serialsToOpen += [(time.time()+self.SERIAL_RETRY_PERIOD,serialProtocol)]
+    
+    def _handleSerialReadable(self,serialProtocol):
+        try:
+            # non-blocking, returns all the bytes waiting in the OS buffer
+            rxBytes = serialProtocol.serial.read(max(serialProtocol.serial.inWaiting(),1))
+            if not rxBytes:
+                raise IOError('{0} readable but no data'.format(serialProtocol.serialportName))
+        except Exception as err:
+            log.warning(err)
+            self.removeReader(serialProtocol.serial.fileno())
+            try:
+                serialProtocol.serial.close()
+            except Exception:
+                pass
+            self._retrySerial(serialProtocol)
+        else:
+            serialProtocol.handleRxBytes(rxBytes)
+
+class moteProbeSelectTcpPort(object):
+    '''
+    \brief TCP port of a mote, served by the moteProbeSelectLoop.
+    
+    Behaves as the moteProbeSocketThread: accepts one OpenVisualizer
+    connection at a time, dispatches what it receives on the
+    'bytesFromTcpPort' signal and sends what is dispatched on the
+    'bytesFromSerialPort' signal. The connection is non-blocking; the frames
+    which cannot be sent right away are buffered, so a slow connection does
+    not stall the other motes. Past MAX_TX_BUF bytes buffered, new frames
+    are dropped, whole so the framing is kept, and counted.
+    '''
+    
+    RX_BUF_SIZE               = 4096
+    MAX_TX_BUF                = 1024*1024   ##< bytes buffered for the connection, above which new frames are dropped
+    TX_SEND_SIZE              = 64*1024     ##< max. bytes passed to a single send()
+    
+    def __init__(self,selectLoop,socketport,serialportName,framing=TcpFramer.TcpFramer.FRAMING_RAW):
+        
+        # log
+        log.debug("create moteProbeSelectTcpPort@{0}".format(socketport))
+        
+        # store params
+        self.selectLoop           = selectLoop
+        self.socketport           = socketport
+        self.serialportName       = serialportName
+        
+        # local variables
+        self.dataLock             = threading.RLock()
+        self.conn                 = None
+        self.addr                 = None
+        self.txChunks             = collections.deque()  ##< encoded frames not sent yet, the first one possibly partly sent
+        self.txBytes              = 0       ##< bytes in txChunks
+        self.framer               = TcpFramer.TcpFramer(framing)
+        self.stats                = {
+            'numTxDropped':       0,    ##< frames dropped, MAX_TX_BUF reached
+        }
+        
+        # listen for incoming connection requests on all interfaces
+        self.socket               = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        self.socket.bind(('',self.socketport))
+        self.socket.listen(1)
+        self.socket.setblocking(0)
+        self.selectLoop.addReader(self.socket.fileno(),self._handleAccept)
+        
+        # subscribe to dispatcher
+        dispatcher.connect(
+            self.send,
+            signal='bytesFromSerialPort'+self.serialportName,
+        )
+    
+    #======================== public ==========================================
+    
+    def send(self,data):
+        with self.dataLock:
+            if self.conn==None:
+                return
+            chunk = self.framer.encode(data)
+            if self.txBytes+len(chunk)>self.MAX_TX_BUF:
+                self.stats['numTxDropped'] += 1
+                return
+            self.txChunks.append(chunk)
+            self.txBytes += len(chunk)
+            self._flush()
+    
+    def getStats(self):
+        '''
+        \returns A dictionary with the counters of self.stats, plus the
+                 'txBytes' currently buffered.
+        '''
+        with self.dataLock:
+            returnVal            = dict(self.stats)
+            returnVal['txBytes'] = self.txBytes
+        return returnVal
+    
+    def close(self):
+        with self.dataLock:
+            self._disconnect(listen=False)
+            self.selectLoop.removeReader(self.socket.fileno())
+            self.socket.close()
+    
+    #======================== private =========================================
+    
+    def _handleAccept(self):
+        with self.dataLock:
+            try:
+                (conn,addr) = self.socket.accept()
+            except socket.error as err:
+                if err.errno in [errno.EAGAIN,errno.EWOULDBLOCK]:
+                    return
+                raise
+            
+            # log
+            log.info("openVisualizer connection from {0}".format(addr))
+            
+            # one connection at a time, as the moteProbeSocketThread
+            self.selectLoop.removeReader(self.socket.fileno())
+            conn.setblocking(0)
+            self.conn = conn
+            self.addr = addr
+            self.framer.reset()
+            self.selectLoop.addReader(self.conn.fileno(),self._handleReadable)
+    
+    def _handleReadable(self):
+        try:
+            bytesReceived = self.conn.recv(self.RX_BUF_SIZE)
+        except socket.error as err:
+            if err.errno in [errno.EAGAIN,errno.EWOULDBLOCK,errno.EINTR]:
+                return
+            bytesReceived = ''
+        
+        if not bytesReceived:
+            # log
+            log.info("openVisualizer disconnected")
+            
+            with self.dataLock:
+                self._disconnect()
+            return
+        
+        # dispatch each frame
+        for frame in self.framer.decode(bytesReceived):
+            dispatcher.send(
+                signal        = 'bytesFromTcpPort'+self.serialportName,
+                data          = frame,
+            )
+    
+    def _handleWritable(self):
+        with self.dataLock:
+            if self.conn!=None:
+                self._flush()
+    
+    def _flush(self):
+        while self.txChunks:
+            
+            # the first chunks, up to TX_SEND_SIZE bytes
+            chunks = []
+            size   = 0
+            for chunk in self.txChunks:
+                if chunks and size+len(chunk)>self.TX_SEND_SIZE:
+                    break
+                chunks += [chunk]
+                size   += len(chunk)
+            
+            try:
+                numSent = self.conn.send(''.join(chunks))
+            except socket.error as err:
+                if err.errno not in [errno.EAGAIN,errno.EWOULDBLOCK,errno.EINTR]:
+                    self._disconnect()
+                    return
+                break
+            
+            # remove what was sent, the last chunk possibly partly
+            self.txBytes -= numSent
+            full          = numSent<size
+            for chunk in chunks:
+                if numSent<len(chunk):
+                    if numSent:
+                        self.txChunks[0] = chunk[numSent:]
+                    break
+                self.txChunks.popleft()
+                numSent  -= len(chunk)
+            
+            # the socket buffer is full, wait for it to be writable
+            if full:
+                break
+        
+        if self.txChunks:
+            self.selectLoop.addWriter(self.conn.fileno(),self._handleWritable)
+        else:
+            self.selectLoop.removeWriter(self.conn.fileno())
+    
+    def _disconnect(self,listen=True):
+        if self.conn!=None:
+            self.selectLoop.removeReader(self.conn.fileno())
+            self.selectLoop.removeWriter(self.conn.fileno())
+            self.conn.close()
+            self.conn     = None
+            self.txChunks.clear()
+            self.txBytes  = 0
+        if listen:
+            self.selectLoop.addReader(self.socket.fileno(),self._handleAccept)
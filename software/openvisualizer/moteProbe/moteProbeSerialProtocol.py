@@ -0,0 +1,217 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('moteProbeSerialProtocol')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import threading
+import serial
+
+import OpenHdlc
+import moteProbeOutputQueue
+from moteConnector import OpenParser
+import openvisualizer_utils as u
+
+from pydispatch import dispatcher
+
+class moteProbeSerialProtocol(object):
+    '''
+    \brief Serial side of a moteProbe, independently of how it is scheduled.
+    
+    Splits the bytes received from the mote into HDLC frames, answers the
+    mote's requests with the data queued by OpenVisualizer, and dispatches
+    the other frames on the 'bytesFromSerialPort' signal, or puts them in a
+    moteProbePipe, if given one. It does not read
+    from the serial port itself: this is done by the moteProbe engine (a
+    moteProbeSerialThread, or the moteProbeSelectLoop), which passes the
+    bytes it reads to handleRxBytes().
+    
+    The frames to write to the mote wait in outputBuf, a bounded
+    moteProbeOutputQueue. They are written when the mote requests them,
+    either:
+    - FLOWCONTROL_SINGLE: one frame per request.
+    - FLOWCONTROL_CREDIT: the request frame carries one extra byte, the
+      number of free slots in the mote's input buffer (its credit); that
+      many frames are written in a single serial write. A request without
+      that byte implies implicitCredit free slots.
+    '''
+    
+    FLOWCONTROL_SINGLE        = 'single'
+    FLOWCONTROL_CREDIT        = 'credit'
+    FLOWCONTROL_ALL           = [FLOWCONTROL_SINGLE,
+                                 FLOWCONTROL_CREDIT,]
+    
+    DFLT_OUTPUTBUF_SIZE       = moteProbeOutputQueue.moteProbeOutputQueue.DFLT_HIGH_WATERMARK
+    DFLT_OUTPUTBUF_POLICY     = moteProbeOutputQueue.moteProbeOutputQueue.POLICY_DROP_NEWEST
+    DFLT_IMPLICIT_CREDIT      = 1       ##< credit implied by a request without credit byte
+    
+    def __init__(self,serialportName,serialportBaudrate,
+            flowControl=FLOWCONTROL_SINGLE,
+            outputBufSize=DFLT_OUTPUTBUF_SIZE,
+            outputBufLowWatermark=None,
+            outputBufPolicy=DFLT_OUTPUTBUF_POLICY,
+            implicitCredit=DFLT_IMPLICIT_CREDIT,
+            pipe=None):
+        '''
+        \param outputBufSize         The high watermark of outputBuf.
+        \param outputBufLowWatermark The low watermark of outputBuf.
+        \param outputBufPolicy       What outputBuf drops when congested.
+        \param pipe                  A moteProbePipe to exchange the frames
+                                     through, in-process, None to use the
+                                     dispatcher signals.
+        '''
+        assert flowControl in self.FLOWCONTROL_ALL
+        
+        # log
+        log.debug("create instance")
+        
+        # store params
+        self.serialportName       = serialportName
+        self.serialportBaudrate   = serialportBaudrate
+        self.flowControl          = flowControl
+        self.implicitCredit       = implicitCredit
+        self.pipe                 = pipe
+        
+        # local variables
+        self.serial               = None
+        self.hdlc                 = OpenHdlc.OpenHdlc()
+        self.hdlcSplitter         = OpenHdlc.HdlcFrameSplitter()
+        self.outputBuf            = moteProbeOutputQueue.moteProbeOutputQueue(
+                                        highWatermark = outputBufSize,
+                                        lowWatermark  = outputBufLowWatermark,
+                                        policy        = outputBufPolicy,
+                                    )
+        self.dataLock             = threading.Lock()
+        self.stats                = {
+            'numRequests':        0,    ##< requests received from the mote
+            'numEmptyRequests':   0,    ##< requests answered with no frame
+            'numSerialWrites':    0,    ##< calls to serial.write()
+            'numCredits':         0,    ##< credit granted by the mote, in frames
+        }
+        
+        # connect to dispatcher, or to the pipe
+        if self.pipe:
+            self.pipe.connect(self.send)
+        else:
+            dispatcher.connect(
+                self.send,
+                signal = 'bytesFromTcpPort'+self.serialportName,
+            )
+    
+    #======================== public ==========================================
+    
+    def openSerial(self,timeout=None):
+        '''
+        \brief Open the serial port.
+        
+        \param timeout The read timeout, as defined by pySerial (None blocks,
+                       0 is non-blocking).
+        
+        \returns The opened serial.Serial instance.
+        '''
+        log.debug("open serial port {0}@{1}".format(self.serialportName,self.serialportBaudrate))
+        self.serial = serial.Serial(self.serialportName,self.serialportBaudrate,timeout=timeout)
+        return self.serial
+    
+    def handleRxBytes(self,rxBytes):
+        '''
+        \brief Handle bytes read from the serial port.
+        
+        \param rxBytes The bytes read, a string. Need not be aligned on frame
+                       boundaries.
+        '''
+        for frame in self.hdlcSplitter.feed(rxBytes):
+            self._handleFrame(frame)
+    
+    def send(self,data):
+        # frame with HDLC
+        hdlcData = self.hdlc.hdlcify(data)
+        
+        # add to outputBuf
+        if not self.outputBuf.put(hdlcData):
+            log.warning('outputBuf congested, dropped {0} bytes'.format(len(hdlcData)))
+            return
+        
+        # log
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('added {0} bytes to outputBuf: {1}'.format(
+                    len(hdlcData),
+                    u.formatBuf(hdlcData),
+                )
+            )
+    
+    def getStats(self):
+        '''
+        \brief Retrieve the counters of the outbound path.
+        
+        \returns A dictionary with the counters of self.stats, plus the ones of
+                 outputBuf, see moteProbeOutputQueue.getStats().
+        '''
+        returnVal = self.outputBuf.getStats()
+        with self.dataLock:
+            returnVal.update(self.stats)
+        return returnVal
+    
+    #======================== private =========================================
+    
+    def _handleFrame(self,frame):
+        
+        try:
+            frame = self.hdlc.dehdlcify(frame)
+        except OpenHdlc.HdlcException as err:
+            log.warning('invalid serial frame: {0}'.format(err))
+            return
+        
+        credit = self._parseRequest(frame)
+        if credit!=None:
+            frames = self.outputBuf.get(credit)
+            with self.dataLock:
+                self.stats['numRequests']          += 1
+                self.stats['numCredits']           += credit
+                if not frames:
+                    self.stats['numEmptyRequests'] += 1
+                else:
+                    self.stats['numSerialWrites']  += 1
+            if frames:
+                outputToWrite = ''.join(frames)
+                self.serial.write(outputToWrite)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('sent {0} frames, {1} bytes over serial:   {2}'.format(
+                            len(frames),
+                            len(outputToWrite),
+                            u.formatBuf(outputToWrite),
+                        )
+                    )
+        elif self.pipe:
+            # hand over to the moteConnector
+            if not self.pipe.put(frame):
+                log.warning('pipe full, dropped {0} bytes'.format(len(frame)))
+        else:
+            # dispatch
+            dispatcher.send(
+                signal        = 'bytesFromSerialPort'+self.serialportName,
+                data          = frame,
+            )
+    
+    def _parseRequest(self,frame):
+        '''
+        \brief Check whether a frame is a request from the mote.
+        
+        \param frame The dehdlcified frame.
+        
+        \returns The number of frames the mote accepts if the frame is a
+                 request, None otherwise.
+        '''
+        if not frame or frame[0]!=chr(OpenParser.OpenParser.SERFRAME_MOTE2PC_REQUEST):
+            return None
+        if self.flowControl==self.FLOWCONTROL_SINGLE:
+            if len(frame)==1:
+                return 1
+        else:
+            if len(frame)==1:
+                return self.implicitCredit
+            if len(frame)==2:
+                return ord(frame[1])
+        return None
@@ -8,129 +8,61 @@ log.setLevel(logging.ERROR)
 log.addHandler(NullHandler())
 
 import threading
-import serial
 import time
-import struct
-
-import OpenHdlc
-from moteConnector import OpenParser
-import openvisualizer_utils as u
-
-from pydispatch import dispatcher
 
 class moteProbeSerialThread(threading.Thread):
-
-    def __init__(self,serialportName,serialportBaudrate):
+    
+    READMODE_BYTE             = 'byte'  ##< read the serial port one byte at a time
+    READMODE_BULK             = 'bulk'  ##< read all the bytes waiting in the OS buffer
+    READMODE_ALL              = [READMODE_BYTE,
+                                 READMODE_BULK,]
+    
+    def __init__(self,serialProtocol,readMode=READMODE_BULK):
+        assert readMode in self.READMODE_ALL
         
         # log
         log.debug("create instance")
         
         # store params
-        self.serialportName       = serialportName
-        self.serialportBaudrate   = serialportBaudrate
-        
-        # local variables
-        self.hdlc                 = OpenHdlc.OpenHdlc()
-        self.lastRxByte           = self.hdlc.HDLC_FLAG
-        self.busyReceiving        = False
-        self.inputBuf             = ''
-        self.outputBuf            = []
-        self.outputBufLock        = threading.RLock()
+        self.serialProtocol       = serialProtocol
+        self.readMode             = readMode
         
         # initialize the parent class
         threading.Thread.__init__(self)
         
         # give this thread a name
-        self.name                 = 'moteProbeSerialThread@'+self.serialportName
-        
-        # connect to dispatcher
-        dispatcher.connect(
-            self.send,
-            signal = 'bytesFromTcpPort'+self.serialportName,
-        )
+        self.name                 = 'moteProbeSerialThread@'+self.serialProtocol.serialportName
     
     def run(self):
         
         # log
         log.debug("start running")
-    
+        
         while True:     # open serial port
-            log.debug("open serial port {0}@{1}".format(self.serialportName,self.serialportBaudrate))
-            self.serial = serial.Serial(self.serialportName,self.serialportBaudrate)
+            self.serial = self.serialProtocol.openSerial()
             while True: # read bytes from serial port
                 try:
-                    rxByte = self.serial.read(1)
+                    rxBytes = self._readSerial()
                 except Exception as err:
                     log.warning(err)
                     time.sleep(1)
                     break
                 else:
-                    #log.debug("received {0} ({1})".format(rxByte,hex(ord(rxByte))))
-                    if      (
-                                (not self.busyReceiving)             and 
-                                self.lastRxByte==self.hdlc.HDLC_FLAG and
-                                rxByte!=self.hdlc.HDLC_FLAG
-                            ):
-                        # start of frame
-                        
-                        self.busyReceiving       = True
-                        self.inputBuf            = self.hdlc.HDLC_FLAG
-                        self.inputBuf           += rxByte
-                    elif    (
-                                self.busyReceiving                   and
-                                rxByte!=self.hdlc.HDLC_FLAG
-                            ):
-                        # middle of frame
-                        
-                        self.inputBuf           += rxByte
-                    elif    (
-                                self.busyReceiving                   and
-                                rxByte==self.hdlc.HDLC_FLAG
-                            ):
-                        # end of frame
-                        
-                        self.busyReceiving       = False
-                        self.inputBuf           += rxByte
-                        
-                        try:
-                            self.inputBuf        = self.hdlc.dehdlcify(self.inputBuf)
-                        except OpenHdlc.HdlcException as err:
-                            log.warning('invalid serial frame: {0}'.format(err))
-                        else:
-                            if self.inputBuf==chr(OpenParser.OpenParser.SERFRAME_MOTE2PC_REQUEST):
-                                with self.outputBufLock:
-                                    if self.outputBuf:
-                                        outputToWrite = self.outputBuf.pop(0)
-                                        self.serial.write(outputToWrite)
-                                        log.debug('sent {0} bytes over serial:   {1}'.format(
-                                                len(outputToWrite),
-                                                u.formatBuf(outputToWrite),
-                                            )
-                                        )
-                            else:
-                                # dispatch
-                                dispatcher.send(
-                                    signal        = 'bytesFromSerialPort'+self.serialportName,
-                                    data          = self.inputBuf[:],
-                                )
-                    
-                    self.lastRxByte = rxByte
+                    self.serialProtocol.handleRxBytes(rxBytes)
     
     #======================== public ==========================================
     
-    def send(self,data):
-        # frame with HDLC
-        hdlcData = self.hdlc.hdlcify(data)
+    #======================== private =========================================
+    
+    def _readSerial(self):
         
-        # add to outputBuf
-        with self.outputBufLock:
-            self.outputBuf += [hdlcData]
+        # block until at least one byte is received
+        rxBytes = self.serial.read(1)
         
-        # log
-        log.debug('added {0} bytes to outputBuf: {1}'.format(
-                len(hdlcData),
-                u.formatBuf(hdlcData),
-            )
-        )
-    
-    #======================== private =========================================
\ No newline at end of file
+        # drain the bytes already waiting in the OS buffer
+        if self.readMode==self.READMODE_BULK:
+            numWaiting = self.serial.inWaiting()
+            if numWaiting:
+                rxBytes += self.serial.read(numWaiting)
+        
+        return rxBytes
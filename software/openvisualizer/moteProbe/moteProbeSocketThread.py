@@ -11,9 +11,11 @@ import socket
 
 from pydispatch import dispatcher
 
+from moteConnector import TcpFramer
+
 class moteProbeSocketThread(threading.Thread):
     
-    def __init__(self,socketport,serialportName):
+    def __init__(self,socketport,serialportName,framing=TcpFramer.TcpFramer.FRAMING_RAW):
         
         # log
         log.debug("create instance")
@@ -24,7 +26,10 @@ class moteProbeSocketThread(threading.Thread):
         
         # local variables
         self.socket          = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
         self.conn            = None
+        self.goOn            = True
+        self.framer          = TcpFramer.TcpFramer(framing)
         
         # initialize the parent class
         threading.Thread.__init__(self)
@@ -43,33 +48,51 @@ class moteProbeSocketThread(threading.Thread):
         # log
         log.debug("start running")
         
-        # attach to a socket on all interfaces of the computer
-        self.socket.bind(('',self.socketport))
-        
-        # listen for incoming connection requests
-        self.socket.listen(1)
+        try:
+            # attach to a socket on all interfaces of the computer
+            self.socket.bind(('',self.socketport))
+            
+            # listen for incoming connection requests
+            self.socket.listen(1)
+        except socket.error:
+            if not self.goOn:
+                # closed before running
+                return
+            raise
         
-        while True:
+        while self.goOn:
             # wait for OpenVisualizer to connect
-            self.conn,self.addr = self.socket.accept()
+            try:
+                self.conn,self.addr = self.socket.accept()
+            except socket.error:
+                if not self.goOn:
+                    # closed
+                    break
+                raise
             
             # log
             log.info("openVisualizer connection from {0}".format(self.addr))
             
+            # start from a clean decoder
+            self.framer.reset()
+            
             # read data sent from OpenVisualizer
             while True:
                 
                 try:
                     bytesReceived = self.conn.recv(4096)
+                    if not bytesReceived:
+                        raise socket.error('connection closed')
                     
-                    # dispatch
-                    dispatcher.send(
-                        signal        = 'bytesFromTcpPort'+self.serialportName,
-                        data          = bytesReceived
-                    )
-                    
-                except socket.error as err:
+                    # dispatch each frame
+                    for frame in self.framer.decode(bytesReceived):
+                        dispatcher.send(
+                            signal        = 'bytesFromTcpPort'+self.serialportName,
+                            data          = frame
+                        )
                 
+                except socket.error as err:
+                    
                     # log
                     log.info("openVisualizer disconnected")
                     
@@ -81,9 +104,32 @@ class moteProbeSocketThread(threading.Thread):
     def send(self,data):
         if self.conn!=None:
             try:
-                self.conn.send(data)
+                self.conn.sendall(self.framer.encode(data))
             except socket.error:
                 # happens when not connected
                 pass
     
+    def close(self):
+        '''
+        \brief Stop listening, close the connection, and wait for the thread
+               to end, so the TCP port can be bound again.
+        '''
+        self.goOn = False
+        dispatcher.disconnect(
+            self.send,
+            signal='bytesFromSerialPort'+self.serialportName,
+        )
+        for s in [self.socket,self.conn]:
+            if s==None:
+                continue
+            try:
+                # wakes up the accept() or recv() of the thread
+                s.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                # not listening or connected
+                pass
+            s.close()
+        if self.is_alive():
+            self.join()
+    
     #======================== private =========================================
\ No newline at end of file
@@ -0,0 +1,526 @@
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('moteProbeVirtualMote')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+import os
+import errno
+import fcntl
+import tty
+import select
+import random
+import struct
+import threading
+import collections
+import time
+
+from pydispatch import dispatcher
+
+import OpenHdlc
+from moteConnector import OpenParser
+from moteConnector import ParserStatus
+from moteConnector import MoteConnectorRouter
+
+class moteProbeVirtualMote(object):
+    '''
+    \brief Synthetic mote, attached to a pseudo-terminal.
+    
+    The mote talks to the moteProbe which opens the slave side of its
+    pseudo-terminal as it would to real firmware:
+    - it emits HDLC-framed status, data and error frames, each at its own
+      rate;
+    - it sends SERFRAME_MOTE2PC_REQUEST frames at requestRate, with a credit
+      byte when credit is not None, to get the frames queued by
+      OpenVisualizer;
+    - it answers each SERFRAME_PC2MOTE_TRIGGERSERIALECHO frame with a data
+      frame carrying the same payload.
+    
+    The ASN, in the header of the data frames and in the Asn status
+    element, is a per-mote counter, incremented at each frame. The payload
+    of the data frames it generates is described by DATA_FORMAT; it carries
+    the emission time and a sequence number, so the receiving end can
+    measure latency and loss. The sequence number is only incremented for
+    the frames written, i.e. not for the ones dropped because txBuf is full.
+    
+    It does not read or write the pseudo-terminal itself, the
+    moteProbeVirtualMoteFarm does, for all its motes from one thread.
+    '''
+    
+    BAUDRATE                  = 115200
+    
+    DFLT_STATUS_RATE          = 10.0    ##< status frames per s
+    DFLT_DATA_RATE            = 1.0     ##< data frames per s
+    DFLT_ERROR_RATE           = 0.0     ##< error frames per s
+    DFLT_REQUEST_RATE         = 50.0    ##< requests per s
+    DFLT_DATA_LENGTH          = 40      ##< bytes of payload in a data frame
+    MAX_TX_BUF                = 64*1024 ##< bytes pending in txBuf, above which frames are dropped
+    
+    DATA_MARKER               = 'VM'
+    # marker, emission time, moteId, (zeros), sequence number
+    DATA_FORMAT               = struct.Struct('<2sdHxxxI')
+    ADDRESSES_LENGTH          = 16      ##< destination and source addresses of a data frame
+    
+    def __init__(self,moteId,
+            statusRate=DFLT_STATUS_RATE,
+            dataRate=DFLT_DATA_RATE,
+            errorRate=DFLT_ERROR_RATE,
+            requestRate=DFLT_REQUEST_RATE,
+            dataLength=DFLT_DATA_LENGTH,
+            credit=None,
+            clock=time.time):
+        '''
+        \param moteId      The 16-bit identifier of the mote.
+        \param statusRate  The status frames emitted per s, 0 for none.
+        \param dataRate    The data frames emitted per s, 0 for none.
+        \param errorRate   The error frames emitted per s, 0 for none.
+        \param requestRate The requests sent per s, 0 for none.
+        \param dataLength  The length of the payload of the data frames, at
+                           least DATA_FORMAT.size.
+        \param credit      The credit byte of the requests, or None to send
+                           requests without one.
+        \param clock       Function returning the current time, in s.
+        '''
+        assert dataLength>=self.DATA_FORMAT.size
+        
+        # store params
+        self.moteId               = moteId
+        self.dataLength           = dataLength
+        self.credit               = credit
+        self.clock                = clock
+        
+        # local variables
+        self.hdlc                 = OpenHdlc.OpenHdlc()
+        self.hdlcSplitter         = OpenHdlc.HdlcFrameSplitter()
+        self.asn                  = 0
+        self.seqNum               = 0
+        self.txBuf                = ''
+        self.statusKeys           = ParserStatus.ParserStatus().fieldsParsingKeys
+        self.statusIndex          = 0
+        self.stats                = {
+            'numStatus':          0,    ##< status frames emitted, not counting dropped ones
+            'numData':            0,    ##< data frames emitted, not counting dropped ones
+            'numError':           0,    ##< error frames emitted, not counting dropped ones
+            'numRequests':        0,    ##< requests sent, not counting dropped ones
+            'numEchoes':          0,    ##< echo requests answered
+            'numRxFrames':        0,    ##< frames received from the moteProbe
+            'numRxInvalid':       0,    ##< invalid HDLC frames received
+            'numTxDropped':       0,    ##< frames dropped, txBuf full
+        }
+        
+        # pseudo-terminal; the slave is kept open so the master stays usable
+        # while the moteProbe is not connected
+        (self.masterFd,self.slaveFd) = os.openpty()
+        tty.setraw(self.slaveFd)
+        flags                     = fcntl.fcntl(self.masterFd,fcntl.F_GETFL)
+        fcntl.fcntl(self.masterFd,fcntl.F_SETFL,flags|os.O_NONBLOCK)
+        self.serialportName       = os.ttyname(self.slaveFd)
+        
+        # schedule, start at a random time within the period so the motes of
+        # a farm do not all emit at once
+        now                       = self.clock()
+        self.schedule             = []      ##< [next due time, period, function]
+        for (rate,function) in [
+                (statusRate,  self._emitStatus),
+                (dataRate,    self._emitData),
+                (errorRate,   self._emitError),
+                (requestRate, self._emitRequest),
+            ]:
+            if rate>0:
+                self.schedule += [[now+random.random()/rate,1.0/rate,function]]
+    
+    #======================== public ==========================================
+    
+    def fileno(self):
+        return self.masterFd
+    
+    def getSerialPort(self):
+        '''
+        \returns The (name,baudrate) of the serial port, as returned by
+                 utils.findSerialPorts().
+        '''
+        return (self.serialportName,self.BAUDRATE)
+    
+    def tick(self):
+        '''
+        \brief Emit the frames which are due.
+        
+        \returns The time the next frame is due.
+        '''
+        now = self.clock()
+        for entry in self.schedule:
+            (due,period,function) = entry
+            if due<=now:
+                function()
+                # do not try to catch up when late, e.g. after a pause
+                entry[0] = max(due+period,now)
+        return min([e[0] for e in self.schedule]) if self.schedule else None
+    
+    def handleReadable(self):
+        '''
+        \brief Read and handle the bytes written by the moteProbe.
+        '''
+        try:
+            rxBytes = os.read(self.masterFd,4096)
+        except OSError as err:
+            if err.errno in [errno.EAGAIN,errno.EINTR]:
+                return
+            raise
+        for frame in self.hdlcSplitter.feed(rxBytes):
+            try:
+                frame = self.hdlc.dehdlcify(frame)
+            except OpenHdlc.HdlcException:
+                self.stats['numRxInvalid'] += 1
+                continue
+            self._handleFrame(frame)
+    
+    def wantsToWrite(self):
+        return len(self.txBuf)>0
+    
+    def handleWritable(self):
+        '''
+        \brief Write as much of txBuf as the pseudo-terminal accepts.
+        '''
+        try:
+            numWritten = os.write(self.masterFd,self.txBuf)
+        except OSError as err:
+            if err.errno in [errno.EAGAIN,errno.EINTR]:
+                return
+            raise
+        self.txBuf = self.txBuf[numWritten:]
+    
+    def getStats(self):
+        return dict(self.stats)
+    
+    def close(self):
+        os.close(self.masterFd)
+        os.close(self.slaveFd)
+    
+    #======================== private =========================================
+    
+    def _handleFrame(self,frame):
+        self.stats['numRxFrames'] += 1
+        if frame and frame[0]==chr(OpenParser.OpenParser.SERFRAME_PC2MOTE_TRIGGERSERIALECHO):
+            self.stats['numEchoes'] += 1
+            self._send(OpenParser.OpenParser.SERFRAME_MOTE2PC_DATA,frame[1:])
+    
+    def _emitStatus(self):
+        key = self.statusKeys[self.statusIndex]
+        self.statusIndex = (self.statusIndex+1)%len(self.statusKeys)
+        if key.name=='Asn':
+            payload = self._packAsn()
+        else:
+            payload = '\x00'*key.size
+        if self._send(
+                OpenParser.OpenParser.SERFRAME_MOTE2PC_STATUS,
+                struct.pack('<B',key.val)+payload,
+                withAsn=False,
+            ):
+            self.stats['numStatus'] += 1
+    
+    def _emitData(self):
+        payload  = self.DATA_FORMAT.pack(self.DATA_MARKER,self.clock(),self.moteId,self.seqNum)
+        payload += '\x00'*(self.dataLength-len(payload))
+        if self._send(
+                OpenParser.OpenParser.SERFRAME_MOTE2PC_DATA,
+                '\x00'*self.ADDRESSES_LENGTH+payload,
+            ):
+            self.seqNum += 1
+            self.stats['numData'] += 1
+    
+    def _emitError(self):
+        if self._send(
+                OpenParser.OpenParser.SERFRAME_MOTE2PC_ERROR,
+                struct.pack('>BBHH',0,0,0,0),
+                withAsn=False,
+            ):
+            self.stats['numError'] += 1
+    
+    def _emitRequest(self):
+        frame = chr(OpenParser.OpenParser.SERFRAME_MOTE2PC_REQUEST)
+        if self.credit!=None:
+            frame += chr(self.credit)
+        if self._write(frame):
+            self.stats['numRequests'] += 1
+    
+    def _send(self,frameType,body,withAsn=True):
+        '''
+        \brief Emit a frame: type, moteId, ASN (unless withAsn is False),
+               then body.
+        
+        \returns False if the frame was dropped.
+        '''
+        self.asn += 1
+        frame = chr(frameType)+struct.pack('<H',self.moteId)
+        if withAsn:
+            frame += self._packAsn()
+        return self._write(frame+body)
+    
+    def _packAsn(self):
+        return struct.pack('<BHH',(self.asn>>32)&0xff,(self.asn>>16)&0xffff,self.asn&0xffff)
+    
+    def _write(self,frame):
+        if len(self.txBuf)>=self.MAX_TX_BUF:
+            self.stats['numTxDropped'] += 1
+            return False
+        self.txBuf += self.hdlc.hdlcify(frame)
+        return True
+
+class moteProbeVirtualMoteFarm(threading.Thread):
+    '''
+    \brief A set of moteProbeVirtualMotes, served by a single thread.
+    
+    Create a moteProbe on each serial port returned by getSerialPorts(),
+    e.g. with moteProbe.createMoteProbes(serialports=farm.getSerialPorts()).
+    Nothing else changes for the moteProbes and their consumers.
+    
+    The farm listens to monitorSignal, on which the moteConnectors dispatch
+    the data frames they parsed, or send them through the
+    MoteConnectorRouter if direct, or is handed them through monitor(). It
+    recognizes the ones its motes generated, and measures their end-to-end
+    latency, from emission by the mote to reception by the farm.
+    
+    It keeps, for each mote, the highest sequence number received and the
+    ones missing below it: a frame is lost if it is missing while a later
+    one was received, reordered if it is received after a later one, and a
+    duplicate if it is received again. The frames after the highest
+    sequence number received are in flight, not lost.
+    '''
+    
+    SELECT_TIMEOUT            = 1.0     ##< max. time blocked in select(), in s
+    LATENCY_SAMPLES           = 10000   ##< number of latencies kept for the percentiles
+    LATENCY_PERCENTILES       = [50,90,99]
+    DFLT_MONITOR_SIGNAL       = 'inputFromMoteProbe.data.internet'
+    
+    def __init__(self,numMotes,firstMoteId=1,monitorSignal=DFLT_MONITOR_SIGNAL,direct=False,
+            **kwargs):
+        '''
+        \param numMotes      The number of motes.
+        \param firstMoteId   The moteId of the first mote, the others get the
+                             following ones.
+        \param monitorSignal The signal the data frames are dispatched on,
+                             None to not measure latency and loss.
+        \param direct        If True, listen to monitorSignal on the
+                             MoteConnectorRouter, for moteConnectors
+                             created with direct=True, which bypass the
+                             dispatcher, rather than on the dispatcher.
+        \param kwargs        Other parameters passed to each
+                             moteProbeVirtualMote.
+        '''
+        
+        # log
+        log.info("create instance, {0} motes".format(numMotes))
+        
+        # store params
+        self.monitorSignal        = monitorSignal
+        self.direct               = direct
+        
+        # local variables
+        self.dataLock             = threading.Lock()
+        self.goOn                 = True
+        self.motes                = [
+            moteProbeVirtualMote(firstMoteId+i,**kwargs)
+            for i in range(numMotes)
+        ]
+        self.latencies            = collections.deque(maxlen=self.LATENCY_SAMPLES)
+        self.numReceived          = 0       ##< distinct data frames received
+        self.numDuplicates        = 0
+        self.numReordered         = 0
+        # moteId -> [highest sequence number received, missing ones below]
+        self.seqNums              = dict([
+            (m.moteId,[-1,set()])
+            for m in self.motes
+        ])
+        (self.wakeupRx,self.wakeupTx) = os.pipe()
+        
+        # initialize the parent class
+        threading.Thread.__init__(self)
+        
+        # give this thread a name
+        self.name                 = 'moteProbeVirtualMoteFarm'
+        self.daemon               = True
+        
+        # connect to the router or the dispatcher
+        if self.monitorSignal:
+            if self.direct:
+                MoteConnectorRouter.MoteConnectorRouter().connect(
+                    self,
+                    self.monitorSignal,
+                )
+            else:
+                dispatcher.connect(
+                    self.monitor,
+                    signal = self.monitorSignal,
+                )
+    
+    def run(self):
+        
+        # log
+        log.debug("start running")
+        
+        while self.goOn:
+            
+            # emit the frames which are due
+            nextDue = [m.tick() for m in self.motes]
+            nextDue = [t for t in nextDue if t!=None]
+            timeout = self.SELECT_TIMEOUT
+            if nextDue:
+                timeout = max(0,min(timeout,min(nextDue)-time.time()))
+            
+            # wait for a pseudo-terminal to be ready, or a frame to be due
+            rlist = [self.wakeupRx]+self.motes
+            wlist = [m for m in self.motes if m.wantsToWrite()]
+            try:
+                (rready,wready,_) = select.select(rlist,wlist,[],timeout)
+            except select.error as err:
+                if err.args[0]==errno.EINTR:
+                    continue
+                raise
+            
+            for m in wready:
+                m.handleWritable()
+            for m in rready:
+                if m==self.wakeupRx:
+                    os.read(self.wakeupRx,4096)
+                else:
+                    m.handleReadable()
+        
+        # log
+        log.debug("stopped")
+    
+    #======================== public ==========================================
+    
+    def getSerialPorts(self):
+        '''
+        \returns The list of (name,baudrate) of the serial ports of the
+                 motes, as returned by utils.findSerialPorts().
+        '''
+        return [m.getSerialPort() for m in self.motes]
+    
+    def getStats(self):
+        '''
+        \brief Retrieve the counters of the farm.
+        
+        \returns A dictionary with the sum of the counters of the motes
+                 (see moteProbeVirtualMote), plus:
+                 - 'numMotes': the number of motes.
+                 - 'numReceived': distinct data frames received on
+                   monitorSignal, or through monitor().
+                 - 'numLost': data frames not received, while a later one
+                   of the same mote was.
+                 - 'numInFlight': data frames emitted after the last one
+                   received from their mote.
+                 - 'numReordered': data frames received after a later one
+                   of the same mote.
+                 - 'numDuplicates': data frames received more than once.
+                 - 'latency': a dictionary with the 'p50', 'p90', 'p99' and
+                   'max' end-to-end latencies of the last data frames, in s
+                   (None if no frame was received yet).
+        '''
+        returnVal                  = collections.defaultdict(int)
+        for m in self.motes:
+            for (k,v) in m.getStats().items():
+                returnVal[k]      += v
+        returnVal                  = dict(returnVal)
+        returnVal['numMotes']      = len(self.motes)
+        
+        with self.dataLock:
+            returnVal['numReceived']   = self.numReceived
+            returnVal['numLost']       = sum([
+                len(missing) for (_,missing) in self.seqNums.values()
+            ])
+            returnVal['numReordered']  = self.numReordered
+            returnVal['numDuplicates'] = self.numDuplicates
+            latencies                  = sorted(self.latencies)
+        returnVal['numInFlight']       = (
+            returnVal['numData']-returnVal['numReceived']-returnVal['numLost']
+        )
+        
+        returnVal['latency']       = {}
+        for p in self.LATENCY_PERCENTILES:
+            if latencies:
+                value = latencies[min(len(latencies)-1,len(latencies)*p/100)]
+            else:
+                value = None
+            returnVal['latency']['p{0}'.format(p)] = value
+        returnVal['latency']['max'] = latencies[-1] if latencies else None
+        
+        return returnVal
+    
+    def monitor(self,data):
+        '''
+        \brief Account for a data frame received from a moteConnector.
+        
+        \param data The payload of the frame, as a string or list of ints.
+        '''
+        
+        # the moteConnector dispatches the payload as a list of ints
+        if isinstance(data,list):
+            data = ''.join([chr(b) for b in data])
+        if  (
+                len(data)<moteProbeVirtualMote.DATA_FORMAT.size
+                or
+                not data.startswith(moteProbeVirtualMote.DATA_MARKER)
+            ):
+            return
+        
+        (_,emitted,moteId,seqNum) = moteProbeVirtualMote.DATA_FORMAT.unpack_from(data)
+        
+        with self.dataLock:
+            
+            # not one of our motes
+            if moteId not in self.seqNums:
+                return
+            
+            (highest,missing) = self.seqNums[moteId]
+            if seqNum>highest:
+                # the frames skipped are missing
+                missing.update(xrange(highest+1,seqNum))
+                self.seqNums[moteId][0] = seqNum
+            elif seqNum in missing:
+                missing.remove(seqNum)
+                self.numReordered += 1
+            else:
+                self.numDuplicates += 1
+                return
+            
+            self.numReceived += 1
+            self.latencies.append(time.time()-emitted)
+    
+    def put(self,data):
+        '''
+        \brief Called by the MoteConnectorRouter, if direct, with a data frame.
+        '''
+        self.monitor(data)
+    
+    def close(self):
+        '''
+        \brief Stop the farm and close the pseudo-terminals of its motes.
+        '''
+        
+        # log
+        log.debug("closing...")
+        
+        self.goOn = False
+        os.write(self.wakeupTx,'x')
+        if self.is_alive():
+            self.join()
+        if self.monitorSignal:
+            if self.direct:
+                MoteConnectorRouter.MoteConnectorRouter().disconnect(
+                    self,
+                    self.monitorSignal,
+                )
+            else:
+                dispatcher.disconnect(
+                    self.monitor,
+                    signal = self.monitorSignal,
+                )
+        for m in self.motes:
+            m.close()
+        os.close(self.wakeupRx)
+        os.close(self.wakeupTx)
+    
+    #======================== private =========================================
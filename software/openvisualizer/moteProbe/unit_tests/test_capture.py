@@ -0,0 +1,258 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteProbe/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import random
+import socket
+import struct
+import time
+
+import pytest
+
+from pydispatch import dispatcher
+
+import moteProbeCapture
+import moteProbeReplay
+from moteConnector import TcpFramer
+from moteConnector import moteConnector
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_capture.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_capture')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_capture',
+                        'moteProbeCapture',
+                        'moteProbeReplay',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+LOCAL_ADDRESS = '127.0.0.1'
+TIMEOUT       = 10.0
+
+#============================ helpers =========================================
+
+def _randomFrames(num,maxLen=130):
+    return [
+        ''.join([chr(random.randint(0x00,0xff)) for _ in range(random.randint(0,maxLen))])
+        for _ in range(num)
+    ]
+
+def _capture(filename,records):
+    '''
+    \brief Write a capture file.
+
+    \param records A list of (timestamp,serialportName,frame) tuples.
+    '''
+    writer = moteProbeCapture.moteProbeCaptureWriter(filename)
+    for (ts,serialportName,frame) in records:
+        writer.write(serialportName,frame,timestamp=ts)
+    writer.close()
+
+def _freeTcpPort():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind((LOCAL_ADDRESS,0))
+    returnVal = s.getsockname()[1]
+    s.close()
+    return returnVal
+
+def _waitFor(condition):
+    start = time.time()
+    while not condition():
+        assert time.time()-start<TIMEOUT
+        time.sleep(0.01)
+
+#============================ tests ===========================================
+
+def test_roundTrip(tmpdir):
+
+    log.debug("\n---------- test_roundTrip")
+
+    filename = str(tmpdir.join('roundTrip.ovcap'))
+    ports    = ['/dev/ttyUSB0','/dev/ttyUSB1','COM3']
+    records  = [
+        (1000.0+0.001*i,random.choice(ports),f)
+        for (i,f) in enumerate(_randomFrames(500))
+    ]
+    _capture(filename,records)
+
+    reader = moteProbeCapture.moteProbeCaptureReader(filename)
+    assert list(reader)==records
+    assert sorted(reader.getPortNames())==sorted(set([r[1] for r in records]))
+    reader.close()
+
+def test_truncated(tmpdir):
+
+    log.debug("\n---------- test_truncated")
+
+    filename = str(tmpdir.join('truncated.ovcap'))
+    records  = [(float(i),'port',f) for (i,f) in enumerate(['abc','defg','hij'])]
+    _capture(filename,records)
+
+    # the capture was interrupted in the middle of the last frame
+    with open(filename,'r+b') as f:
+        f.truncate(os.path.getsize(filename)-1)
+
+    reader = moteProbeCapture.moteProbeCaptureReader(filename)
+    assert list(reader)==records[:-1]
+    reader.close()
+
+def test_notACapture(tmpdir):
+
+    log.debug("\n---------- test_notACapture")
+
+    filename = str(tmpdir.join('notACapture.ovcap'))
+    for content in ['','OVC','XXXX\x01']:
+        with open(filename,'wb') as f:
+            f.write(content)
+        with pytest.raises(moteProbeCapture.moteProbeCaptureException):
+            moteProbeCapture.moteProbeCaptureReader(filename)
+
+def test_tap(tmpdir):
+
+    log.debug("\n---------- test_tap")
+
+    filename = str(tmpdir.join('tap.ovcap'))
+    writer   = moteProbeCapture.moteProbeCaptureWriter(filename,clock=lambda: 42.0)
+    writer.tap('tapPort')
+
+    frames   = _randomFrames(10)
+    for f in frames:
+        dispatcher.send(signal='bytesFromSerialPort'+'tapPort',data=f)
+    dispatcher.send(signal='bytesFromSerialPort'+'otherPort',data='ignored')
+    assert writer.getStats()['numFrames']==len(frames)
+    writer.close()
+
+    # no frame recorded once closed
+    dispatcher.send(signal='bytesFromSerialPort'+'tapPort',data='ignored')
+
+    reader = moteProbeCapture.moteProbeCaptureReader(filename)
+    assert list(reader)==[(42.0,'tapPort',f) for f in frames]
+    reader.close()
+
+def test_replaySpeed(tmpdir):
+
+    log.debug("\n---------- test_replaySpeed")
+
+    filename = str(tmpdir.join('replaySpeed.ovcap'))
+    records  = [(0.1*i,'speedPort',str(i)) for i in range(6)]    # 0.5s recorded
+    _capture(filename,records)
+
+    received = []
+    def _rx(data):
+        received.append(data)
+    dispatcher.connect(_rx,signal='bytesFromSerialPort'+'speedPort')
+
+    for (speed,minDuration,maxDuration) in [
+            (5.0,                                  0.09,0.5),
+            (moteProbeReplay.moteProbeReplay.SPEED_MAX,0.0, 0.09),
+        ]:
+        del received[:]
+        replay = moteProbeReplay.moteProbeReplay(filename,speed=speed)
+        replay.start()
+        replay.join(TIMEOUT)
+        stats  = replay.getStats()
+        replay.close()
+
+        assert received==[r[2] for r in records]
+        assert stats['numFrames']==len(records)
+        assert minDuration<=stats['duration']<maxDuration
+
+def test_replayToMoteConnector(tmpdir):
+    '''
+    \brief A moteConnector parses the frames replayed on the TCP port.
+    '''
+
+    log.debug("\n---------- test_replayToMoteConnector")
+
+    filename = str(tmpdir.join('replayToMoteConnector.ovcap'))
+    records  = [
+        (0.001*i,'replayPort','D'+'\x00'*23+struct.pack('>H',i))
+        for i in range(200)
+    ]
+    _capture(filename,records)
+
+    tcpport  = _freeTcpPort()
+    replay   = moteProbeReplay.moteProbeReplay(
+        filename,
+        tcpPortStart = tcpport,
+        speed        = moteProbeReplay.moteProbeReplay.SPEED_MAX,
+        tcpFraming   = TcpFramer.TcpFramer.FRAMING_LENGTH,
+    )
+    assert replay.getTcpPorts()==[('replayPort',tcpport)]
+
+    connector = moteConnector.moteConnector(
+        LOCAL_ADDRESS,
+        tcpport,
+        framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+    )
+    connector.daemon = True
+
+    received = []
+    def _rx(data):
+        received.append(data)
+    dispatcher.connect(_rx,signal='inputFromMoteProbe.data.internet',sender=connector.name)
+
+    replay.start()
+    connector.start()
+
+    _waitFor(lambda: len(received)==len(records))
+    assert received==[[ord(c) for c in r[2][24:]] for r in records]
+    replay.close()
+
+def test_replayClose(tmpdir):
+    '''
+    \brief Closing a replay frees its TCP ports, for the next replay.
+    '''
+
+    log.debug("\n---------- test_replayClose")
+
+    filename = str(tmpdir.join('replayClose.ovcap'))
+    _capture(filename,[(0.0,'replayPort','D'+'\x00'*25)])
+
+    tcpport  = _freeTcpPort()
+    for _ in range(2):
+        replay = moteProbeReplay.moteProbeReplay(
+            filename,
+            tcpPortStart       = tcpport,
+            waitForConnections = False,
+        )
+        # the port is bound by the thread of the replay, once running
+        clients = []
+        def _connect():
+            try:
+                clients.append(socket.create_connection((LOCAL_ADDRESS,tcpport),TIMEOUT))
+            except socket.error:
+                return False
+            return True
+        _waitFor(_connect)
+        client = clients[0]
+        _waitFor(lambda: replay.socketThreads[0].conn!=None)
+
+        replay.close()
+        assert not replay.socketThreads[0].is_alive()
+        assert client.recv(4096)==''
+        client.close()
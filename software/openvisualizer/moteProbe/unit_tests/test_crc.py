@@ -0,0 +1,142 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteProbe/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import random
+import time
+
+import pytest
+
+import OpenHdlc
+import openvisualizer_utils as u
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_crc.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_crc')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_crc',
+                        'OpenHdlc',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+BENCH_FRAME_LEN  = 127
+BENCH_NUM_FRAMES = 2000
+
+#============================ fixtures ========================================
+
+RANDOMFRAME = []
+for frameLen in range(0,130,3):
+    frame = ''.join([chr(random.randint(0x00,0xff)) for _ in range(frameLen)])
+    RANDOMFRAME.append(frame)
+
+@pytest.fixture(params=RANDOMFRAME)
+def randomFrame(request):
+    return request.param
+
+@pytest.fixture(params=OpenHdlc.CRC_BACKENDS)
+def crcBackend(request):
+    return request.param
+
+#============================ helpers =========================================
+
+def referenceCrc(buf,crc=OpenHdlc.OpenHdlc.HDLC_CRCINIT):
+    '''
+    \brief Byte-per-byte FCS16, straight from FCS16TAB.
+    '''
+    for b in buf:
+        crc = (crc>>8)^OpenHdlc.OpenHdlc.FCS16TAB[((crc^(ord(b))) & 0xff)]
+    return crc
+
+#============================ tests ===========================================
+
+def test_defaultBackend():
+
+    log.debug("\n---------- test_defaultBackend")
+
+    assert OpenHdlc.DFLT_CRC_BACKEND in OpenHdlc.CRC_BACKENDS
+    assert isinstance(OpenHdlc.OpenHdlc().crc,OpenHdlc.DFLT_CRC_BACKEND)
+
+def test_bitExact(crcBackend,randomFrame):
+
+    log.debug("\n---------- test_bitExact {0} {1}".format(crcBackend.NAME,u.formatBuf(randomFrame)))
+
+    crc = crcBackend()
+
+    # same value as the reference
+    assert crc.compute(randomFrame)==referenceCrc(randomFrame)
+
+    # same value when computed in two steps
+    half = len(randomFrame)/2
+    assert crc.compute(randomFrame[half:],crc.compute(randomFrame[:half]))==referenceCrc(randomFrame)
+
+def test_crcGood(crcBackend,randomFrame):
+
+    log.debug("\n---------- test_crcGood {0}".format(crcBackend.NAME))
+
+    crc    = crcBackend()
+
+    # a frame followed by its complemented FCS yields HDLC_CRCGOOD
+    fcs    = 0xffff-crc.compute(randomFrame)
+    frame  = randomFrame+chr(fcs & 0xff)+chr(fcs>>8)
+    assert crc.compute(frame)==OpenHdlc.OpenHdlc.HDLC_CRCGOOD
+
+def test_backAndForth(crcBackend,randomFrame):
+
+    log.debug("\n---------- test_backAndForth {0}".format(crcBackend.NAME))
+
+    hdlcTx = OpenHdlc.OpenHdlc(crcBackend=crcBackend)
+
+    # frames are interoperable between backends
+    for rxBackend in OpenHdlc.CRC_BACKENDS:
+        hdlcRx = OpenHdlc.OpenHdlc(crcBackend=rxBackend)
+        assert hdlcRx.dehdlcify(hdlcTx.hdlcify(randomFrame))==randomFrame
+
+def test_benchmark():
+    '''
+    \brief Micro-benchmark of the CRC backends, against the per-byte loop.
+    '''
+
+    log.debug("\n---------- test_benchmark")
+
+    frames = [os.urandom(BENCH_FRAME_LEN) for _ in range(BENCH_NUM_FRAMES)]
+
+    results = [('perByte',referenceCrc)]
+    for crcBackend in OpenHdlc.CRC_BACKENDS:
+        results += [(crcBackend.NAME,crcBackend().compute)]
+
+    for (name,func) in results:
+        start = time.clock()
+        for f in frames:
+            func(f)
+        duration = max(time.clock()-start,1e-6)
+        log.info('{0:<10} {1:>8.2f} MB/s, {2:>6.2f} us per {3}-byte frame'.format(
+                name,
+                BENCH_FRAME_LEN*BENCH_NUM_FRAMES/duration/1e6,
+                duration/BENCH_NUM_FRAMES*1e6,
+                BENCH_FRAME_LEN,
+            )
+        )
@@ -6,6 +6,7 @@ sys.path.insert(0, os.path.join(cur_path, '..'))                           # mot
 sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
 
 import random
+import time
 
 import pytest
 
@@ -113,3 +114,39 @@ def test_randdomBackAndForth(randomFrame):
     log.debug("dehdlcified:    {0}".format(u.formatBuf(frameDehdlcified)))
     
     assert frameDehdlcified==randomFrame
+
+def test_benchmark():
+    '''
+    \brief Throughput of hdlcify/dehdlcify for 10- to 127-byte frames, with
+           the OpenHdlc logger not enabled for debug.
+    '''
+    
+    log.debug("\n---------- test_benchmark")
+    
+    hdlc         = OpenHdlc.OpenHdlc()
+    hdlcLogger   = logging.getLogger('OpenHdlc')
+    
+    for frameLen in [10,32,64,127]:
+        
+        frames = [''.join([chr(random.randint(0x00,0xff)) for _ in range(frameLen)]) for _ in range(2000)]
+        
+        hdlcLogger.setLevel(logging.ERROR)
+        try:
+            start            = time.clock()
+            frameHdlcified   = [hdlc.hdlcify(f) for f in frames]
+            durationHdlcify  = max(time.clock()-start,1e-6)
+            
+            start            = time.clock()
+            frameDehdlcified = [hdlc.dehdlcify(f) for f in frameHdlcified]
+            durationDehdlcify= max(time.clock()-start,1e-6)
+        finally:
+            hdlcLogger.setLevel(logging.DEBUG)
+        
+        assert frameDehdlcified==frames
+        
+        log.info('{0:>3}-byte frames: hdlcify {1:>8.0f} frames/s, dehdlcify {2:>8.0f} frames/s'.format(
+                frameLen,
+                len(frames)/durationHdlcify,
+                len(frames)/durationDehdlcify,
+            )
+        )
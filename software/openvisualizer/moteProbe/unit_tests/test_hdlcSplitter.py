@@ -0,0 +1,246 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteProbe/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import random
+import time
+
+import pytest
+
+import OpenHdlc
+import openvisualizer_utils as u
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_hdlcSplitter.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_hdlcSplitter')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_hdlcSplitter',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+BAUDRATE              = 115200
+BYTES_PER_SECOND      = BAUDRATE/10    # 8N1: 10 bits on the wire per byte
+BENCH_NUM_FRAMES      = 2000
+BENCH_OS_BUFFER_SIZE  = 64             # bytes waiting in the OS buffer per read
+
+#============================ fixtures ========================================
+
+def _randomStream(numFrames,maxFrameLen=100):
+    '''
+    \brief Build a serial byte stream made of HDLC frames, with some noise
+           (repeated flags, garbage between frames) in between.
+    '''
+    hdlc     = OpenHdlc.OpenHdlc()
+    frames   = []
+    stream   = []
+    for _ in range(numFrames):
+        frame = ''.join([chr(random.randint(0x00,0xff)) for _ in range(random.randint(1,maxFrameLen))])
+        frames.append(frame)
+        noise = random.randint(0,3)
+        if   noise==1:
+            stream.append(OpenHdlc.OpenHdlc.HDLC_FLAG*3)
+        elif noise==2:
+            stream.append('\x00\x11\x22')
+        stream.append(hdlc.hdlcify(frame))
+    return (frames,''.join(stream))
+
+CHUNKSIZES = [1,2,7,64,4096]
+
+@pytest.fixture(params=CHUNKSIZES)
+def chunkSize(request):
+    return request.param
+
+#============================ helpers =========================================
+
+class LegacyReceiver(object):
+    '''
+    \brief Reference per-byte receive loop, as moteProbeSerialThread used to
+           implement it.
+    '''
+
+    def __init__(self):
+        self.hdlc           = OpenHdlc.OpenHdlc()
+        self.lastRxByte     = self.hdlc.HDLC_FLAG
+        self.busyReceiving  = False
+        self.inputBuf       = ''
+        self.frames         = []
+
+    def rx(self,rxByte):
+        if      (
+                    (not self.busyReceiving)             and
+                    self.lastRxByte==self.hdlc.HDLC_FLAG and
+                    rxByte!=self.hdlc.HDLC_FLAG
+                ):
+            self.busyReceiving       = True
+            self.inputBuf            = self.hdlc.HDLC_FLAG
+            self.inputBuf           += rxByte
+        elif    (
+                    self.busyReceiving                   and
+                    rxByte!=self.hdlc.HDLC_FLAG
+                ):
+            self.inputBuf           += rxByte
+        elif    (
+                    self.busyReceiving                   and
+                    rxByte==self.hdlc.HDLC_FLAG
+                ):
+            self.busyReceiving       = False
+            self.inputBuf           += rxByte
+            self.frames.append(self.inputBuf)
+        self.lastRxByte = rxByte
+
+class FakeSerial(object):
+    '''
+    \brief Serial port stand-in, with osBufferSize bytes waiting in the OS
+           buffer each time the reader wakes up.
+    '''
+
+    def __init__(self,stream,osBufferSize):
+        self.stream         = stream
+        self.osBufferSize   = osBufferSize
+        self.pos            = 0
+        self.waitingUntil   = 0
+
+    def read(self,size=1):
+        if self.pos>=self.waitingUntil:
+            self.waitingUntil = self.pos+self.osBufferSize
+        returnVal = self.stream[self.pos:self.pos+size]
+        self.pos += len(returnVal)
+        return returnVal
+
+    def inWaiting(self):
+        return max(0,min(self.waitingUntil,len(self.stream))-self.pos)
+
+    def done(self):
+        return self.pos>=len(self.stream)
+
+#============================ tests ===========================================
+
+def test_singleFrame():
+
+    log.debug("\n---------- test_singleFrame")
+
+    hdlc     = OpenHdlc.OpenHdlc()
+    splitter = OpenHdlc.HdlcFrameSplitter()
+
+    frame    = hdlc.hdlcify('\x53\x11\x22')
+
+    assert splitter.feed(frame[:2])==[]
+    assert splitter.feed(frame[2:])==[frame]
+    assert splitter.feed('')==[]
+
+def test_sharedFlag():
+
+    log.debug("\n---------- test_sharedFlag")
+
+    splitter = OpenHdlc.HdlcFrameSplitter()
+
+    # the closing flag of a frame opens the next one, repeated flags ignored
+    assert splitter.feed('~ab~cd~~~ef~')==['~ab~','~cd~','~ef~']
+
+def test_splitAcrossFeeds():
+
+    log.debug("\n---------- test_splitAcrossFeeds")
+
+    splitter = OpenHdlc.HdlcFrameSplitter()
+
+    # the serial line is idle (flag) when the splitter starts
+    assert splitter.feed('ab~xy')==['~ab~']
+    assert splitter.feed('z')==[]
+    assert splitter.feed('~~')==['~xyz~']
+
+def test_sameAsLegacy(chunkSize):
+
+    log.debug("\n---------- test_sameAsLegacy chunkSize={0}".format(chunkSize))
+
+    (frames,stream) = _randomStream(200)
+
+    # legacy
+    legacy = LegacyReceiver()
+    for b in stream:
+        legacy.rx(b)
+
+    # splitter
+    splitter  = OpenHdlc.HdlcFrameSplitter()
+    result    = []
+    for i in range(0,len(stream),chunkSize):
+        result += splitter.feed(stream[i:i+chunkSize])
+
+    assert result==legacy.frames
+
+    # all frames are recovered, noise is rejected by the CRC check
+    hdlc      = OpenHdlc.OpenHdlc()
+    valid     = []
+    for f in result:
+        try:
+            valid.append(hdlc.dehdlcify(f))
+        except OpenHdlc.HdlcException:
+            pass
+    assert valid==frames
+
+def test_benchmark():
+    '''
+    \brief Compare frames/s and CPU per mote of the per-byte receive loop and
+           of bulk reads fed into the HdlcFrameSplitter.
+    '''
+
+    log.debug("\n---------- test_benchmark")
+
+    (frames,stream) = _randomStream(BENCH_NUM_FRAMES)
+
+    # per-byte loop
+    serialPort = FakeSerial(stream,BENCH_OS_BUFFER_SIZE)
+    legacy     = LegacyReceiver()
+    startCpu   = time.clock()
+    while not serialPort.done():
+        legacy.rx(serialPort.read(1))
+    legacyCpu  = time.clock()-startCpu
+
+    # bulk read + splitter
+    serialPort = FakeSerial(stream,BENCH_OS_BUFFER_SIZE)
+    splitter   = OpenHdlc.HdlcFrameSplitter()
+    result     = []
+    startCpu   = time.clock()
+    while not serialPort.done():
+        rxBytes     = serialPort.read(1)
+        numWaiting  = serialPort.inWaiting()
+        if numWaiting:
+            rxBytes += serialPort.read(numWaiting)
+        result     += splitter.feed(rxBytes)
+    bulkCpu    = time.clock()-startCpu
+
+    assert result==legacy.frames
+
+    # log
+    for (name,cpu) in [('per-byte',legacyCpu),('bulk',bulkCpu)]:
+        cpu = max(cpu,1e-6)
+        log.info('{0:<10} {1:>10.0f} frames/s, {2:>6.2f}% CPU per mote at {3} baud'.format(
+                name,
+                len(frames)/cpu,
+                100.0*cpu/len(stream)*BYTES_PER_SECOND,
+                BAUDRATE,
+            )
+        )
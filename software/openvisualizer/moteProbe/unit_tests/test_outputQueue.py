@@ -0,0 +1,130 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteProbe/
+
+import pytest
+
+import moteProbeOutputQueue
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_outputQueue.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_outputQueue')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_outputQueue',
+                        'moteProbeOutputQueue',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ helpers =========================================
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+#============================ tests ===========================================
+
+def test_fifo():
+
+    log.debug("\n---------- test_fifo")
+
+    q = moteProbeOutputQueue.moteProbeOutputQueue()
+
+    for i in range(5):
+        assert q.put(i)
+    assert len(q)==5
+    assert q.get(2)==[0,1]
+    assert q.get(10)==[2,3,4]
+    assert q.get(1)==[]
+
+def test_dropNewest():
+
+    log.debug("\n---------- test_dropNewest")
+
+    q = moteProbeOutputQueue.moteProbeOutputQueue(
+        highWatermark = 4,
+        lowWatermark  = 2,
+        policy        = moteProbeOutputQueue.moteProbeOutputQueue.POLICY_DROP_NEWEST,
+    )
+
+    assert [q.put(i) for i in range(6)]==[True]*4+[False]*2
+    assert q.getStats()['congested']
+
+    # still congested above the low watermark
+    assert q.get(1)==[0]
+    assert not q.put(6)
+
+    # accepting again once drained down to the low watermark
+    assert q.get(1)==[1]
+    assert q.put(7)
+    assert q.get(10)==[2,3,7]
+
+    stats = q.getStats()
+    assert stats['numQueued']==5
+    assert stats['numSent']==5
+    assert stats['numDropped']==3
+    assert stats['numCongestions']==1
+    assert stats['maxDepth']==4
+    assert stats['depth']==0
+    assert not stats['congested']
+
+def test_dropOldest():
+
+    log.debug("\n---------- test_dropOldest")
+
+    q = moteProbeOutputQueue.moteProbeOutputQueue(
+        highWatermark = 3,
+        policy        = moteProbeOutputQueue.moteProbeOutputQueue.POLICY_DROP_OLDEST,
+    )
+
+    assert all([q.put(i) for i in range(5)])
+    assert q.get(10)==[2,3,4]
+
+    stats = q.getStats()
+    assert stats['numQueued']==5
+    assert stats['numDropped']==2
+    assert stats['maxDepth']==3
+
+def test_latency():
+
+    log.debug("\n---------- test_latency")
+
+    clock = FakeClock()
+    q     = moteProbeOutputQueue.moteProbeOutputQueue(clock=clock)
+
+    assert q.getStats()['latency']=={'p50':None,'p90':None,'p99':None,'max':None}
+
+    # frame i waits i ms
+    for i in range(100):
+        q.put(i)
+    for i in range(100):
+        clock.now = 0.001*i
+        q.get(1)
+
+    latency = q.getStats()['latency']
+    assert latency['p50']==pytest.approx(0.050)
+    assert latency['p90']==pytest.approx(0.090)
+    assert latency['p99']==pytest.approx(0.099)
+    assert latency['max']==pytest.approx(0.099)
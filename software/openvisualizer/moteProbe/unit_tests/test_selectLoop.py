@@ -0,0 +1,200 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteProbe/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+import OpenHdlc
+import moteProbe
+import moteProbeSelectLoop
+from moteConnector import OpenParser
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_selectLoop.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_selectLoop')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_selectLoop',
+                        'moteProbe',
+                        'moteProbeSerialProtocol',
+                        'moteProbeSelectLoop',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+NUM_MOTES   = 4
+BAUDRATE    = 115200
+TIMEOUT     = 5.0
+
+#============================ fixtures ========================================
+
+@pytest.fixture(scope='module')
+def motes(request):
+    '''
+    \brief NUM_MOTES pseudo-terminals, each served by a moteProbe using the
+           select engine.
+
+    \returns A list of (masterFd,moteProbe) tuples.
+    '''
+
+    numThreads = threading.active_count()
+
+    returnVal = []
+    for tcpport in _freeTcpPorts(NUM_MOTES):
+        (masterFd,slaveFd) = os.openpty()
+        mp = moteProbe.moteProbe(
+            (os.ttyname(slaveFd),BAUDRATE),
+            tcpport,
+            engine = moteProbe.moteProbe.ENGINE_SELECT,
+        )
+        returnVal += [(masterFd,mp)]
+
+    # all motes are served by the loop thread
+    assert threading.active_count()==numThreads+1
+
+    def fin():
+        moteProbeSelectLoop.moteProbeSelectLoop().close()
+    request.addfinalizer(fin)
+
+    return returnVal
+
+#============================ helpers =========================================
+
+def _freeTcpPorts(num):
+    sockets   = []
+    for _ in range(num):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1',0))
+        sockets += [s]
+    returnVal = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return returnVal
+
+def _waitFor(condition):
+    start = time.time()
+    while not condition():
+        assert time.time()-start<TIMEOUT
+        time.sleep(0.01)
+
+def _connect(motes):
+    loop    = moteProbeSelectLoop.moteProbeSelectLoop()
+    clients = []
+    for (_,mp) in motes:
+        c = socket.create_connection(('127.0.0.1',mp.getTcpPort()),TIMEOUT)
+        clients += [c]
+    _waitFor(lambda: all([p.conn!=None for p in loop.tcpPorts]))
+    _waitFor(lambda: all([mp.serialProtocol.serial!=None for (_,mp) in motes]))
+    return clients
+
+def _recvExactly(conn,numBytes):
+    returnVal = ''
+    while len(returnVal)<numBytes:
+        data = conn.recv(numBytes-len(returnVal))
+        assert data
+        returnVal += data
+    return returnVal
+
+#============================ tests ===========================================
+
+def test_serialToTcp(motes):
+
+    log.debug("\n---------- test_serialToTcp")
+
+    hdlc    = OpenHdlc.OpenHdlc()
+    clients = _connect(motes)
+
+    for _ in range(10):
+        for (i,(masterFd,mp)) in enumerate(motes):
+            os.write(masterFd,hdlc.hdlcify('\x44mote{0}'.format(i)))
+        for (i,c) in enumerate(clients):
+            assert _recvExactly(c,len('\x44mote0'))=='\x44mote{0}'.format(i)
+
+    for c in clients:
+        c.close()
+
+def test_tcpToSerial(motes):
+
+    log.debug("\n---------- test_tcpToSerial")
+
+    hdlc    = OpenHdlc.OpenHdlc()
+    clients = _connect(motes)
+
+    for (i,c) in enumerate(clients):
+        c.sendall('toMote{0}'.format(i))
+    _waitFor(lambda: all([mp.serialProtocol.outputBuf for (_,mp) in motes]))
+
+    # the data is written to the mote when it requests it
+    for (i,(masterFd,mp)) in enumerate(motes):
+        os.write(masterFd,hdlc.hdlcify(chr(OpenParser.OpenParser.SERFRAME_MOTE2PC_REQUEST)))
+        expected = hdlc.hdlcify('toMote{0}'.format(i))
+        rxBytes  = ''
+        while len(rxBytes)<len(expected):
+            rxBytes += os.read(masterFd,len(expected)-len(rxBytes))
+        assert rxBytes==expected
+
+    for c in clients:
+        c.close()
+
+def test_txBufLimit(motes):
+    '''
+    \brief Frames for a connection which does not read are buffered up to
+           MAX_TX_BUF bytes, then dropped whole; the ones buffered are sent
+           in order once it reads.
+    '''
+
+    log.debug("\n---------- test_txBufLimit")
+
+    FRAME_LENGTH = 1000
+
+    clients = _connect(motes)
+    loop    = moteProbeSelectLoop.moteProbeSelectLoop()
+    tcpPort = [p for p in loop.tcpPorts if p.socketport==motes[0][1].getTcpPort()][0]
+
+    # fill the socket buffers, then the txBuf of the port
+    numFrames = 0
+    while tcpPort.getStats()['numTxDropped']<10:
+        assert numFrames<100*1024*1024/FRAME_LENGTH
+        tcpPort.send(struct.pack('>I',numFrames)+'\x55'*(FRAME_LENGTH-4))
+        numFrames += 1
+
+    stats = tcpPort.getStats()
+    assert stats['txBytes']<=tcpPort.MAX_TX_BUF
+    assert stats['txBytes']>tcpPort.MAX_TX_BUF-FRAME_LENGTH
+
+    # the frames accepted are received whole, in order
+    numSent = numFrames-stats['numTxDropped']
+    rxBytes = _recvExactly(clients[0],numSent*FRAME_LENGTH)
+    for i in range(numSent):
+        assert struct.unpack('>I',rxBytes[i*FRAME_LENGTH:i*FRAME_LENGTH+4])[0]==i
+    _waitFor(lambda: tcpPort.getStats()['txBytes']==0)
+
+    for c in clients:
+        c.close()
@@ -0,0 +1,186 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteProbe/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import itertools
+
+import pytest
+
+import OpenHdlc
+import moteProbeSerialProtocol
+from moteConnector import OpenParser
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_serialProtocol.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_serialProtocol')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_serialProtocol',
+                        'moteProbeSerialProtocol',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+REQUEST = chr(OpenParser.OpenParser.SERFRAME_MOTE2PC_REQUEST)
+
+#============================ helpers =========================================
+
+class FakeSerial(object):
+    '''
+    \brief Serial port stand-in, recording what is written to it.
+    '''
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self,data):
+        self.writes.append(data)
+
+SERIALPORT_ID = itertools.count()
+
+def _serialProtocol(**kwargs):
+    '''
+    \brief Create a moteProbeSerialProtocol on a FakeSerial, with a unique
+           port name so the dispatcher signals do not overlap between tests.
+    '''
+    returnVal = moteProbeSerialProtocol.moteProbeSerialProtocol(
+        'fake{0}'.format(SERIALPORT_ID.next()),
+        115200,
+        **kwargs
+    )
+    returnVal.serial = FakeSerial()
+    return returnVal
+
+def _request(sp,credit=None):
+    frame = REQUEST
+    if credit!=None:
+        frame += chr(credit)
+    sp.handleRxBytes(OpenHdlc.OpenHdlc().hdlcify(frame))
+
+#============================ tests ===========================================
+
+def test_single():
+
+    log.debug("\n---------- test_single")
+
+    hdlc = OpenHdlc.OpenHdlc()
+    sp   = _serialProtocol()
+
+    for i in range(3):
+        sp.send('frame{0}'.format(i))
+
+    # one frame per request
+    _request(sp)
+    _request(sp)
+    assert sp.serial.writes==[hdlc.hdlcify('frame0'),hdlc.hdlcify('frame1')]
+
+    # a credit byte is not understood in that mode
+    _request(sp,credit=5)
+    assert len(sp.serial.writes)==2
+
+    stats = sp.getStats()
+    assert stats['numQueued']==3
+    assert stats['numSent']==2
+    assert stats['numRequests']==2
+    assert stats['depth']==1
+
+def test_credit():
+
+    log.debug("\n---------- test_credit")
+
+    hdlc = OpenHdlc.OpenHdlc()
+    sp   = _serialProtocol(
+        flowControl     = moteProbeSerialProtocol.moteProbeSerialProtocol.FLOWCONTROL_CREDIT,
+        implicitCredit  = 2,
+    )
+
+    frames = ['frame{0}'.format(i) for i in range(10)]
+    for f in frames:
+        sp.send(f)
+
+    # the credit byte tells how many frames to write, in one write
+    _request(sp,credit=4)
+    assert sp.serial.writes==[''.join([hdlc.hdlcify(f) for f in frames[:4]])]
+
+    # no credit byte implies implicitCredit frames
+    _request(sp)
+    assert sp.serial.writes[-1]==''.join([hdlc.hdlcify(f) for f in frames[4:6]])
+
+    # no credit, nothing written
+    _request(sp,credit=0)
+    assert len(sp.serial.writes)==2
+
+    # never more than what is queued
+    _request(sp,credit=200)
+    _request(sp,credit=200)
+    assert sp.serial.writes[-1]==''.join([hdlc.hdlcify(f) for f in frames[6:]])
+
+    stats = sp.getStats()
+    assert stats['numSent']==10
+    assert stats['numSerialWrites']==3
+    assert stats['numRequests']==5
+    assert stats['numEmptyRequests']==2
+    assert stats['depth']==0
+
+def test_bounded():
+
+    log.debug("\n---------- test_bounded")
+
+    hdlc = OpenHdlc.OpenHdlc()
+    sp   = _serialProtocol(outputBufSize=3)
+
+    for i in range(5):
+        sp.send('frame{0}'.format(i))
+
+    # by default, the newest frames are dropped
+    stats = sp.getStats()
+    assert stats['depth']==3
+    assert stats['numQueued']==3
+    assert stats['numDropped']==2
+
+    _request(sp)
+    assert sp.serial.writes==[hdlc.hdlcify('frame0')]
+
+def test_dataNotRequest():
+
+    log.debug("\n---------- test_dataNotRequest")
+
+    sp = _serialProtocol(
+        flowControl     = moteProbeSerialProtocol.moteProbeSerialProtocol.FLOWCONTROL_CREDIT,
+    )
+
+    received = []
+    def _rx(data):
+        received.append(data)
+
+    from pydispatch import dispatcher
+    dispatcher.connect(_rx,signal='bytesFromSerialPort'+sp.serialportName)
+
+    # a longer frame starting with the request byte is not a request
+    sp.send('frame')
+    frame = REQUEST+'\x01\x02'
+    sp.handleRxBytes(OpenHdlc.OpenHdlc().hdlcify(frame))
+    assert received==[frame]
+    assert sp.serial.writes==[]
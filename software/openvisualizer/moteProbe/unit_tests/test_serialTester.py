@@ -0,0 +1,209 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteProbe/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import socket
+import time
+
+import pytest
+
+import moteProbeSerialProtocol
+import moteProbeSerialThread
+import moteProbeSocketThread
+import moteProbeVirtualMote
+from moteConnector import SerialTester
+from moteConnector import TcpFramer
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_serialTester.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_serialTester')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_serialTester',
+                        'SerialTester',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+LOCAL_ADDRESS = '127.0.0.1'
+NUM_TESTPKT   = 50
+TIMEOUT       = 10.0
+
+#============================ helpers =========================================
+
+def _freeTcpPort():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind((LOCAL_ADDRESS,0))
+    returnVal = s.getsockname()[1]
+    s.close()
+    return returnVal
+
+def _waitFor(condition):
+    start = time.time()
+    while not condition():
+        assert time.time()-start<TIMEOUT
+        time.sleep(0.01)
+
+@pytest.fixture
+def tester():
+    '''
+    \brief A SerialTester attached, through a moteProbe, to a virtual mote
+           which echoes its test packets.
+    '''
+    farm           = moteProbeVirtualMote.moteProbeVirtualMoteFarm(
+        1,
+        monitorSignal = None,
+        statusRate    = 0,
+        dataRate      = 0,
+        requestRate   = 1000.0,
+        credit        = 8,
+    )
+    serialport     = farm.getSerialPorts()[0]
+    tcpport        = _freeTcpPort()
+
+    serialProtocol = moteProbeSerialProtocol.moteProbeSerialProtocol(
+        *serialport,
+        flowControl = moteProbeSerialProtocol.moteProbeSerialProtocol.FLOWCONTROL_CREDIT
+    )
+    serialThread   = moteProbeSerialThread.moteProbeSerialThread(serialProtocol)
+    socketThread   = moteProbeSocketThread.moteProbeSocketThread(
+        tcpport,
+        serialport[0],
+        framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+    )
+    tester         = SerialTester.SerialTester(
+        LOCAL_ADDRESS,
+        tcpport,
+        framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+    )
+    for t in [serialThread,socketThread,tester]:
+        t.daemon = True
+        t.start()
+    farm.start()
+
+    _waitFor(lambda: socketThread.conn!=None)
+
+    tester.setNumTestPkt(NUM_TESTPKT)
+    tester.setTimeout(int(TIMEOUT/2))
+
+    yield tester
+
+    tester.quit()
+    farm.close()
+
+#============================ tests ===========================================
+
+def test_stopAndWait(tester):
+
+    log.debug("\n---------- test_stopAndWait")
+
+    tester.test()
+    stats = tester.getStats()
+    log.info("stop-and-wait: {0}".format(stats))
+
+    assert stats['numSent']==NUM_TESTPKT
+    assert stats['numOk']==NUM_TESTPKT
+    assert stats['numBytesOk']==NUM_TESTPKT*SerialTester.SerialTester.DFLT_TESTPKT_LENGTH
+    assert stats['loss']==0.0
+    assert stats['throughputFps']>0
+    assert 0<stats['rtt']['min']<=stats['rtt']['p50']<=stats['rtt']['p99']<=stats['rtt']['max']
+
+def test_pipelined(tester):
+
+    log.debug("\n---------- test_pipelined")
+
+    tester.setMode(SerialTester.SerialTester.MODE_PIPELINED)
+    tester.setWindow(8)
+    tester.test()
+    stats = tester.getStats()
+    log.info("pipelined: {0}".format(stats))
+
+    assert stats['numSent']==NUM_TESTPKT
+    assert stats['numOk']==NUM_TESTPKT
+    assert stats['numCorrupted']==0
+    assert stats['numTimeout']==0
+    assert stats['numUnexpected']==0
+    assert stats['loss']==0.0
+    assert stats['rtt']['p50']<=stats['rtt']['max']
+
+def test_pipelinedTimeout():
+    '''
+    \brief Packets which are not echoed time out, without blocking the test.
+    '''
+
+    log.debug("\n---------- test_pipelinedTimeout")
+
+    # a moteProbe whose mote never answers
+    tcpport  = _freeTcpPort()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind((LOCAL_ADDRESS,tcpport))
+    listener.listen(1)
+
+    tester   = SerialTester.SerialTester(
+        LOCAL_ADDRESS,
+        tcpport,
+        framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+    )
+    tester.daemon = True
+    tester.start()
+    (conn,_) = listener.accept()
+
+    tester.setMode(SerialTester.SerialTester.MODE_PIPELINED)
+    tester.setWindow(2)
+    tester.setNumTestPkt(3)
+    tester.setTimeout(1)
+    tester.test()
+    stats = tester.getStats()
+
+    assert stats['numSent']==3
+    assert stats['numOk']==0
+    assert stats['numTimeout']==3
+    assert stats['loss']==1.0
+    assert stats['rtt']['p50']==None
+    assert 2.0<=stats['duration']<TIMEOUT
+
+    tester.quit()
+    conn.close()
+    listener.close()
+
+def test_sweep(tester):
+
+    log.debug("\n---------- test_sweep")
+
+    tester.setMode(SerialTester.SerialTester.MODE_PIPELINED)
+    pktLens = [4,16,64]
+    tester.sweep(pktLens)
+    results = tester.getSweepResults()
+    for (pktLen,stats) in results:
+        log.info("pklen {0:>3}: {1:.0f} bytes/s, {2:.0f} frames/s, rtt p50 {3:.4f}s".format(
+            pktLen,stats['throughputBps'],stats['throughputFps'],stats['rtt']['p50']))
+
+    assert [l for (l,_) in results]==pktLens
+    for (pktLen,stats) in results:
+        assert stats['numOk']==NUM_TESTPKT
+        assert stats['numBytesOk']==NUM_TESTPKT*pktLen
+
+    # the test packet length is restored
+    assert tester.testPktLen==SerialTester.SerialTester.DFLT_TESTPKT_LENGTH
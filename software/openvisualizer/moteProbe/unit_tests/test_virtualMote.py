@@ -0,0 +1,394 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteProbe/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import socket
+import time
+
+import pytest
+
+from pydispatch import dispatcher
+
+import moteProbeSerialProtocol
+import moteProbeSerialThread
+import moteProbeSocketThread
+import moteProbeVirtualMote
+import moteProbePipe
+from moteConnector import OpenParser
+from moteConnector import TcpFramer
+from moteConnector import moteConnector
+from moteConnector import MoteConnectorConsumer
+from moteConnector import MoteConnectorRouter
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_virtualMote.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_virtualMote')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_virtualMote',
+                        'moteProbeVirtualMote',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+LOCAL_ADDRESS = '127.0.0.1'
+NUM_MOTES     = 5
+RUN_DURATION  = 1.0
+TIMEOUT       = 10.0
+DATA_SIGNAL   = 'inputFromMoteProbe.data.internet'
+
+serialThreads = []
+
+#============================ helpers =========================================
+
+def _freeTcpPort():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind((LOCAL_ADDRESS,0))
+    returnVal = s.getsockname()[1]
+    s.close()
+    return returnVal
+
+def _waitFor(condition):
+    start = time.time()
+    while not condition():
+        assert time.time()-start<TIMEOUT
+        time.sleep(0.01)
+
+def _attach(serialport,inProcess=False):
+    '''
+    \brief Serve a serial port as a moteProbe with the thread engine does,
+           with daemon threads, and connect a moteConnector to it.
+
+    \param inProcess If True, the moteConnector reads the moteProbe through
+                     a moteProbePipe, and sends its notifications to direct
+                     consumers.
+
+    \returns A (serialProtocol,moteConnector) tuple.
+    '''
+    tcpport        = _freeTcpPort()
+    pipe           = moteProbePipe.moteProbePipe() if inProcess else None
+
+    serialProtocol = moteProbeSerialProtocol.moteProbeSerialProtocol(*serialport,pipe=pipe)
+    serialThread   = moteProbeSerialThread.moteProbeSerialThread(serialProtocol)
+    serialThreads.append(serialThread)
+    socketThread   = None
+    if not inProcess:
+        socketThread = moteProbeSocketThread.moteProbeSocketThread(
+            tcpport,
+            serialport[0],
+            framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+        )
+    connector      = moteConnector.moteConnector(
+        LOCAL_ADDRESS,
+        tcpport,
+        framing = TcpFramer.TcpFramer.FRAMING_LENGTH,
+        pipe    = pipe,
+        direct  = inProcess,
+    )
+    for t in [serialThread,socketThread,connector]:
+        if t:
+            t.daemon = True
+            t.start()
+
+    if socketThread:
+        _waitFor(lambda: socketThread.conn!=None and connector.connected)
+
+    return (serialProtocol,connector)
+
+def _close(farm):
+    '''
+    \brief Close a farm, and wait for the serial threads to give up on its
+           pseudo-terminals, so they do not reopen the next farm's.
+    '''
+    farm.close()
+    _waitFor(lambda: not any([t.is_alive() for t in serialThreads]))
+
+def _consume(farm,inProcess=False):
+    '''
+    \brief Hand the data frames to the farm through a MoteConnectorConsumer,
+           as lbrClient receives them.
+    '''
+    consumer = MoteConnectorConsumer.MoteConnectorConsumer(
+        signal        = DATA_SIGNAL,
+        sender        = dispatcher.Any,
+        notifCallback = farm.monitor,
+        direct        = inProcess,
+    )
+    consumer.daemon = True
+    consumer.start()
+    return consumer
+
+def _unconsume(consumer):
+    if consumer.direct:
+        MoteConnectorRouter.MoteConnectorRouter().disconnect(consumer,DATA_SIGNAL)
+    else:
+        dispatcher.disconnect(consumer._eventBusNotification,signal=DATA_SIGNAL)
+
+def _runFarm(numMotes,dataRate,duration,inProcess):
+    '''
+    \brief Run a farm of virtual motes emitting data frames only, consumed
+           in-process or through TCP and the dispatcher.
+
+    \returns A (farm stats,CPU time consumed) tuple.
+    '''
+    farm     = moteProbeVirtualMote.moteProbeVirtualMoteFarm(
+        numMotes,
+        monitorSignal = None,
+        statusRate    = 0,
+        dataRate      = dataRate,
+        errorRate     = 0,
+    )
+    attached = [_attach(serialport,inProcess) for serialport in farm.getSerialPorts()]
+    consumer = _consume(farm,inProcess)
+
+    cpuStart = sum(os.times()[:2])
+    farm.start()
+    time.sleep(duration)
+    for m in farm.motes:
+        m.schedule = [e for e in m.schedule if e[2]==m._emitRequest]
+    _waitFor(lambda: farm.getStats()['numInFlight']==0)
+    cpu      = sum(os.times()[:2])-cpuStart
+
+    stats    = farm.getStats()
+    _unconsume(consumer)
+    _close(farm)
+
+    return (stats,cpu)
+
+#============================ tests ===========================================
+
+def test_frames():
+    '''
+    \brief The frames emitted by a virtual mote are parsed by OpenParser.
+    '''
+
+    log.debug("\n---------- test_frames")
+
+    mote   = moteProbeVirtualMote.moteProbeVirtualMote(
+        0x1234,
+        errorRate   = 1.0,
+    )
+    parser = OpenParser.OpenParser()
+
+    for (emit,eventSubType) in [
+            (mote._emitStatus, 'status'),
+            (mote._emitData,   'data.internet'),
+            (mote._emitError,  'error'),
+        ]:
+        for _ in range(len(mote.statusKeys)):
+            mote.txBuf = ''
+            emit()
+            frames = mote.hdlcSplitter.feed(mote.txBuf)
+            assert len(frames)==1
+            assert parser.parseInput(mote.hdlc.dehdlcify(frames[0]))[0]==eventSubType
+
+    mote.close()
+
+def test_monitor():
+    '''
+    \brief The farm derives the frames lost, reordered and duplicated from
+           the sequence numbers of each mote.
+    '''
+
+    log.debug("\n---------- test_monitor")
+
+    farm = moteProbeVirtualMote.moteProbeVirtualMoteFarm(
+        2,
+        monitorSignal = None,
+    )
+
+    def receive(moteId,seqNum):
+        farm.monitor(moteProbeVirtualMote.moteProbeVirtualMote.DATA_FORMAT.pack(
+            moteProbeVirtualMote.moteProbeVirtualMote.DATA_MARKER,
+            time.time(),
+            moteId,
+            seqNum,
+        ))
+
+    def counters():
+        stats = farm.getStats()
+        return (stats['numReceived'],stats['numLost'],stats['numReordered'],stats['numDuplicates'])
+
+    # 2 and 3 skipped, 1 received again
+    for seqNum in [0,1,4,1]:
+        receive(1,seqNum)
+    assert counters()==(3,2,0,1)
+
+    # 3 arrives late
+    receive(1,3)
+    assert counters()==(4,1,1,1)
+
+    # the sequence numbers are per mote, and other motes are ignored
+    receive(2,0)
+    receive(3,0)
+    assert counters()==(5,1,1,1)
+
+    farm.close()
+
+def test_farm():
+    '''
+    \brief Data frames from a farm of virtual motes go through moteProbes and
+           moteConnectors, and back to the farm, which accounts for them.
+    '''
+
+    log.debug("\n---------- test_farm")
+
+    farm = moteProbeVirtualMote.moteProbeVirtualMoteFarm(
+        NUM_MOTES,
+        statusRate  = 50.0,
+        dataRate    = 50.0,
+        errorRate   = 5.0,
+    )
+    attached = [_attach(serialport) for serialport in farm.getSerialPorts()]
+    farm.start()
+
+    # echo requests are answered, once the mote asks for them
+    for (serialProtocol,connector) in attached:
+        connector.write('\x00'*16+'echo',headerByte=chr(OpenParser.OpenParser.SERFRAME_PC2MOTE_TRIGGERSERIALECHO))
+
+    time.sleep(RUN_DURATION)
+
+    # stop emitting, then wait for the frames in flight
+    for m in farm.motes:
+        m.schedule = [e for e in m.schedule if e[2]==m._emitRequest]
+    _waitFor(lambda: farm.getStats()['numInFlight']==0)
+
+    stats = farm.getStats()
+    log.info("farm stats: {0}".format(stats))
+
+    assert stats['numMotes']==NUM_MOTES
+    assert stats['numData']>NUM_MOTES*RUN_DURATION*50.0/2
+    assert stats['numStatus']>0
+    assert stats['numError']>0
+    assert stats['numReceived']==stats['numData']
+    assert stats['numLost']==stats['numReordered']==stats['numDuplicates']==0
+    assert stats['numEchoes']==NUM_MOTES
+    assert stats['numTxDropped']==0
+    assert 0<=stats['latency']['p50']<=stats['latency']['max']<TIMEOUT
+
+    _close(farm)
+
+def test_farm_inProcess():
+    '''
+    \brief Same as test_farm, the moteProbes handing the frames to the
+           moteConnectors through pipes, and the moteConnectors to a direct
+           consumer.
+    '''
+
+    log.debug("\n---------- test_farm_inProcess")
+
+    farm     = moteProbeVirtualMote.moteProbeVirtualMoteFarm(
+        NUM_MOTES,
+        monitorSignal = None,
+        statusRate    = 50.0,
+        dataRate      = 50.0,
+        errorRate     = 5.0,
+    )
+    attached = [_attach(serialport,inProcess=True) for serialport in farm.getSerialPorts()]
+    consumer = _consume(farm,inProcess=True)
+    farm.start()
+
+    # echo requests go through the pipes
+    for (serialProtocol,connector) in attached:
+        connector.write('\x00'*16+'echo',headerByte=chr(OpenParser.OpenParser.SERFRAME_PC2MOTE_TRIGGERSERIALECHO))
+
+    time.sleep(RUN_DURATION)
+
+    for m in farm.motes:
+        m.schedule = [e for e in m.schedule if e[2]==m._emitRequest]
+    _waitFor(lambda: farm.getStats()['numInFlight']==0)
+
+    stats = farm.getStats()
+    log.info("farm stats: {0}".format(stats))
+
+    assert stats['numData']>NUM_MOTES*RUN_DURATION*50.0/2
+    assert stats['numReceived']==stats['numData']
+    assert stats['numEchoes']==NUM_MOTES
+    assert stats['numTxDropped']==0
+    for (serialProtocol,connector) in attached:
+        pipeStats = serialProtocol.pipe.getStats()
+        assert pipeStats['numDropped']==0
+        assert pipeStats['numWrites']==1
+        assert pipeStats['numFrames']>0
+
+    _unconsume(consumer)
+    _close(farm)
+
+def test_farm_direct():
+    '''
+    \brief The farm monitors the data frames of moteConnectors created with
+           direct=True, which bypass the dispatcher, through the
+           MoteConnectorRouter.
+    '''
+
+    log.debug("\n---------- test_farm_direct")
+
+    farm     = moteProbeVirtualMote.moteProbeVirtualMoteFarm(
+        NUM_MOTES,
+        direct        = True,
+        statusRate    = 0,
+        dataRate      = 50.0,
+        errorRate     = 0,
+    )
+    attached = [_attach(serialport,inProcess=True) for serialport in farm.getSerialPorts()]
+    farm.start()
+
+    time.sleep(RUN_DURATION)
+
+    for m in farm.motes:
+        m.schedule = [e for e in m.schedule if e[2]==m._emitRequest]
+    _waitFor(lambda: farm.getStats()['numInFlight']==0)
+
+    stats = farm.getStats()
+    assert stats['numData']>0
+    assert stats['numReceived']==stats['numData']
+
+    _close(farm)
+    assert DATA_SIGNAL not in MoteConnectorRouter.MoteConnectorRouter().consumers
+
+def test_benchmark_transport():
+    '''
+    \brief Per-frame latency and CPU time, from the virtual motes to a
+           consumer, through TCP and the dispatcher, and in-process.
+
+    \note The CPU time includes emulating the motes, the same for both.
+    '''
+
+    log.debug("\n---------- test_benchmark_transport")
+
+    DATA_RATE = 200.0
+
+    for inProcess in [False,True]:
+        (stats,cpu) = _runFarm(NUM_MOTES,DATA_RATE,RUN_DURATION,inProcess)
+
+        assert stats['numReceived']==stats['numData']>0
+
+        log.info("{0:>10}: {1} frames, latency p50 {2:.0f}us p99 {3:.0f}us, CPU {4:.0f}us/frame".format(
+            'in-process' if inProcess else 'TCP',
+            stats['numReceived'],
+            stats['latency']['p50']*1000000,
+            stats['latency']['p99']*1000000,
+            cpu*1000000/stats['numReceived'],
+        ))
@@ -0,0 +1,233 @@
+'''
+\brief History of the numeric fields of a state element, in ring buffers.
+'''
+import array
+import time
+
+class HistoryTier(object):
+    '''
+    \brief A ring buffer of the samples of a History, or of aggregates of
+           them over buckets of a fixed duration.
+    
+    All the arrays are allocated with the tier: a bucket is overwritten once
+    the ring buffer wraps around.
+    '''
+    
+    def __init__(self,period,size,numFields):
+        '''
+        \param period    The duration of a bucket, in s, None to keep each
+                         sample in its own bucket.
+        \param size      The number of buckets.
+        \param numFields The number of fields of the samples.
+        '''
+        
+        # store params
+        self.period               = period
+        self.size                 = size
+        
+        # local variables
+        self.start                = array.array('d',[0.0])*size  ##< start of each bucket, time of the sample if raw
+        self.count                = array.array('l',[0])*size    ##< samples in each bucket
+        self.since                = array.array('d',[0.0])*size  ##< time of the sample before the first one of each bucket, its increments count from then
+        self.sum                  = [array.array('d',[0.0])*size for _ in range(numFields)]
+        self.min                  = [array.array('d',[0.0])*size for _ in range(numFields)]
+        self.max                  = [array.array('d',[0.0])*size for _ in range(numFields)]
+        self.increments           = [array.array('d',[0.0])*size for _ in range(numFields)]
+        self.index                = size-1  ##< bucket of the latest sample
+        self.num                  = 0       ##< buckets used
+    
+    #======================== public ==========================================
+    
+    def record(self,timestamp,previous,values,increments):
+        if self.period==None:
+            bucketStart           = timestamp
+        else:
+            bucketStart           = timestamp-timestamp%self.period
+        i                         = self.index
+        if self.period==None or self.num==0 or bucketStart!=self.start[i]:
+            
+            # open a new bucket, overwriting the oldest once full
+            i                     = (i+1)%self.size
+            self.index            = i
+            if self.num<self.size:
+                self.num         += 1
+            self.start[i]         = bucketStart
+            self.since[i]         = previous
+            self.count[i]         = 1
+            for f in range(len(values)):
+                self.sum[f][i]        = values[f]
+                self.min[f][i]        = values[f]
+                self.max[f][i]        = values[f]
+                self.increments[f][i] = increments[f]
+        else:
+            self.count[i]        += 1
+            for f in range(len(values)):
+                self.sum[f][i]       += values[f]
+                if values[f]<self.min[f][i]:
+                    self.min[f][i]    = values[f]
+                if values[f]>self.max[f][i]:
+                    self.max[f][i]    = values[f]
+                self.increments[f][i] += increments[f]
+    
+    def covers(self,since):
+        '''
+        \returns True if the tier holds all the samples after a time, i.e. it
+                 never wrapped around, or its oldest bucket starts before.
+        '''
+        return self.num<self.size or self.start[(self.index+1)%self.size]<=since
+    
+    def aggregate(self,f,since):
+        '''
+        \brief Aggregate a field over the buckets holding samples after a
+               time.
+        
+        \returns A (count,sum,min,max,increments,since) tuple, None if there
+                 is no such bucket. The increments were counted from since,
+                 the time of the sample before the oldest bucket included,
+                 which may be before the time asked for.
+        '''
+        count                     = 0
+        (total,low,high,incr)     = (0.0,None,None,0.0)
+        i                         = self.index
+        for _ in range(self.num):
+            if self.period==None:
+                inWindow          = self.start[i]>since
+            else:
+                inWindow          = self.start[i]+self.period>since
+            if not inWindow:
+                break
+            count                += self.count[i]
+            total                += self.sum[f][i]
+            incr                 += self.increments[f][i]
+            if low==None or self.min[f][i]<low:
+                low               = self.min[f][i]
+            if high==None or self.max[f][i]>high:
+                high              = self.max[f][i]
+            oldest                = i
+            i                     = (i-1)%self.size
+        if not count:
+            return None
+        return (count,total,low,high,incr,self.since[oldest])
+
+class History(object):
+    '''
+    \brief History of the numeric fields of a state element, or of a row of
+           a table, e.g. of the numRx, numTx and rssi of a neighbor.
+    
+    The samples are kept in tiers of fixed-size ring buffers: the last
+    rawSize samples as received, and their aggregates over buckets of 10 s
+    and of 1 min (see DFLT_TIERS). A bucket holds the number of samples, and
+    the sum, minimum and maximum of each field. For a counter, it also holds
+    the sum of its increments, a counter wrapping around at its modulus, to
+    compute rates.
+    
+    Recording a sample is O(1) and allocates no buffer: the memory taken is
+    fixed when the History is created.
+    
+    A query over a window uses the finest tier which holds all the samples
+    of the window, so its precision is that of the buckets of this tier.
+    '''
+    
+    DFLT_RAW_SIZE             = 32          ##< samples kept as received
+    DFLT_TIERS                = [(10,30),   ##< (duration of a bucket in s, number of buckets): 5 min
+                                 (60,60),]  ##< 1 h
+    
+    def __init__(self,fields,counters=None,rawSize=DFLT_RAW_SIZE,tiers=DFLT_TIERS):
+        '''
+        \param fields   The names of the fields, in the order of the values
+                        passed to update().
+        \param counters A dictionary of the fields which are counters, to
+                        their modulus, e.g. 256 for a counter of a byte,
+                        None if there are none.
+        \param rawSize  The number of samples kept as received.
+        \param tiers    A list of (duration of a bucket in s, number of
+                        buckets) tuples, from the finest.
+        '''
+        assert rawSize>0
+        for (period,size) in tiers:
+            assert period>0 and size>0
+        
+        # store params
+        self.fields               = list(fields)
+        self.moduli               = [(counters or {}).get(name) for name in self.fields]
+        
+        # local variables
+        self.tiers                = [HistoryTier(None,rawSize,len(self.fields))]
+        self.tiers               += [HistoryTier(period,size,len(self.fields)) for (period,size) in tiers]
+        self.lastValues           = array.array('d',[0.0])*len(self.fields)
+        self.increments           = array.array('d',[0.0])*len(self.fields)
+        self.lastTime             = None
+    
+    #======================== public ==========================================
+    
+    def update(self,values,timestamp=None):
+        '''
+        \param values    The values of the fields, in the order of fields.
+        \param timestamp The time of the sample, in s, now if None.
+        '''
+        if timestamp==None:
+            timestamp             = time.time()
+        
+        # increments of the counters, since the previous sample
+        for f in range(len(self.fields)):
+            if self.moduli[f]==None or self.lastTime==None:
+                self.increments[f] = 0
+            else:
+                self.increments[f] = (values[f]-self.lastValues[f])%self.moduli[f]
+            self.lastValues[f]    = values[f]
+        if self.lastTime==None:
+            previous              = timestamp
+        else:
+            previous              = self.lastTime
+        self.lastTime             = timestamp
+        
+        for tier in self.tiers:
+            tier.record(timestamp,previous,values,self.increments)
+    
+    def getStats(self,field,window,now=None):
+        '''
+        \brief Statistics of a field over the last window s.
+        
+        \param field  The name of the field.
+        \param window The duration of the window, in s.
+        \param now    The end of the window, now if None.
+        
+        \returns A dictionary with the 'count' of samples, and the 'min',
+                 'max' and 'avg' of the field, None if there is no sample.
+                 For a counter, 'rate' is its increase per s, over the
+                 time the buckets used cover, up to now: it may start
+                 before the window, by up to a bucket, or after it, if the
+                 history does not go back that far. None for other fields.
+        '''
+        if field not in self.fields:
+            raise ValueError('No field called {0}'.format(field))
+        if now==None:
+            now                   = time.time()
+        since                     = now-window
+        f                         = self.fields.index(field)
+        
+        # the finest tier holding the whole window, the coarsest otherwise
+        tier                      = self.tiers[-1]
+        for t in self.tiers:
+            if t.covers(since):
+                tier              = t
+                break
+        
+        aggregate                 = tier.aggregate(f,since)
+        if aggregate==None:
+            return None
+        (count,total,low,high,incr,since) = aggregate
+        
+        rate                      = None
+        if self.moduli[f]!=None:
+            duration              = now-since
+            if duration>0:
+                rate              = incr/duration
+        
+        return {
+            'count':  count,
+            'min':    low,
+            'max':    high,
+            'avg':    total/count,
+            'rate':   rate,
+        }
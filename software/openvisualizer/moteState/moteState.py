@@ -14,6 +14,8 @@ import json
 
 from pydispatch import dispatcher
 
+from EventBus      import EventBus
+import History
 from moteConnector import ParserStatus
 from moteConnector import MoteConnectorConsumer
 from openType      import openType,         \
@@ -25,16 +27,32 @@ from openType      import openType,         \
 
 class OpenEncoder(json.JSONEncoder):
     def default(self, obj):
-        if   isinstance(obj, (StateElem,openType.openType)):
+        if   isinstance(obj, openType.openType):
             return { obj.__class__.__name__: obj.__dict__ }
+        elif isinstance(obj, (StateElem,StateRow)):
+            return { obj.__class__.__name__: obj.toDict() }
         else:
             return super(OpenEncoder, self).default(obj)
-                          
+
 class StateElem(object):
+    '''
+    \brief An element of the state of a mote, e.g. its schedule.
+    
+    Its dictionary and JSON forms are built when first asked for, then
+    cached until the next update(), which marks the element dirty. As a
+    serialization may overlap an update made by another thread, the
+    moteState marks the element dirty again once it is updated.
+    '''
+    
+    FORMAT_DICT                        = 'dict'
+    FORMAT_JSON                        = 'json'
+    FORMAT_JSON_COMPACT                = 'jsonCompact'
     
     def __init__(self):
         self.meta                      = [{}]
         self.data                      = []
+        self.dirty                     = True
+        self.cache                     = {}     ##< format -> serialized form
         
         self.meta[0]['numUpdates']     = 0
         self.meta[0]['lastUpdated']    = None
@@ -42,17 +60,50 @@ class StateElem(object):
     #======================== public ==========================================
     
     def update(self):
+        self.dirty                     = True
         self.meta[0]['lastUpdated']    = time.time()
         self.meta[0]['numUpdates']    += 1
     
-    def toJson(self):
-        return json.dumps(self._toDict(),sort_keys=True,indent=4)
+    def toDict(self):
+        '''
+        \brief The element as a dictionary of its 'meta' and 'data', for
+               in-process consumers, e.g. a GUI, to skip the JSON round trip.
+        
+        \note The dictionary is cached: it must not be modified.
+        '''
+        return self._cached(self.FORMAT_DICT,self._toDict)
+    
+    def toJson(self,compact=False):
+        '''
+        \param compact If True, the JSON is not indented, for machine
+                       consumers.
+        '''
+        if compact:
+            return self._cached(
+                self.FORMAT_JSON_COMPACT,
+                lambda: json.dumps(self.toDict(),sort_keys=True,separators=(',',':')),
+            )
+        return self._cached(
+            self.FORMAT_JSON,
+            lambda: json.dumps(self.toDict(),sort_keys=True,indent=4),
+        )
     
     def __str__(self):
         return self.toJson()
     
     #======================== private =========================================
     
+    def _cached(self,format,build):
+        if self.dirty:
+            self.dirty                 = False
+            self.cache                 = {}
+        cache                          = self.cache
+        returnVal                      = cache.get(format)
+        if returnVal==None:
+            returnVal                  = build()
+            cache[format]              = returnVal
+        return returnVal
+    
     def _toDict(self):
         returnVal = {}
         returnVal['meta'] = self._elemToDict(self.meta)
@@ -80,10 +131,34 @@ class StateElem(object):
                 assert(len(parsedRow['data'])<2)
                 if len(parsedRow['data'])==1:
                     returnval.append(parsedRow['data'][0])
+            elif isinstance(elem[rowNum],StateRow):
+                parsedRow = elem[rowNum].toDict()
+                if parsedRow!=None:
+                    returnval.append(parsedRow)
             else:
                 raise SystemError("can not parse elem of type {0}".format(type(elem[rowNum])))
         return returnval
 
+class StateRow(object):
+    '''
+    \brief A row of a table state element, e.g. of the schedule, stored
+           compactly.
+    
+    Unlike a StateElem, a row has neither meta nor dictionaries nor
+    openTypes: it holds integers, in __slots__. toDict() builds the
+    dictionary of the row, with its openTypes rendered as strings, only when
+    the state is presented.
+    '''
+    
+    __slots__           = ()
+    
+    #======================== private =========================================
+    
+    def _render(self,typeClass,*fields):
+        value = typeClass()
+        value.update(*fields)
+        return str(value)
+
 class StateOutputBuffer(StateElem):
     
     def update(self,notif):
@@ -117,31 +192,38 @@ class StateMacStats(StateElem):
         self.data[0]['maxCorrection']       = notif.maxCorrection
         self.data[0]['numDeSync']           = notif.numDeSync
 
-class StateScheduleRow(StateElem):
-
+class StateScheduleRow(StateRow):
+    
+    __slots__           = ('notif',)    ##< the ScheduleRow notification, None if never updated
+    
+    def __init__(self):
+        self.notif                          = None
+    
     def update(self,notif):
-        StateElem.update(self)
-        if len(self.data)==0:
-            self.data.append({})
-        self.data[0]['slotOffset']          = notif.slotOffset
-        if 'type' not in self.data[0]:
-            self.data[0]['type']            = typeCellType.typeCellType()
-        self.data[0]['type'].update(notif.type)
-        self.data[0]['shared']              = notif.shared
-        self.data[0]['channelOffset']       = notif.channelOffset
-        if 'neighbor' not in self.data[0]:
-            self.data[0]['neighbor']        = typeAddr.typeAddr()
-        self.data[0]['neighbor'].update(notif.neighbor_type,
-                                        notif.neighbor_bodyH,
-                                        notif.neighbor_bodyL)
-        self.data[0]['numRx']               = notif.numRx
-        self.data[0]['numTx']               = notif.numTx
-        self.data[0]['numTxACK']            = notif.numTxACK
-        if 'lastUsedAsn' not in self.data[0]:
-            self.data[0]['lastUsedAsn']     = typeAsn.typeAsn()
-        self.data[0]['lastUsedAsn'].update(notif.lastUsedAsn_0_1,
+        self.notif                          = notif
+    
+    def toDict(self):
+        notif = self.notif
+        if notif==None:
+            return None
+        return {
+            'slotOffset':     notif.slotOffset,
+            'type':           self._render(typeCellType.typeCellType,
+                                           notif.type),
+            'shared':         notif.shared,
+            'channelOffset':  notif.channelOffset,
+            'neighbor':       self._render(typeAddr.typeAddr,
+                                           notif.neighbor_type,
+                                           notif.neighbor_bodyH,
+                                           notif.neighbor_bodyL),
+            'numRx':          notif.numRx,
+            'numTx':          notif.numTx,
+            'numTxACK':       notif.numTxACK,
+            'lastUsedAsn':    self._render(typeAsn.typeAsn,
+                                           notif.lastUsedAsn_0_1,
                                            notif.lastUsedAsn_2_3,
-                                           notif.lastUsedAsn_4)
+                                           notif.lastUsedAsn_4),
+        }
 
 class StateBackoff(StateElem):
     
@@ -152,19 +234,25 @@ class StateBackoff(StateElem):
         self.data[0]['backoffExponent']     = notif.backoffExponent
         self.data[0]['backoff']             = notif.backoff
 
-class StateQueueRow(StateElem):
+class StateQueueRow(StateRow):
+    
+    __slots__           = ('creator','owner')   ##< component ids, None if never updated
+    
+    def __init__(self):
+        self.creator                        = None
+        self.owner                          = None
     
     def update(self,creator,owner):
-        StateElem.update(self)
-        if len(self.data)==0:
-            self.data.append({})
-        
-        if 'creator' not in self.data[0]:
-            self.data[0]['creator']         = typeComponent.typeComponent()
-        self.data[0]['creator'].update(creator)
-        if 'owner' not in self.data[0]:
-            self.data[0]['owner']           = typeComponent.typeComponent()
-        self.data[0]['owner'].update(owner)
+        self.creator                        = creator
+        self.owner                          = owner
+    
+    def toDict(self):
+        if self.creator==None:
+            return None
+        return {
+            'creator':        self._render(typeComponent.typeComponent,self.creator),
+            'owner':          self._render(typeComponent.typeComponent,self.owner),
+        }
 
 class StateQueue(StateElem):
     
@@ -187,34 +275,41 @@ class StateQueue(StateElem):
         self.data[8].update(notif.creator_8,notif.owner_8)
         self.data[9].update(notif.creator_9,notif.owner_9)
 
-class StateNeighborsRow(StateElem):
+class StateNeighborsRow(StateRow):
+    
+    __slots__           = ('notif',)    ##< the NeighborsRow notification, None if never updated
+    
+    def __init__(self):
+        self.notif                          = None
     
     def update(self,notif):
-        StateElem.update(self)
-        if len(self.data)==0:
-            self.data.append({})
-        self.data[0]['used']                     = notif.used
-        self.data[0]['parentPreference']         = notif.parentPreference
-        self.data[0]['stableNeighbor']           = notif.stableNeighbor
-        self.data[0]['switchStabilityCounter']   = notif.switchStabilityCounter
-        if 'addr' not in self.data[0]:
-            self.data[0]['addr']                 = typeAddr.typeAddr()
-        self.data[0]['addr'].update(notif.addr_type,
-                                    notif.addr_bodyH,
-                                    notif.addr_bodyL)
-        self.data[0]['DAGrank']                  = notif.DAGrank
-        if 'rssi' not in self.data[0]:
-            self.data[0]['rssi']                 = typeRssi.typeRssi()
-        self.data[0]['rssi'].update(notif.rssi)
-        self.data[0]['numRx']                    = notif.numRx
-        self.data[0]['numTx']                    = notif.numTx
-        self.data[0]['numTxACK']                 = notif.numTxACK
-        self.data[0]['numWraps']                 = notif.numWraps
-        if 'asn' not in self.data[0]:
-            self.data[0]['asn']                  = typeAsn.typeAsn()
-        self.data[0]['asn'].update(notif.asn_0_1,
-                                   notif.asn_2_3,
-                                   notif.asn_4)
+        self.notif                          = notif
+    
+    def toDict(self):
+        notif = self.notif
+        if notif==None:
+            return None
+        return {
+            'used':                   notif.used,
+            'parentPreference':       notif.parentPreference,
+            'stableNeighbor':         notif.stableNeighbor,
+            'switchStabilityCounter': notif.switchStabilityCounter,
+            'addr':                   self._render(typeAddr.typeAddr,
+                                                   notif.addr_type,
+                                                   notif.addr_bodyH,
+                                                   notif.addr_bodyL),
+            'DAGrank':                notif.DAGrank,
+            'rssi':                   self._render(typeRssi.typeRssi,
+                                                   notif.rssi),
+            'numRx':                  notif.numRx,
+            'numTx':                  notif.numTx,
+            'numTxACK':               notif.numTxACK,
+            'numWraps':               notif.numWraps,
+            'asn':                    self._render(typeAsn.typeAsn,
+                                                   notif.asn_0_1,
+                                                   notif.asn_2_3,
+                                                   notif.asn_4),
+        }
 
 class StateIsSync(StateElem):
     
@@ -231,7 +326,7 @@ class StateIdManager(StateElem):
         self.moteConnector = moteConnector
     
     def update(self,notif):
-    
+        
         # update state
         StateElem.update(self)
         if len(self.data)==0:
@@ -261,7 +356,7 @@ class StateIdManager(StateElem):
         
         # announce information about the DAG root to the eventBus
         if self.data[0]['isDAGroot']==1:
-        
+            
             # dispatch
             dispatcher.send(
                 signal        = 'infoDagRoot',
@@ -282,14 +377,14 @@ class StateMyDagRank(StateElem):
         self.data[0]['myDAGrank']           = notif.myDAGrank
 
 class StateTable(StateElem):
-
+    
     def __init__(self,rowClass,columnOrder=None):
         StateElem.__init__(self)
         self.meta[0]['rowClass']            = rowClass
         if columnOrder:
             self.meta[0]['columnOrder']     = columnOrder
         self.data                           = []
-
+    
     def update(self,notif):
         StateElem.update(self)
         while len(self.data)<notif.row+1:
@@ -322,13 +417,52 @@ class moteState(MoteConnectorConsumer.MoteConnectorConsumer):
                            ST_IDMANAGER, 
                            ST_MYDAGRANK]
     
-    def __init__(self,moteConnector):
+    DELTA_URI           = 'moteState.delta'  ##< EventBus URI of the deltas, see publishDeltas
+    
+    HISTORY_FIELDS      = {                 ##< state element -> fields kept in history, see history
+        ST_MACSTATS:      ['numSyncPkt','numSyncAck','minCorrection','maxCorrection','numDeSync'],
+        ST_NEIGHBORS:     ['numRx','numTx','numTxACK','rssi'],
+        ST_SCHEDULE:      ['numRx','numTx','numTxACK'],
+    }
+    HISTORY_COUNTERS    = {                 ##< counter -> modulus, the counters being bytes
+        'numSyncPkt':     0x100,
+        'numSyncAck':     0x100,
+        'numDeSync':      0x100,
+        'numRx':          0x100,
+        'numTx':          0x100,
+        'numTxACK':       0x100,
+    }
+    
+    def __init__(self,moteConnector,
+            queueSize=MoteConnectorConsumer.MoteConnectorConsumer.QUEUESIZE,
+            queuePolicy=MoteConnectorConsumer.MoteConnectorConsumer.DFLT_POLICY,
+            batchSize=None,
+            publishDeltas=False,
+            history=False):
+        '''
+        \param queueSize   The size of the queue of status notifications.
+        \param queuePolicy What to do when it is full, one of
+                           MoteConnectorConsumer.POLICY_ALL. With
+                           POLICY_COALESCE, a notification replaces the
+                           queued one of the same state element (and row).
+        \param batchSize   If set, apply up to batchSize queued
+                           notifications at once.
+        \param publishDeltas If True, also publish each delta (see
+                           getDeltas()) on the EventBus, on DELTA_URI, with
+                           the name of the moteConnector and the delta as
+                           arguments. A delta is a copy of the state, but
+                           the same one is passed to all subscribers.
+        \param history     If True, keep the history of the fields of
+                           HISTORY_FIELDS, for getHistory().
+        '''
         
         # log
         log.debug("create instance")
         
         # store params
         self.moteConnector                  = moteConnector
+        self.publishDeltas                  = publishDeltas
+        self.history                        = history
         
         # initialize parent class
         MoteConnectorConsumer.MoteConnectorConsumer.__init__(
@@ -339,12 +473,22 @@ class moteState(MoteConnectorConsumer.MoteConnectorConsumer):
                                 self.moteConnector.moteProbeTcpPort,
                             ),
             notifCallback = self._receivedData_notif,
+            direct        = self.moteConnector.direct,
+            queueSize     = queueSize,
+            policy        = queuePolicy,
+            coalesceKey   = self._coalesceKey,
+            batchSize     = batchSize,
         )
         
         # local variables
         self.parserStatus                   = ParserStatus.ParserStatus()
         self.stateLock                      = threading.Lock()
         self.state                          = {}
+        self.version                        = 0     ##< incremented with each change of the state
+        self.changes                        = {}    ##< (elemName,row) -> version of its last change
+        self.lastNotifs                     = {}    ##< (statusElem,row) -> last notification applied
+        self.deltasToPublish                = []
+        self.histories                      = {}    ##< (elemName,row) -> History
         
         self.state[self.ST_OUPUTBUFFER]     = StateOutputBuffer()
         self.state[self.ST_ASN]             = StateAsn()
@@ -389,27 +533,28 @@ class moteState(MoteConnectorConsumer.MoteConnectorConsumer):
         self.state[self.ST_IDMANAGER]       = StateIdManager(self.moteConnector)
         self.state[self.ST_MYDAGRANK]       = StateMyDagRank()
         
+        # statusElem -> name of the state element
         self.notifHandlers = {
-            self.parserStatus.named_tuple[self.ST_OUPUTBUFFER]:
-                self.state[self.ST_OUPUTBUFFER].update,
-            self.parserStatus.named_tuple[self.ST_ASN]:
-                self.state[self.ST_ASN].update,
-            self.parserStatus.named_tuple[self.ST_MACSTATS]:
-                self.state[self.ST_MACSTATS].update,
-            self.parserStatus.named_tuple[self.ST_SCHEDULEROW]:
-                self.state[self.ST_SCHEDULE].update,
-            self.parserStatus.named_tuple[self.ST_BACKOFF]:
-                self.state[self.ST_BACKOFF].update,
-            self.parserStatus.named_tuple[self.ST_QUEUEROW]:
-                self.state[self.ST_QUEUE].update,
-            self.parserStatus.named_tuple[self.ST_NEIGHBORSROW]:
-                self.state[self.ST_NEIGHBORS].update,
-            self.parserStatus.named_tuple[self.ST_ISSYNC]:
-                self.state[self.ST_ISSYNC].update,
-            self.parserStatus.named_tuple[self.ST_IDMANAGER]:
-                self.state[self.ST_IDMANAGER].update,
-            self.parserStatus.named_tuple[self.ST_MYDAGRANK]:
-                self.state[self.ST_MYDAGRANK].update,
+            self.parserStatus.named_tuple[self.ST_OUPUTBUFFER]._statusElem:
+                self.ST_OUPUTBUFFER,
+            self.parserStatus.named_tuple[self.ST_ASN]._statusElem:
+                self.ST_ASN,
+            self.parserStatus.named_tuple[self.ST_MACSTATS]._statusElem:
+                self.ST_MACSTATS,
+            self.parserStatus.named_tuple[self.ST_SCHEDULEROW]._statusElem:
+                self.ST_SCHEDULE,
+            self.parserStatus.named_tuple[self.ST_BACKOFF]._statusElem:
+                self.ST_BACKOFF,
+            self.parserStatus.named_tuple[self.ST_QUEUEROW]._statusElem:
+                self.ST_QUEUE,
+            self.parserStatus.named_tuple[self.ST_NEIGHBORSROW]._statusElem:
+                self.ST_NEIGHBORS,
+            self.parserStatus.named_tuple[self.ST_ISSYNC]._statusElem:
+                self.ST_ISSYNC,
+            self.parserStatus.named_tuple[self.ST_IDMANAGER]._statusElem:
+                self.ST_IDMANAGER,
+            self.parserStatus.named_tuple[self.ST_MYDAGRANK]._statusElem:
+                self.ST_MYDAGRANK,
         }
     
     #======================== public ==========================================
@@ -433,29 +578,160 @@ class moteState(MoteConnectorConsumer.MoteConnectorConsumer):
         
         return returnVal
     
+    def getDeltas(self,sinceVersion=0):
+        '''
+        \brief The changes of the state since a version, for consumers to
+               fetch only what changed.
+        
+        Each change of the state, i.e. each notification which changes a
+        state element (or a row of a table), increments the version of the
+        moteState. Only the last change of each element or row is kept, and
+        it is returned with its current content: applying the deltas, in
+        order, to the state as of sinceVersion gives the current state.
+        
+        \param sinceVersion The version returned by the previous call, 0 to
+                            get the whole state.
+        
+        \returns A (version,deltas) tuple: the current version, and the list
+                 of the deltas, ordered by version (see _delta()).
+        '''
+        with self.stateLock:
+            deltas = [
+                self._delta(elemName,row,version)
+                for ((elemName,row),version) in self.changes.items()
+                if version>sinceVersion
+            ]
+            deltas.sort(key=lambda delta: delta['version'])
+            return (self.version,deltas)
+    
+    def getHistory(self,elemName,field,window,row=None):
+        '''
+        \brief Statistics of a field of a state element, or of a row of a
+               table, over the last window s, e.g. the rate of numTx of a
+               neighbor.
+        
+        \param elemName The name of the state element, one of
+                        HISTORY_FIELDS.
+        \param field    The name of the field, one of HISTORY_FIELDS.
+        \param window   The duration of the window, in s.
+        \param row      The row of a table, None for other elements.
+        
+        \returns The dictionary of History.getStats(), None if there is no
+                 sample, or if the history is not kept.
+        '''
+        if elemName not in self.HISTORY_FIELDS:
+            raise ValueError('No history of {0}'.format(elemName))
+        if field not in self.HISTORY_FIELDS[elemName]:
+            raise ValueError('No history of {0} in {1}'.format(field,elemName))
+        
+        with self.stateLock:
+            history = self.histories.get((elemName,row))
+            if history==None:
+                return None
+            return history.getStats(field,window)
+    
     #======================== private =========================================
     
     def _receivedData_notif(self,notif):
+        '''
+        \brief Apply a status notification, or a list of them, to the state.
+        
+        A list, as dispatched by a moteConnector in batch mode, or drained
+        from the queue in batch mode (possibly a list of such lists), is
+        applied under a single acquisition of the state lock.
+        '''
         
         # log
         log.debug("received {0}".format(notif))
         
+        if isinstance(notif,list):
+            notifs = []
+            for n in notif:
+                if isinstance(n,list):
+                    notifs += n
+                else:
+                    notifs += [n]
+        else:
+            notifs = [notif]
+        
         # lock the state data
         self.stateLock.acquire()
         
-        # call handler
-        found = False
-        for k,v in self.notifHandlers.items():
-            if self._isnamedtupleinstance(notif,k):
-                found = True
-                v(notif)
-                break
+        # call handlers
+        notFound = [n for n in notifs if not self._handleNotif(n)]
         
         # unlock the state data
+        deltasToPublish      = self.deltasToPublish
+        self.deltasToPublish = []
         self.stateLock.release()
         
-        if found==False:
-            raise SystemError("No handler for notif {0}".format(notif))
+        # publish the deltas, outside of the lock
+        for delta in deltasToPublish:
+            EventBus.EventBus().publish(self.DELTA_URI,self.moteConnector.name,delta)
+        
+        if notFound:
+            raise SystemError("No handler for notif {0}".format(notFound[0]))
+    
+    def _coalesceKey(self,notif):
+        if isinstance(notif,list):
+            return None
+        return (getattr(notif,'_statusElem',None),getattr(notif,'row',None))
     
-    def _isnamedtupleinstance(self,var,tupleInstance):
-        return var._fields==tupleInstance._fields
\ No newline at end of file
+    def _handleNotif(self,notif):
+        '''
+        \brief Apply a notification to the state element of its statusElem,
+               as tagged by ParserStatus.
+        
+        \returns False if there is no state element for it.
+        '''
+        elemName  = self.notifHandlers.get(getattr(notif,'_statusElem',None))
+        if elemName==None:
+            return False
+        stateElem = self.state[elemName]
+        stateElem.update(notif)
+        
+        # drop what was serialized while it was being updated
+        stateElem.dirty = True
+        
+        # record the history, and the change, if any
+        row       = getattr(notif,'row',None)
+        if self.history and elemName in self.HISTORY_FIELDS:
+            self._recordHistory(elemName,row,notif,stateElem.meta[0]['lastUpdated'])
+        key       = (notif._statusElem,row)
+        if self.lastNotifs.get(key)!=notif:
+            self.lastNotifs[key]             = notif
+            self.version                    += 1
+            self.changes[(elemName,row)]     = self.version
+            if self.publishDeltas:
+                self.deltasToPublish.append(self._delta(elemName,row,self.version))
+        
+        return True
+    
+    def _recordHistory(self,elemName,row,notif,timestamp):
+        fields  = self.HISTORY_FIELDS[elemName]
+        history = self.histories.get((elemName,row))
+        if history==None:
+            history = History.History(fields,counters=self.HISTORY_COUNTERS)
+            self.histories[(elemName,row)] = history
+        history.update([getattr(notif,field) for field in fields],timestamp)
+    
+    def _delta(self,elemName,row,version):
+        '''
+        \returns A dictionary with the 'version' of the change, the name of
+                 the state element ('elem'), the index of the 'row' changed
+                 in a table, None for the other elements, and the current
+                 'data' of that row, or of the element (a list of rows).
+                 The data is a copy, consumers may modify it.
+        '''
+        stateElem = self.state[elemName]
+        if row==None:
+            # the dictionary of the element is cached, do not hand it out
+            data  = copy.deepcopy(stateElem.toDict()['data'])
+        else:
+            data  = stateElem.data[row].toDict()
+        return {
+            'version':  version,
+            'elem':     elemName,
+            'row':      row,
+            'data':     data,
+        }
\ No newline at end of file
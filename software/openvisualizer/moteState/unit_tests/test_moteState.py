@@ -0,0 +1,452 @@
+import os
+import sys
+cur_path = sys.path[0]
+sys.path.insert(0, os.path.join(cur_path, '..', '..'))                     # openvisualizer/
+sys.path.insert(0, os.path.join(cur_path, '..'))                           # moteState/
+sys.path.insert(0, os.path.join(cur_path, '..', '..','PyDispatcher-2.0.3'))# PyDispatcher-2.0.3/
+
+import gc
+import json
+import struct
+import time
+
+import pytest
+
+import moteState
+import History
+from moteConnector import moteConnector
+from moteConnector import ParserStatus
+from moteProbe     import moteProbeCapture
+from EventBus      import EventBus
+
+import logging
+import logging.handlers
+
+#============================ logging =========================================
+
+LOGFILE_NAME = 'test_moteState.log'
+
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+log = logging.getLogger('test_moteState')
+log.setLevel(logging.ERROR)
+log.addHandler(NullHandler())
+
+logHandler = logging.handlers.RotatingFileHandler(LOGFILE_NAME,
+                                                  maxBytes=2*1024*1024,
+                                                  backupCount=5,
+                                                  mode='w')
+logHandler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for loggerName in   [
+                        'test_moteState',
+                        'moteState',
+                    ]:
+    temp = logging.getLogger(loggerName)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(logHandler)
+
+#============================ defines =========================================
+
+LOCAL_ADDRESS = '127.0.0.1'
+TIMEOUT       = 10.0
+TCPPORT_START = 9900
+NUM_MOTES     = 20
+NUM_ROWS      = 8       ##< rows of the schedule and neighbor tables
+NUM_ROUNDS    = 10      ##< times each mote reports its whole status
+
+#============================ helpers =========================================
+
+def _statusFrames(moteId,asn):
+    '''
+    \brief The status frames a mote sends in a round: one per state element,
+           one per row for the tables.
+    '''
+    returnVal = []
+    for key in ParserStatus.ParserStatus().fieldsParsingKeys:
+        fields = dict([(name,0) for name in key.fields])
+        if 'asn_0_1' in fields:
+            fields['asn_0_1'] = asn
+        for row in (range(NUM_ROWS) if 'row' in fields else [None]):
+            if row!=None:
+                fields['row'] = row
+            payload = key.struct.pack(*[fields[name] for name in key.fields])
+            returnVal.append('S'+struct.pack('<HB',moteId,key.val)+payload)
+    return returnVal
+
+def _capture(filename):
+    '''
+    \brief Write a status-heavy capture: NUM_MOTES motes, each reporting its
+           whole status NUM_ROUNDS times.
+    '''
+    writer = moteProbeCapture.moteProbeCaptureWriter(filename)
+    for asn in range(NUM_ROUNDS):
+        for moteId in range(NUM_MOTES):
+            for frame in _statusFrames(moteId,asn):
+                writer.write('/dev/ttyUSB{0}'.format(moteId),frame)
+    writer.close()
+
+def _moteStates():
+    '''
+    \returns A dictionary serialportName -> moteState, none of them started.
+    '''
+    returnVal = {}
+    for moteId in range(NUM_MOTES):
+        connector = moteConnector.moteConnector(LOCAL_ADDRESS,TCPPORT_START+moteId)
+        ms        = moteState.moteState(connector)
+        ms.daemon = True
+        returnVal['/dev/ttyUSB{0}'.format(moteId)] = ms
+    return returnVal
+
+def _replay(filename,moteStates):
+    '''
+    \returns A list of (moteState,notif) tuples, parsed from the capture.
+    '''
+    reader    = moteProbeCapture.moteProbeCaptureReader(filename)
+    returnVal = []
+    for (_,serialportName,frame) in reader:
+        ms                   = moteStates[serialportName]
+        (eventSubType,notif) = ms.moteConnector.parser.parseInput(frame)
+        assert eventSubType=='status'
+        returnVal.append((ms,notif))
+    reader.close()
+    return returnVal
+
+def _waitFor(condition):
+    start = time.time()
+    while not condition():
+        assert time.time()-start<TIMEOUT
+        time.sleep(0.01)
+
+def _rss():
+    '''
+    \returns The peak resident set size of the process, in kB.
+    '''
+    resource = pytest.importorskip('resource')
+    returnVal = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform=='darwin':
+        returnVal /= 1024
+    return returnVal
+
+def _legacyHandleNotif(ms,notif):
+    '''
+    \brief Reference routing, as done before notifications were tagged: a
+           scan of the handlers, comparing the fields of each.
+    '''
+    for (name,tupleClass) in ms.parserStatus.named_tuple.items():
+        if notif._fields==tupleClass._fields:
+            ms.state[ms.notifHandlers[tupleClass._statusElem]].update(notif)
+            return True
+    return False
+
+#============================ tests ===========================================
+
+def test_routing(tmpdir):
+    '''
+    \brief Each status notification updates its state element, in the
+           moteState of its mote.
+    '''
+
+    log.debug("\n---------- test_routing")
+
+    filename   = str(tmpdir.join('routing.ovcap'))
+    _capture(filename)
+    moteStates = _moteStates()
+
+    for (ms,notif) in _replay(filename,moteStates):
+        ms._receivedData_notif(notif)
+
+    for ms in moteStates.values():
+        asn = ms.getStateElem(ms.ST_ASN).data[0]['asn'].asn
+        assert asn[-1]==NUM_ROUNDS-1
+        assert len(ms.getStateElem(ms.ST_SCHEDULE).data)==NUM_ROWS
+        assert len(ms.getStateElem(ms.ST_NEIGHBORS).data)==NUM_ROWS
+        for elemName in ms.getStateElemNames():
+            assert ms.getStateElem(elemName).meta[0]['numUpdates']>0
+
+        # the rows are rendered with their openTypes as strings
+        rows = json.loads(ms.getStateElem(ms.ST_NEIGHBORS).toJson())['data']
+        assert len(rows)==NUM_ROWS
+        assert (rows[0]['addr'],rows[0]['rssi'],rows[0]['asn'])==(' (None)','0dBm','0x0000000009')
+
+    # a notification no handler is registered for
+    with pytest.raises(SystemError):
+        ms._receivedData_notif(('not','a','status'))
+
+def test_deltas(tmpdir):
+    '''
+    \brief The deltas since a version are the rows, or elements, changed
+           since.
+    '''
+
+    log.debug("\n---------- test_deltas")
+
+    filename   = str(tmpdir.join('deltas.ovcap'))
+    _capture(filename)
+    moteStates = _moteStates()
+    ms         = moteStates['/dev/ttyUSB0']
+    ms.publishDeltas = True
+    published  = []
+    subsId     = EventBus.EventBus().subscribe(
+        lambda sender,delta: published.append((sender,delta)),
+        ms.DELTA_URI,
+    )
+    notifs     = [notif for (m,notif) in _replay(filename,moteStates) if m is ms]
+    perRound   = len(notifs)/NUM_ROUNDS
+
+    # first round: the whole state
+    ms._receivedData_notif(notifs[:perRound])
+    (version,deltas) = ms.getDeltas()
+    assert version==perRound
+    assert [d['version'] for d in deltas]==range(1,perRound+1)
+    assert set([d['elem'] for d in deltas])==set(ms.getStateElemNames())
+    neighbors  = [d for d in deltas if d['elem']==ms.ST_NEIGHBORS]
+    assert [d['row'] for d in neighbors]==range(NUM_ROWS)
+    assert neighbors[0]['data']==ms.getStateElem(ms.ST_NEIGHBORS).toDict()['data'][0]
+
+    # second round: only the ASN, also in the neighbors rows, changes
+    ms._receivedData_notif(notifs[perRound:2*perRound])
+    (newVersion,deltas) = ms.getDeltas(version)
+    assert newVersion==version+1+NUM_ROWS
+    assert [(d['elem'],d['row']) for d in deltas]==[(ms.ST_ASN,None)]+[(ms.ST_NEIGHBORS,row) for row in range(NUM_ROWS)]
+    assert deltas[0]['data']==[{'asn':'0x0000000001'}]
+    assert ms.getDeltas(newVersion)==(newVersion,[])
+
+    # the same deltas were published
+    _waitFor(lambda: len(published)==newVersion)
+    EventBus.EventBus().unsubscribe(subsId)
+    assert set([sender for (sender,delta) in published])==set([ms.moteConnector.name])
+    assert [delta['version'] for (sender,delta) in published]==range(1,newVersion+1)
+    assert [delta for (sender,delta) in published[version:]]==deltas
+
+    # the deltas are copies, the cached state is not modified through them
+    deltas[0]['data'][0]['asn'] = None
+    assert ms.getStateElem(ms.ST_ASN).toDict()['data']==[{'asn':'0x0000000001'}]
+
+def test_history():
+    '''
+    \brief Statistics over a window come from the finest tier holding it.
+    '''
+
+    log.debug("\n---------- test_history")
+
+    history = History.History(
+        ['numRx','rssi'],
+        counters = {'numRx':0x100},
+        rawSize  = 4,
+        tiers    = [(10,3)],
+    )
+    def _size():
+        return sum([
+            len(a)
+            for tier in history.tiers
+            for a in [tier.start,tier.count]+tier.sum+tier.min+tier.max+tier.increments
+        ])
+    size    = _size()
+
+    # a sample per s, numRx wrapping around
+    for t in range(50):
+        history.update([(t*10)%0x100,-t],timestamp=t)
+
+    # raw samples
+    stats   = history.getStats('rssi',3,now=49)
+    assert (stats['count'],stats['min'],stats['max'],stats['avg'])==(3,-49,-47,-48)
+    assert stats['rate']==None
+    assert history.getStats('numRx',3,now=49)['rate']==10
+
+    # buckets of 10 s, from 20 s to 50 s, the one from 20 s partly before
+    # the window: the rate is over the time they cover
+    stats   = history.getStats('numRx',20,now=49)
+    assert stats['count']==30
+    assert stats['rate']==10
+    stats   = history.getStats('numRx',15,now=49)
+    assert stats['count']==20
+    assert stats['rate']==10
+    stats   = history.getStats('rssi',20,now=49)
+    assert (stats['min'],stats['max'])==(-49,-20)
+
+    # longer than the history: the rate over what the coarsest tier holds
+    assert history.getStats('numRx',100,now=49)['rate']==10
+
+    assert history.getStats('numRx',10,now=100)==None
+    with pytest.raises(ValueError):
+        history.getStats('numTx',10)
+
+    # a counter increasing by 1 per s for 2 h, sampled every 7 s, with
+    # the default tiers
+    steady  = History.History(['numTx'],counters={'numTx':0x10000})
+    for t in range(0,7200,7):
+        steady.update([t%0x10000],timestamp=t)
+    for window in [10,60,600,3600,7200]:
+        assert abs(steady.getStats('numTx',window,now=7196)['rate']-1)<0.01
+
+    # the memory is allocated once
+    for t in range(50,1000):
+        history.update([(t*10)%0x100,-t],timestamp=t)
+    assert _size()==size
+
+def test_moteStateHistory(tmpdir):
+    '''
+    \brief A moteState keeps the history of its counters.
+    '''
+
+    log.debug("\n---------- test_moteStateHistory")
+
+    filename   = str(tmpdir.join('moteStateHistory.ovcap'))
+    _capture(filename)
+    moteStates = _moteStates()
+    ms         = moteStates['/dev/ttyUSB0']
+    ms.history = True
+    for (m,notif) in _replay(filename,moteStates):
+        if m is ms:
+            ms._receivedData_notif(notif)
+
+    stats      = ms.getHistory(ms.ST_NEIGHBORS,'rssi',60,row=0)
+    assert (stats['count'],stats['min'],stats['max'])==(NUM_ROUNDS,0,0)
+    assert ms.getHistory(ms.ST_NEIGHBORS,'numTx',60,row=0)['rate']==0
+    assert ms.getHistory(ms.ST_MACSTATS,'numDeSync',60)['count']==NUM_ROUNDS
+    assert ms.getHistory(ms.ST_NEIGHBORS,'rssi',60,row=NUM_ROWS)==None
+    assert moteStates['/dev/ttyUSB1'].getHistory(ms.ST_MACSTATS,'numDeSync',60)==None
+    with pytest.raises(ValueError):
+        ms.getHistory(ms.ST_ASN,'asn_0_1',60)
+    with pytest.raises(ValueError):
+        ms.getHistory(ms.ST_NEIGHBORS,'DAGrank',60)
+
+def test_serialization(tmpdir):
+    '''
+    \brief The serialized forms of a state element are cached until it is
+           updated.
+    '''
+
+    log.debug("\n---------- test_serialization")
+
+    filename   = str(tmpdir.join('serialization.ovcap'))
+    _capture(filename)
+    moteStates = _moteStates()
+    notifs     = _replay(filename,moteStates)
+    ms         = moteStates['/dev/ttyUSB0']
+    notifs     = [notif for (m,notif) in notifs if m is ms]
+    for notif in notifs[:-1]:
+        ms._receivedData_notif(notif)
+    neighbors  = ms.getStateElem(ms.ST_NEIGHBORS)
+
+    # the same forms are returned, until an update
+    pretty     = neighbors.toJson()
+    compact    = neighbors.toJson(compact=True)
+    asDict     = neighbors.toDict()
+    assert neighbors.toJson() is pretty
+    assert neighbors.toJson(compact=True) is compact
+    assert neighbors.toDict() is asDict
+    assert json.loads(pretty)==json.loads(compact)==asDict
+    assert len(compact)<len(pretty) and '\n' not in compact
+    assert json.loads(json.dumps(neighbors,cls=moteState.OpenEncoder))=={'StateTable':asDict}
+
+    # the last notification is a row of the neighbors table
+    assert notifs[-1]._statusElem==ms.parserStatus.named_tuple[ms.ST_NEIGHBORSROW]._statusElem
+    ms._receivedData_notif(notifs[-1])
+    assert neighbors.toJson() is not pretty
+    assert neighbors.toDict()['meta'][0]['numUpdates']==asDict['meta'][0]['numUpdates']+1
+
+    # serializing an unchanged element is a lookup
+    start      = time.time()
+    for _ in range(100):
+        neighbors.dirty = True
+        neighbors.toJson()
+    rebuilt    = time.time()-start
+    start      = time.time()
+    for _ in range(100):
+        neighbors.toJson()
+    cached     = time.time()-start
+    output     = 'toJson of {0} neighbors: {1:.0f} us rebuilt, {2:.1f} us cached'.format(
+        NUM_ROWS,
+        rebuilt*10000,
+        cached*10000,
+    )
+    log.info(output)
+
+def test_benchmark(tmpdir):
+    '''
+    \brief Route a status-heavy capture through many moteState instances, by
+           statusElem and by scanning the handlers.
+    '''
+
+    log.debug("\n---------- test_benchmark")
+
+    filename   = str(tmpdir.join('benchmark.ovcap'))
+    _capture(filename)
+    moteStates = _moteStates()
+    notifs     = _replay(filename,moteStates)
+
+    durations  = {}
+    for (name,handleNotif) in [
+            ('scan',    _legacyHandleNotif),
+            ('routed',  lambda ms,notif: ms._handleNotif(notif)),
+        ]:
+        start = time.time()
+        for (ms,notif) in notifs:
+            assert handleNotif(ms,notif)
+        durations[name] = time.time()-start
+
+    output  = []
+    output += ['{0} status notifications, {1} motes:'.format(len(notifs),NUM_MOTES)]
+    for name in ['scan','routed']:
+        output += ['- {0:<6} {1:.0f} notifs/s'.format(name,len(notifs)/durations[name])]
+    output  = '\n'.join(output)
+    log.info(output)
+
+    assert durations['routed']<durations['scan']
+
+def test_memory(tmpdir):
+    '''
+    \brief Measure the memory the state of a mote takes, its tables full.
+    '''
+
+    log.debug("\n---------- test_memory")
+
+    NUM_MOTES_MEMORY = 200
+
+    filename   = str(tmpdir.join('memory.ovcap'))
+    writer     = moteProbeCapture.moteProbeCaptureWriter(filename)
+    for moteId in range(NUM_MOTES_MEMORY):
+        for frame in _statusFrames(moteId,0):
+            writer.write('/dev/ttyUSB{0}'.format(moteId),frame)
+    writer.close()
+
+    # parse first, so only the state is measured
+    parser     = moteConnector.moteConnector(LOCAL_ADDRESS,TCPPORT_START).parser
+    reader     = moteProbeCapture.moteProbeCaptureReader(filename)
+    notifs     = {}
+    for (_,serialportName,frame) in reader:
+        notifs.setdefault(serialportName,[]).append(parser.parseInput(frame)[1])
+    reader.close()
+
+    gc.collect()
+    rssStart   = _rss()
+    moteStates = []
+    for moteId in range(NUM_MOTES_MEMORY):
+        connector = moteConnector.moteConnector(LOCAL_ADDRESS,TCPPORT_START+moteId)
+        ms        = moteState.moteState(connector)
+        for notif in notifs['/dev/ttyUSB{0}'.format(moteId)]:
+            ms._receivedData_notif(notif)
+        moteStates.append(ms)
+        del notifs['/dev/ttyUSB{0}'.format(moteId)]
+    gc.collect()
+    rssEnd     = _rss()
+
+    output  = '{0} motes, {1} rows per table: {2:.1f} kB RSS per mote'.format(
+        NUM_MOTES_MEMORY,
+        NUM_ROWS,
+        float(rssEnd-rssStart)/NUM_MOTES_MEMORY,
+    )
+    log.info(output)
+
+    assert len(moteStates[-1].getStateElem(moteState.moteState.ST_NEIGHBORS).data)==NUM_ROWS
+
+#----- teardown
+
+def test_teardown():
+
+    log.debug("\n---------- test_teardown")
+
+    EventBus.EventBus().close()
@@ -66,7 +66,20 @@ class networkState(MoteConnectorConsumer.MoteConnectorConsumer):
     PRF_DIO_B                = 1<<1
     PRF_DIO_C                = 1<<0
     
-    def __init__(self):
+    def __init__(self,direct=False,
+            queueSize=MoteConnectorConsumer.MoteConnectorConsumer.QUEUESIZE,
+            queuePolicy=MoteConnectorConsumer.MoteConnectorConsumer.DFLT_POLICY,
+            batchSize=None):
+        '''
+        \param direct      If True, receive the data from the moteConnectors
+                           created with direct=True, see
+                           MoteConnectorConsumer.
+        \param queueSize   The size of the queue of data received.
+        \param queuePolicy What to do when it is full, one of
+                           MoteConnectorConsumer.POLICY_ALL.
+        \param batchSize   If set, handle up to batchSize queued packets at
+                           once.
+        '''
         
         # log
         log.debug("create instance")
@@ -78,7 +91,11 @@ class networkState(MoteConnectorConsumer.MoteConnectorConsumer):
             self,
             signal           = 'inputFromMoteProbe.data.local',
             sender           = dispatcher.Any,
-            notifCallback    = self._receivedMoteDataLocal_notif
+            notifCallback    = self._receivedMoteDataLocal_batch if batchSize else self._receivedMoteDataLocal_notif,
+            direct           = direct,
+            queueSize        = queueSize,
+            policy           = queuePolicy,
+            batchSize        = batchSize,
         )
         
         # local variables
@@ -237,6 +254,10 @@ class networkState(MoteConnectorConsumer.MoteConnectorConsumer):
         # indicate data to RPL
         self.rpl.indicateDAO(notif)
     
+    def _receivedMoteDataLocal_batch(self,notifs):
+        for notif in notifs:
+            self._receivedMoteDataLocal_notif(notif)
+    
     #===== received dataFromInternet
     
     def _receivedInternetData_notif(self,data):
@@ -560,4 +581,3 @@ class networkState(MoteConnectorConsumer.MoteConnectorConsumer):
             returnVal.append(int(s[realIdx:realIdx+2],16))
         
         return returnVal
-        
\ No newline at end of file